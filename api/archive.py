@@ -0,0 +1,253 @@
+from django.db import connection, transaction
+import datetime, itertools, multiprocessing, pickle, re, time
+
+from api.indexing import DeferredIndexer
+from api.ingest import SectionIngest
+from api.recording import read_recording
+from courses.models import Course
+
+##
+# Backfill of archived listings through the batched ingest path.
+#
+# Two formats are understood: the JSONL recordings written by Scraper(record=...)
+# (optionally gzipped), and the old NYU pickle dumps read by courses.helpers and
+# scrapers.loader, a dict of {section id: record}. Files are spread across a process
+# pool; each one is written in its own transaction and reports its own throughput
+# and errors.
+
+##
+# The file's section_data, one at a time; a pickle is loaded whole, but its records
+# are converted as they are consumed.
+def read_archive(path):
+  if '.jsonl' in path:
+    return read_recording(path)
+  data = _load_pickle(path)
+  return (legacy_section(id, data[id]) for id in sorted(data.keys()))
+
+def _load_pickle(path):
+  f = open(path, 'rb')
+  try:
+    return pickle.load(f)
+  finally:
+    f.close()
+
+##
+# What import_archives needs of a file before any worker imports it: a payload for
+# each distinct classification / college / level in it, to create those from, and
+# the keys of its courses. Only those payloads are kept; a pickle's records are
+# converted only when they bring a new combination.
+def archive_outline(path, network, institution, session_id):
+  dimensions, courses = {}, set()
+  if '.jsonl' in path:
+    for data in read_recording(path):
+      dimensions.setdefault(_dimension_key(data), data)
+      courses.add((data.get('classification'), data.get('number')))
+  else:
+    records = _load_pickle(path)
+    for id in sorted(records.keys()):
+      course = legacy_course(records[id])
+      key = _dimension_key(course)
+      if key not in dimensions:
+        dimensions[key] = legacy_section(id, records[id])
+      courses.add((course['classification'], course['number']))
+  return list(_targeted(dimensions.values(), network, institution, session_id)), courses
+
+def _dimension_key(data):
+  return tuple(data.get(k) for k in ('classification', 'classification_name', 'college', 'level'))
+
+def _legacy_time(value):
+  if isinstance(value, datetime.time):
+    return value.strftime('%H:%M')
+  match = value and re.match('(\d{1,2})\.(\d{2}) (AM|PM)', value)
+  if not match:
+    return None
+  hour, minute, half = int(match.group(1)), match.group(2), match.group(3)
+  if half == 'PM' and hour != 12:
+    hour += 12
+  return '%02d:%s' % (hour, minute)
+
+##
+# One record of an old pickle listing as section_data. Records come in two shapes:
+# a free-text meet_data ("Mon,Wed 9.30 AM - 10.45 AM at SILV 206 with Prof"), or days plus
+# start_time / end_time.
+def legacy_section(id, c):
+  meet = (c.get('meet_data') or '').replace('09/06/2011 - 12/23/2011 ', '')
+  if 'days' in c:
+    days, start, end = c['days'] or [], _legacy_time(c.get('start_time')), _legacy_time(c.get('end_time'))
+  else:
+    try:
+      days = re.search('(([A-Z][a-z][a-z],?){1,3})', meet).groups()[0].split(',')
+    except AttributeError:
+      days = []
+    times = re.search('(\d{1,2}\.\d{2} \w{2})[^\d]*(\d{1,2}\.\d{2} \w{2})', meet)
+    start, end = times and _legacy_time(times.group(1)), times and _legacy_time(times.group(2))
+  found = re.search(' at (.+?)(?: with |$)', meet)
+  location = found.groups()[0] if found else c.get('location') or ''
+  prof = c.get('prof')
+  if not prof:
+    found = re.search('with (.*)', meet)
+    prof = found.groups()[0] if found else ''
+
+  is_open = c.get('is_open')
+  if isinstance(is_open, basestring):
+    status = is_open.strip() or 'Closed'
+  else:
+    status = 'Open' if is_open else 'Closed'
+
+  return dict(legacy_course(c), **{
+    'reference_code': '%s' % id,
+    'section': '%s' % c.get('section', ''),
+    'section_name': c.get('class_name') or '',
+    'course_name': c.get('course_name') or '',
+    'description': c.get('description') or '',
+    'grading': c.get('grading') or '',
+    'component': c.get('component') or '',
+    'units': (c.get('units') or '').replace('units', '').strip(),
+    'notes': c.get('notes') or '',
+    'prof': prof,
+    'status': status,
+    'meetings': [{'day': day, 'start': start, 'end': end, 'location': location, 'room': c.get('room') or ''}
+        for day in days if day],
+  })
+
+##
+# The fields of an old pickle record that place it in a course.
+def legacy_course(c):
+  return {
+    'classification': c['classification'],
+    'classification_name': c.get('classification_name') or c['classification'],
+    'college': c.get('college') or '',
+    'level': c.get('level') or '',
+    'number': '%s' % c['number'],
+  }
+
+def _course_key(data):
+  return tuple(data.get(k) for k in ('classification', 'number', 'college', 'level'))
+
+def _targeted(payloads, network, institution, session_id):
+  for data in payloads:
+    data['network'], data['institution'], data['session'] = network, institution, session_id
+    yield data
+
+##
+# Import one file. Consecutive sections of the same course are handed to the
+# ingest together so a course is never split across two batches. The courses it
+# touched are reindexed once the file is committed, not inside its transaction.
+def import_file(path, network, institution, session_id, batch_size=500):
+  errors = []
+  indexer = DeferredIndexer(Course)
+  indexer.start()
+  ingest = SectionIngest(batch_size, log_error=errors.append, indexer=indexer)
+  start = time.time()
+  sections = 0
+  transaction.enter_transaction_management()
+  transaction.managed(True)
+  try:
+    course, key = [], None
+    for data in _targeted(read_archive(path), network, institution, session_id):
+      sections += 1
+      if _course_key(data) != key and course:
+        ingest.add(*course)
+        course = []
+      key = _course_key(data)
+      course.append(data)
+    if course:
+      ingest.add(*course)
+    ingest.flush()
+    transaction.commit()
+  except Exception, e:
+    transaction.rollback()
+    indexer.discard()
+    errors.append("%s: import aborted: %s\n\n" % (path, e))
+  finally:
+    transaction.leave_transaction_management()
+  indexer.stop()
+  elapsed = time.time() - start
+  return {
+    'path': path,
+    'sections': sections,
+    'seconds': elapsed,
+    'rate': sections / max(elapsed, 1e-6),
+    'stats': ingest.stats,
+    'errors': errors,
+  }
+
+def _import_files(args):
+  paths, rest = args[0], args[1:]
+  return [import_file(path, *rest) for path in paths]
+
+def _outline(args):
+  try:
+    return args[0], archive_outline(*args), None
+  except Exception, e:
+    return args[0], None, '%s' % e
+
+def _worker_init():
+  # every process needs its own database connection, not a copy of the parent's
+  connection.close()
+
+##
+# Import @paths into a session with @processes workers. Every file is outlined
+# first (archive_outline, on the workers), and the colleges, levels and
+# classifications the outlines list are created in this process, so workers never
+# race to create the same row. Courses have no unique key to race on, so files
+# that share a course (listings split across several pages) go to the same worker,
+# one after the other. @report is called with each file's result as it finishes;
+# the list of all results is returned.
+def import_archives(paths, network, institution, session_id, processes=4, batch_size=500, report=None):
+  outlines = [(path, network, institution, session_id) for path in paths]
+  pool = None
+  if processes > 1:
+    connection.close()
+    pool = multiprocessing.Pool(processes, _worker_init)
+  try:
+    failed = []
+    courses = {}
+    primer = SectionIngest(batch_size)
+    for path, outline, error in (pool.imap(_outline, outlines) if pool else itertools.imap(_outline, outlines)):
+      if error is None:
+        try:
+          primer.resolve_dimensions(outline[0])
+        except Exception, e:
+          error = e
+      if error is None:
+        courses[path] = outline[1]
+      else:
+        failed.append(_reported({'path': path, 'sections': 0, 'seconds': 0.0, 'rate': 0.0,
+            'stats': {}, 'errors': ["%s: unreadable: %s\n\n" % (path, error)]}, report))
+    transaction.commit_unless_managed()
+    jobs = [(group, network, institution, session_id, batch_size) for group in _partition(courses)]
+
+    if pool:
+      connection.close()
+      results = pool.imap_unordered(_import_files, jobs)
+      return failed + [_reported(result, report) for group in results for result in group]
+    return failed + [_reported(result, report) for job in jobs for result in _import_files(job)]
+  finally:
+    if pool:
+      pool.close()
+      pool.join()
+
+##
+# @courses is {path: set of course keys}; returns the paths in groups (sorted lists)
+# such that no course appears in two groups.
+def _partition(courses):
+  group_of = {}
+  groups = {}
+  ids = itertools.count()
+  for path in sorted(courses.keys()):
+    merged = set(group_of[key] for key in courses[path] if key in group_of)
+    group = min(merged) if merged else ids.next()
+    members = groups.setdefault(group, [])
+    for other in merged - set([group]):
+      members.extend(groups.pop(other))
+    members.append(path)
+    for member in members:
+      for key in courses[member]:
+        group_of[key] = group
+  return [sorted(members) for group, members in sorted(groups.items())]
+
+def _reported(result, report):
+  if report:
+    report(result)
+  return result
@@ -0,0 +1,87 @@
+from django.conf import settings
+import copy, redis
+
+from api.sweep import key_code
+
+KEEP_SECONDS = 7 * 24 * 3600 # how long a finished run's checkpoint stays around
+
+class RunCheckpoint(object):
+  """
+  How far one scraper run has got, next to its runlog keys: the redis sets
+  runlog:<runid>:<network>:<session>:subjects and :sections hold the subjects
+  finished and the keys (api.sweep.section_key) of the sections known to be in
+  the database; self.written has the keys and self.sections their reference
+  codes. A restart of the run loads both and skips that work (see
+  Scraper.resume_from).
+  A run split across workers also collects in :seen every section its tasks
+  saw listed, written or not, to sweep against once all of them are done.
+
+  runlog:<network>:<session>:current names the run in progress until it ends, so
+  a restart can find it (NetworkScraper.run(resume=True)).
+  """
+  def __init__(self, runid, network, session, conn=None):
+    self.runid = runid
+    self.key = 'runlog:%s:%s:%s' % (runid, network, session)
+    self.current_key = 'runlog:%s:%s:current' % (network, session)
+    self.r = conn or redis.Redis(settings.REDIS_HOST)
+    self.subjects = set(self.r.smembers(self.key + ':subjects') or ())
+    self.written = set(self.r.smembers(self.key + ':sections') or ())
+    self.sections = set(key_code(key) for key in self.written)
+
+  ##
+  # The checkpoint of the unfinished run of @network's @session, or None.
+  @classmethod
+  def unfinished(cls, network, session, conn=None):
+    conn = conn or redis.Redis(settings.REDIS_HOST)
+    runid = conn.get('runlog:%s:%s:current' % (network, session))
+    if runid is None:
+      return None
+    return cls(runid, network, session, conn)
+
+  ##
+  # A read-only copy of what is done so far, for other threads to check against
+  # while this one goes on recording; it can't write.
+  def snapshot(self):
+    snapshot = copy.copy(self)
+    snapshot.subjects = frozenset(self.subjects)
+    snapshot.written = frozenset(self.written)
+    snapshot.sections = frozenset(self.sections)
+    snapshot.r = None
+    return snapshot
+
+  def start(self):
+    self.r.set(self.current_key, self.runid)
+
+  ##
+  # Record the sections with @keys as written, and @subject as finished if given,
+  # in one round trip; the scraper saves them up and calls this once per commit or
+  # subject.
+  def done(self, keys, subject=None):
+    keys = [key for key in keys if key not in self.written]
+    if subject in self.subjects:
+      subject = None
+    if not keys and subject is None:
+      return
+    pipe = self.r.pipeline()
+    if keys:
+      self.written.update(keys)
+      self.sections.update(key_code(key) for key in keys)
+      pipe.sadd(self.key + ':sections', *keys)
+    if subject is not None:
+      self.subjects.add(subject)
+      pipe.sadd(self.key + ':subjects', subject)
+    pipe.execute()
+
+  def saw(self, *reference_codes):
+    if reference_codes:
+      self.r.sadd(self.key + ':seen', *reference_codes)
+
+  def seen(self):
+    return set(self.r.smembers(self.key + ':seen') or ())
+
+  ##
+  # The run is over: nothing left to resume, and its sets expire after KEEP_SECONDS.
+  def close(self):
+    self.r.delete(self.current_key)
+    for suffix in (':subjects', ':sections', ':seen'):
+      self.r.expire(self.key + suffix, KEEP_SECONDS)
@@ -0,0 +1,115 @@
+from django.db import connection, transaction
+from django.db.models import AutoField
+from haystack import site
+
+##
+# Set-based write helpers for the scrape ingest path. Django 1.3 has no
+# bulk_create, so inserts go through a single executemany.
+
+def field_values(obj):
+  return dict((f.attname, getattr(obj, f.attname)) for f in obj._meta.local_fields)
+
+##
+# Fields of @obj that differ from the @original values, compared the way the
+# database would store them (so u'30' and 30 in an IntegerField are equal).
+def changed_fields(obj, original):
+  fields = []
+  for f in obj._meta.local_fields:
+    old, new = original[f.attname], getattr(obj, f.attname)
+    if old == new:
+      continue
+    try:
+      if f.to_python(old) == f.to_python(new):
+        continue
+    except Exception:
+      pass
+    fields.append(f.name)
+  return fields
+
+def bulk_insert(model, objs):
+  objs = list(objs)
+  if not objs:
+    return
+  qn = connection.ops.quote_name
+  fields = [f for f in model._meta.local_fields if not isinstance(f, AutoField)]
+  sql = "INSERT INTO %s (%s) VALUES (%s)" % (
+    qn(model._meta.db_table),
+    ", ".join([qn(f.column) for f in fields]),
+    ", ".join(["%s"] * len(fields)),
+  )
+  params = [[f.get_db_prep_save(f.pre_save(obj, True), connection=connection) for f in fields] for obj in objs]
+  cursor = connection.cursor()
+  cursor.executemany(sql, params)
+  transaction.commit_unless_managed()
+
+##
+# DELETE the rows of @model whose @field is in @values, 500 at a time. Goes straight
+# to SQL: no rows are loaded, and no delete signals (or cascades) fire, so callers
+# remove dependent rows first.
+def bulk_delete(model, values, field='id'):
+  qn = connection.ops.quote_name
+  column = model._meta.get_field(field).column
+  cursor = connection.cursor()
+  for chunk in chunks(values, 500):
+    cursor.execute("DELETE FROM %s WHERE %s IN (%s)" % (
+      qn(model._meta.db_table), qn(column), ", ".join(["%s"] * len(chunk))), chunk)
+  transaction.commit_unless_managed()
+
+##
+# @updates is a list of (obj, [field name, ...]). Rows that received identical changes
+# (e.g. a few hundred sections going from "Open" to "Closed") share one UPDATE.
+def bulk_update(model, updates):
+  grouped = {}
+  for obj, fields in updates:
+    if not fields:
+      continue
+    values = tuple(sorted((f, getattr(obj, model._meta.get_field(f).attname)) for f in fields))
+    grouped.setdefault(values, []).append(obj.pk)
+  for values, ids in grouped.items():
+    for chunk in chunks(ids, 500):
+      model._default_manager.filter(pk__in=chunk).update(**dict(values))
+
+def chunks(items, size):
+  items = list(items)
+  for i in range(0, len(items), size):
+    yield items[i:i + size]
+
+##
+# Push the given rows to the search backend in one call. Writes made with
+# bulk_insert / bulk_update don't send post_save, so RealTimeSearchIndex
+# never sees them on its own.
+def reindex(model, ids):
+  if not ids:
+    return
+  index = site.get_index(model)
+  index.backend.update(index, model._default_manager.filter(id__in=ids))
+
+##
+# Drop the search documents of the given (already deleted) rows, committing the
+# backend once at the end rather than once per document.
+def unindex(model, ids):
+  ids = list(ids)
+  index = site.get_index(model)
+  for i, pk in enumerate(ids):
+    identifier = "%s.%s.%s" % (model._meta.app_label, model._meta.module_name, pk)
+    index.backend.remove(identifier, commit=(i == len(ids) - 1))
+
+##
+# Call fn(*args) inside a savepoint when the caller is managing a transaction,
+# rolling back to it if fn raises. Outside of managed transactions every write
+# commits on its own anyway, so fn is just called.
+#
+# Backends without savepoints (sqlite and MySQL under Django 1.3) can't undo what
+# fn wrote before it raised, so fn is just called there too: the writers check each
+# payload up front (api.helpers.check_payload) so a bad one fails before any write.
+def in_savepoint(fn, *args):
+  if not transaction.is_managed() or not connection.features.uses_savepoints:
+    return fn(*args)
+  sid = transaction.savepoint()
+  try:
+    result = fn(*args)
+  except:
+    transaction.savepoint_rollback(sid)
+    raise
+  transaction.savepoint_commit(sid)
+  return result
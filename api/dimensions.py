@@ -0,0 +1,69 @@
+from django.db.models import Model
+
+from courses.models import Institution, Session
+from networks.models import Network
+
+class DimensionCache(object):
+  """
+  Run-scoped lookup cache for the rows every scraped section points at:
+  Network, Institution, Session, College, Classification and Level.
+
+  Rows are keyed by model and natural key (the same keyword lookups
+  create_section passes to get / get_or_create), so after the first section of
+  a run every lookup is answered from memory. The cache also remembers which
+  rows have been attached to a session's colleges / classifications / levels,
+  so each ManyToMany add happens once per run instead of once per section.
+
+  One cache is created per Scraper; it assumes nothing else renames or deletes
+  these rows while the run is going.
+  """
+  def __init__(self):
+    self._rows = {}
+    self._linked = set()
+    self.hits = 0
+    self.misses = 0
+
+  def _key(self, model, lookup):
+    return (model, tuple(sorted((k, v.pk if isinstance(v, Model) else v) for k, v in lookup.items())))
+
+  def prime(self, obj, **lookup):
+    self._rows[self._key(obj.__class__, lookup)] = obj
+
+  def find(self, model, **lookup):
+    obj = self._rows.get(self._key(model, lookup))
+    if obj is not None:
+      self.hits += 1
+    return obj
+
+  def get(self, model, **lookup):
+    obj = self.find(model, **lookup)
+    if obj is None:
+      self.misses += 1
+      obj = model.objects.get(**lookup)
+      self.prime(obj, **lookup)
+    return obj
+
+  def get_or_create(self, model, **lookup):
+    obj = self.find(model, **lookup)
+    if obj is None:
+      self.misses += 1
+      obj, created = model.objects.get_or_create(**lookup)
+      self.prime(obj, **lookup)
+    return obj
+
+  ##
+  # Forget everything but the network / institution / session rows. Needed after a
+  # rollback, which may have undone rows or links this cache has seen created.
+  def reset(self):
+    for key in self._rows.keys():
+      if key[0] not in (Network, Institution, Session):
+        del self._rows[key]
+    self._linked.clear()
+
+  ##
+  # session.<relation>.add(*objs), skipping rows already added during this run.
+  def link(self, session, relation, *objs):
+    new = [obj for obj in objs if (session.pk, relation, obj.pk) not in self._linked]
+    if new:
+      getattr(session, relation).add(*new)
+      self._linked.update((session.pk, relation, obj.pk) for obj in new)
@@ -0,0 +1,125 @@
+from django.conf import settings
+import hashlib, json, redis, threading
+
+def fingerprint(data):
+  return hashlib.sha1(json.dumps(data, sort_keys=True, default=unicode)).hexdigest()
+
+class SectionFingerprints(object):
+  """
+  Remembers a digest of the last section_data written for every section of a
+  network's session, in the redis hash fingerprints:<network>:<session>
+  (field: reference_code). A payload whose digest matches has nothing new to
+  write, so the scraper can skip the database and the search index for it.
+
+  The hash is read once, on first use; new digests are only recorded after
+  their section has been written. With autocommit off they are held until
+  commit(), so a scraper running inside a transaction never records a digest
+  for a write that was later rolled back.
+
+  Alongside, pages:<network>:<session> keeps a digest of each section's detail
+  page (see scrapers.pagefields.page_digest). A scraper that fetches a page whose
+  digest is known can skip parsing it too. A page digest given to saw_page() is
+  only kept once the section's payload has been written (or found unchanged),
+  for the same reason. Page digests may be looked up from worker threads (sharded
+  or concurrent scrapers) while the scraper's own thread records new ones.
+  """
+  def __init__(self, network, session, conn=None):
+    self.key = 'fingerprints:%s:%s' % (network, session)
+    self.pages_key = 'pages:%s:%s' % (network, session)
+    self.r = conn or redis.Redis(settings.REDIS_HOST)
+    self.autocommit = True
+    self._known = None
+    self._pending = {}
+    self._pages = None
+    self._by_page = None
+    self._pages_seen = {}
+    self._pages_pending = {}
+    self._pages_lock = threading.Lock()
+
+  def known(self):
+    if self._known is None:
+      self._known = self.r.hgetall(self.key) or {}
+    return self._known
+
+  def matches(self, data):
+    return self.known().get('%s' % data['reference_code']) == fingerprint(data)
+
+  def remember(self, *payloads):
+    digests = dict(('%s' % data['reference_code'], fingerprint(data)) for data in payloads)
+    self.known().update(digests)
+    self._pending.update(digests)
+    self.confirm_pages(*digests.keys())
+    if self.autocommit:
+      self.commit()
+
+  def known_pages(self):
+    if self._pages is None:
+      self._pages_lock.acquire()
+      try:
+        if self._pages is None:
+          pages = self.r.hgetall(self.pages_key) or {}
+          self._by_page = dict((digest, code) for code, digest in pages.items())
+          self._pages = pages
+      finally:
+        self._pages_lock.release()
+    return self._pages
+
+  ##
+  # The reference code of the section whose detail page had @digest last run, if any.
+  def page_match(self, digest):
+    self.known_pages()
+    self._pages_lock.acquire()
+    try:
+      return self._by_page.get(digest)
+    finally:
+      self._pages_lock.release()
+
+  def saw_page(self, reference_code, digest):
+    self._pages_seen['%s' % reference_code] = digest
+
+  ##
+  # The payloads of these sections are in the database: keep their page digests.
+  def confirm_pages(self, *reference_codes):
+    self.known_pages()
+    self._pages_lock.acquire()
+    try:
+      for code in reference_codes:
+        digest = self._pages_seen.pop('%s' % code, None)
+        if digest is None:
+          continue
+        old = self._pages.get(code)
+        if old is not None:
+          self._by_page.pop(old, None)
+        self._pages[code] = self._pages_pending[code] = digest
+        self._by_page[digest] = code
+    finally:
+      self._pages_lock.release()
+    if self.autocommit:
+      self.commit()
+
+  def commit(self):
+    if self._pending:
+      self.r.hmset(self.key, self._pending)
+      self._pending = {}
+    if self._pages_pending:
+      self.r.hmset(self.pages_key, self._pages_pending)
+      self._pages_pending = {}
+
+  ##
+  # Drop the digests of sections that no longer exist, so they're written again if they come back.
+  def forget(self, *reference_codes):
+    fields = ['%s' % code for code in reference_codes]
+    self.known_pages()
+    self._pages_lock.acquire()
+    try:
+      for field in fields:
+        self.known().pop(field, None)
+        self._pending.pop(field, None)
+        digest = self._pages.pop(field, None)
+        self._by_page.pop(digest, None)
+        self._pages_pending.pop(field, None)
+    finally:
+      self._pages_lock.release()
+    if fields:
+      self.r.hdel(self.key, *fields)
+      self.r.hdel(self.pages_key, *fields)
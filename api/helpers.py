@@ -1,43 +1,60 @@
-import datetime, re
-
 from django.http import HttpResponse
 from django.template.defaultfilters import slugify
 
 from courses.models import *
 from networks.models import Network
+from api.db import field_values, changed_fields, bulk_insert, bulk_update, chunks
+from api.dimensions import DimensionCache
+from api.metrics import timed
+from api.normalize import clean, REPLACEMENTS
+
+def create_section(data, cache=None):
+  return create_course_sections([data], cache)
 
-def create_section(data):
-  network = Network.objects.get(slug = data['network'])
-  institution = Institution.objects.get(slug = data['institution'])
-  session = Session.objects.get(id=data['session'])
+##
+# Write several section_data payloads that all belong to the same course. The
+# course row is updated once from all of them and saved once, after every
+# section has landed, so its derived fields (profs) are rebuilt a single time.
+# With the run's @metrics (api.metrics.RunMetrics) the clean() calls are timed
+# as its normalize phase.
+def create_course_sections(payloads, cache=None, metrics=None):
+  for data in payloads:
+    check_payload(data)
+  data = payloads[0]
+  if cache is None:
+    cache = DimensionCache()
+  network = cache.get(Network, slug = data['network'])
+  institution = cache.get(Institution, slug = data['institution'])
+  session = cache.get(Session, id=data['session'])
+  names = timed(metrics, 'normalize', dimension_names, data)
   
   if data.get('college'):
-    college, created = College.objects.get_or_create(
+    college = cache.get_or_create(College,
       institution = institution,
       network = network,
-      name = clean(data['college'])
+      name = names['college']
     )
-    session.colleges.add(college)
+    cache.link(session, 'colleges', college)
   else:
     college = None
 
-  classification, created = Classification.objects.get_or_create(
+  classification = cache.get_or_create(Classification,
     code = data['classification'],
     college = college,
-    name = clean(data['classification_name']),
+    name = names['classification_name'],
     institution = institution,
     network = network,
   )
-  session.classifications.add(classification)
+  cache.link(session, 'classifications', classification)
   
   if data.get('level'):
-    level, created = Level.objects.get_or_create(
-      name = clean(data['level']),
-      slug = slugify(clean(data['level'])),
+    level = cache.get_or_create(Level,
+      name = names['level'],
+      slug = slugify(names['level']),
       institution = institution,
       network = network,
     )
-    session.levels.add(level)
+    cache.link(session, 'levels', level)
   else:
     level = None
   
@@ -52,23 +69,49 @@ def create_section(data):
     level = level,
   )
 
-  course, updated = update_attrs(course, {
+  for data in payloads:
+    course, updated = update_attrs(course, course_attrs(data, session), metrics=metrics)
+  
+  meetings = {}
+  for data in payloads:
+    # get or create the section
+    section, section_created = Section.objects.get_or_create(
+      network = network,
+      reference_code=data['reference_code'],
+      institution=institution,
+      course=course
+    )
+    
+    section, updated = update_attrs(section, section_attrs(data, institution, course), force_insert=True, metrics=metrics)
+    section.save()
+    
+    if 'meetings' in data:
+      meetings[section.id] = scraped_meetings(data)
+  
+  diffs = reconcile_meetings(meetings)
+  
+  course.save() # update derived params
+  
+  #print "Course: %s, Section: %s" % (course_created, section_created)
+  return diffs
+
+def dimension_names(data):
+  return dict((key, clean(data[key]) if data.get(key) else data.get(key)) for key in ('college', 'classification_name', 'level'))
+
+##
+# Attributes written to each model for a scraped section_data payload. Shared by
+# create_section and the batched ingest in api.ingest so both write the same values.
+def course_attrs(data, session):
+  return {
     'session': session,
     #'location_code': data['loc_code'],
     'name': data['course_name'],
     'description': data['description'],
     'grading': data['grading'][:50],
-  })
-  course.save()
-  
-  # get or create the section
-  section, section_created = Section.objects.get_or_create(
-    network = network,
-    reference_code=data['reference_code'],
-    institution=institution,
-    course=course
-  )
-  section_attrs = {
+  }
+
+def section_attrs(data, institution, course):
+  return {
     'institution': institution,
     'course': course,
     'number': data['section'],
@@ -87,65 +130,104 @@ def create_section(data):
     'waitlist_taken': data.get('waitlist_taken', None),
     'waitlist_available': data.get('waitlist_available', None),
   }
+
+##
+# Raise whatever writing @data would raise on a missing or malformed field, before
+# anything is written; without savepoints a payload failing half way through its
+# writes would leave a partial course or section behind (see api.db.in_savepoint).
+def check_payload(data):
+  for key in ('network', 'institution', 'session', 'classification', 'classification_name', 'number', 'reference_code'):
+    data[key]
+  course_attrs(data, None)
+  section_attrs(data, None, None)
+  scraped_meetings(data)
+
+DAY_CODES = {'M': 'Mon', 'T': 'Tue', 'W': 'Wed', 'R': 'Thu', 'F': 'Fri', 'S': 'Sat', 'U': 'Sun', '': ''}
+def meeting_day(m):
+  if len(m.get('day', '')) == 1:
+    return DAY_CODES[m.get('day', '')]
+  return m.get('day')
+
+def meeting_attrs(m):
+  return {
+    'start': m.get('start', None),
+    'end': m.get('end', None),
+    'location': m.get('location', None),
+    'room': m.get('room', None),
+  }
+
+def scraped_meetings(data):
+  return [(meeting_day(m), meeting_attrs(m)) for m in data.get('meetings', [])]
+
+class MeetingDiff(object):
+  def __init__(self):
+    self.added = []
+    self.changed = []
+    self.removed = []
   
-  """
-  for day in ['Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun']:
-    if day in data.get('days', []):
-      if data.get('start_time'):
-        section_attrs['meet_%s_start' % day.lower()] = datetime.datetime.strptime(data['start_time'], "%H:%M").time()
-      if data.get('end_time'):
-        section_attrs['meet_%s_end' % day.lower()] = datetime.datetime.strptime(data['end_time'], "%H:%M").time()
-  """
-  
-  section, updated = update_attrs(section, section_attrs, force_insert=True)
-  section.save()
+  def __nonzero__(self):
+    return bool(self.added or self.changed or self.removed)
+
+##
+# Make each section's Meeting rows match what was scraped for it.
+# @scraped is {section id: [(day, meeting_attrs), ...]}; a section with an empty
+# list loses all of its meetings. Existing rows are loaded in one query, then only
+# the difference is written: new days are inserted, changed days updated, and days
+# no longer listed (or duplicate rows for one day) deleted.
+# Returns {section id: MeetingDiff}; a diff is false when the schedule didn't change.
+def reconcile_meetings(scraped):
+  diffs = dict((section_id, MeetingDiff()) for section_id in scraped)
+  existing = {}
+  stale = []
+  for ids in chunks(scraped.keys(), 500):
+    for meeting in Meeting.objects.filter(section__in=ids).order_by('id'):
+      key = (meeting.section_id, meeting.day)
+      if key in existing:
+        stale.append(meeting)
+      else:
+        existing[key] = meeting
   
-  for m in data.get('meetings', []):
-    if len(m.get('day', '')) == 1:
-      day = {'M': 'Mon', 'T': 'Tue', 'W': 'Wed', 'R': 'Thu', 'F': 'Fri', 'S': 'Sat', 'U': 'Sun', '': ''}[m.get('day', '')]
-    else: day = m.get('day')
-    meeting, created = Meeting.objects.get_or_create(section=section, day=day)
-    meeting_attrs = {
-      'start': m.get('start', None),
-      'end': m.get('end', None),
-      'location': m.get('location', None),
-      'room': m.get('room', None),
-    }
-    print meeting_attrs
-    update_attrs(meeting, meeting_attrs, force_insert=True)
-    meeting.save()
+  new = {}
+  originals = {}
+  for section_id, meetings in scraped.items():
+    for day, attrs in meetings:
+      key = (section_id, day)
+      if key in existing:
+        meeting = existing[key]
+        originals.setdefault(key, field_values(meeting))
+      else:
+        meeting = new.get(key)
+        if not meeting:
+          meeting = new[key] = Meeting(section_id=section_id, day=day)
+          diffs[section_id].added.append(meeting)
+      update_attrs(meeting, attrs, force_insert=True)
   
-  course.save() # update derived params
+  updates = []
+  for key, original in originals.items():
+    fields = changed_fields(existing[key], original)
+    if fields:
+      diffs[key[0]].changed.append(existing[key])
+      updates.append((existing[key], fields))
+  stale.extend(meeting for key, meeting in existing.items() if key not in originals)
+  for meeting in stale:
+    diffs[meeting.section_id].removed.append(meeting)
   
-  #print "Course: %s, Section: %s" % (course_created, section_created)
-  response = 'success'
-  return response
+  bulk_update(Meeting, updates)
+  bulk_insert(Meeting, new.values())
+  for ids in chunks([meeting.id for meeting in stale], 500):
+    Meeting.objects.filter(id__in=ids).delete()
+  return diffs
 
-def update_attrs(obj, attrs, force_insert=False):
+def update_attrs(obj, attrs, force_insert=False, metrics=None):
   updated = False
-  for field in attrs.keys():
+  attrs = timed(metrics, 'normalize', clean_attrs, attrs)
+  for field, cleaned in attrs.items():
     pre_save = getattr(obj, field)
-    cleaned = clean(attrs[field])
     if force_insert or cleaned:
-      setattr(obj, field, clean(attrs[field]))
+      setattr(obj, field, cleaned)
     if pre_save != getattr(obj, field):
       updated = True
   return obj, updated
 
-REPLACEMENTS = [
-  ('&#039;', "'"),
-  ('<br />', ''),
-  ('&nbsp;', ' '),
-  ('&quot;', '"'),
-  ('&amp;', '&'),
-]
-def clean(attr):
-  if type(attr) in [str, unicode]:
-    if re.match('\d{2}:\d{2}', attr): # time
-      return datetime.datetime.strptime(attr, "%H:%M").time()
-    for key, value in REPLACEMENTS:
-      attr = attr.replace(key, value)
-    attr = attr.strip()
-    if attr in ["None", "none"]:
-      attr = ''
-  return attr
+def clean_attrs(attrs):
+  return dict((field, clean(value)) for field, value in attrs.items())
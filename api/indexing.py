@@ -0,0 +1,52 @@
+from django.db.models import signals
+from haystack import site
+
+from api.db import chunks, reindex
+
+class DeferredIndexer(object):
+  """
+  Holds back a RealTimeSearchIndex while a scrape is writing.
+
+  Between start() and stop() saves of @model no longer push a document to the
+  search backend; they only mark the row dirty. flush() then reindexes every
+  dirty row, batch_size documents per backend call, so a course that is saved
+  many times during a run is rendered and sent once. stop() flushes and puts
+  the index back in real-time mode.
+  """
+  def __init__(self, model, batch_size=500):
+    self.model = model
+    self.batch_size = batch_size
+    self.index = site.get_index(model)
+    self.dirty = set()
+    self.indexed = 0
+    self.active = False
+
+  def start(self):
+    if not self.active:
+      self.index._teardown_save(self.model)
+      signals.post_save.connect(self._saved, sender=self.model)
+      self.active = True
+
+  def stop(self):
+    if self.active:
+      self.flush()
+      signals.post_save.disconnect(self._saved, sender=self.model)
+      self.index._setup_save(self.model)
+      self.active = False
+
+  def _saved(self, instance, **kwargs):
+    self.dirty.add(instance.pk)
+
+  def mark(self, *ids):
+    self.dirty.update(ids)
+
+  ##
+  # Forget the dirty rows, when the writes that marked them were rolled back.
+  def discard(self):
+    self.dirty = set()
+
+  def flush(self):
+    dirty, self.dirty = self.dirty, set()
+    for ids in chunks(sorted(dirty), self.batch_size):
+      reindex(self.model, ids)
+      self.indexed += len(ids)
@@ -0,0 +1,337 @@
+from django.template.defaultfilters import slugify
+from django.utils.encoding import smart_unicode
+
+from api.db import field_values, changed_fields, bulk_insert, bulk_update, chunks, reindex, in_savepoint
+from api.dimensions import DimensionCache
+from api.metrics import timed
+from api.helpers import clean, update_attrs, course_attrs, section_attrs, scraped_meetings, reconcile_meetings, check_payload
+from courses.models import *
+from networks.models import Network
+
+class SectionIngest(object):
+  """
+  Batched counterpart to api.helpers.create_section.
+
+  section_data dicts are buffered with add() and written batch_size at a time:
+  every natural key in the buffer (college, classification, level, course,
+  section, meeting) is resolved with one query per model, new rows are
+  inserted with a single executemany and changed rows are written with one
+  UPDATE per distinct set of changes. Field values go through update_attrs /
+  clean exactly as they do in create_section.
+
+  Pass the run's DimensionCache as @cache so colleges, classifications and
+  levels already seen by the run are never looked up again, its
+  SectionFingerprints as @fingerprints to record each payload once written, and
+  a started DeferredIndexer as @indexer to leave reindexing to the run's checkpoints.
+  With the run's RunMetrics as @metrics, every clean() is timed as its normalize
+  phase and each flush as one ingest timing, less the normalize inside it.
+  """
+  def __init__(self, batch_size=500, log_error=None, cache=None, fingerprints=None, indexer=None, metrics=None):
+    self.batch_size = batch_size
+    self.log_error = log_error
+    self.cache = cache or DimensionCache()
+    self.fingerprints = fingerprints
+    self.indexer = indexer
+    self.metrics = metrics
+    self.buffer = []
+    self.stats = {'created': 0, 'updated': 0, 'unchanged': 0, 'rescheduled': 0}
+
+  ##
+  # Payloads passed in one call stay in the same batch; Scraper hands over a
+  # whole course at a time so a course is never split across two flushes.
+  def add(self, *payloads):
+    self.buffer.extend(payloads)
+    if len(self.buffer) >= self.batch_size:
+      self.flush()
+
+  def flush(self):
+    if self.buffer:
+      timed(self.metrics, 'ingest', self._flush)
+
+  def _flush(self):
+    buffer, self.buffer = self.buffer, []
+    for network, institution, session, payloads in self._groups(buffer):
+      try:
+        in_savepoint(self._ingest, network, institution, session, payloads)
+      except Exception, e:
+        self.cache.reset()
+        if len(payloads) == 1:
+          self._error(e, payloads[0])
+          continue
+        # find the payload that broke the batch and write the rest one at a time
+        for data in payloads:
+          try:
+            in_savepoint(self._ingest, network, institution, session, [data])
+          except Exception, e:
+            self.cache.reset()
+            self._error(e, data)
+
+  def summary(self):
+    return "%(created)s created, %(updated)s updated (%(rescheduled)s rescheduled), %(unchanged)s unchanged" % self.stats
+
+  def _error(self, e, data):
+    if self.log_error:
+      self.log_error("%s:\n%s\n\n" % (e, data))
+    else:
+      print "ERROR!: %s" % e
+
+  ##
+  # Create (or find) the colleges, levels and classifications @payloads point at and
+  # link them to their session, without writing any course or section. Lets several
+  # processes ingest into one session without racing to create the same rows.
+  def resolve_dimensions(self, payloads):
+    for network, institution, session, group in self._groups(payloads):
+      rows = self._prepare_all(group)
+      if rows:
+        self._dimensions(network, institution, session, rows)
+
+  def _groups(self, payloads):
+    groups = {}
+    for data in payloads:
+      key = (data['network'], data['institution'], data['session'])
+      groups.setdefault(key, []).append(data)
+    for (network, institution, session), group in groups.items():
+      yield (self.cache.get(Network, slug=network), self.cache.get(Institution, slug=institution),
+          self.cache.get(Session, id=session), group)
+
+  def _prepare_all(self, payloads):
+    rows = []
+    for data in payloads:
+      try:
+        rows.append(timed(self.metrics, 'normalize', self._prepare, data))
+      except Exception, e:
+        self._error(e, data)
+    return rows
+
+  def _dimensions(self, network, institution, session, rows):
+    scope = {'network': network, 'institution': institution}
+    colleges = self._resolve(College, scope, 'name', [r['college'] for r in rows if r['college']])
+    levels = self._resolve(Level, scope, 'name', [r['level'] for r in rows if r['level']],
+        lambda name: {'slug': slugify(name)})
+    classifications = self._resolve_classifications(scope, rows, colleges)
+    self.cache.link(session, 'colleges', *colleges.values())
+    self.cache.link(session, 'classifications', *classifications.values())
+    self.cache.link(session, 'levels', *levels.values())
+    return colleges, levels, classifications
+
+  def _ingest(self, network, institution, session, payloads):
+    rows = self._prepare_all(payloads)
+    if not rows:
+      return
+
+    colleges, levels, classifications = self._dimensions(network, institution, session, rows)
+    for r in rows:
+      r['college_obj'] = colleges.get(r['college'])
+      r['level_obj'] = levels.get(r['level'])
+      r['classification_obj'] = classifications[(r['classification'], r['college_obj'] and r['college_obj'].id, r['classification_name'])]
+      r['course_key'] = (r['classification_obj'].id, r['number'], r['college_obj'] and r['college_obj'].id, r['level_obj'] and r['level_obj'].id)
+
+    courses, dirty = self._write_courses(network, institution, session, rows)
+    sections, created, changed = self._write_sections(network, institution, session, rows, courses)
+    changed |= self._write_meetings(rows, sections, created)
+
+    keys = set(r['section_key'] for r in rows)
+    self.stats['created'] += len(keys & created)
+    self.stats['updated'] += len(keys & changed)
+    self.stats['unchanged'] += len(keys - created - changed)
+
+    dirty |= set(sections[key].course_id for key in created | changed)
+    update_profs([c for c in courses.values() if c.id in dirty])
+    if self.indexer and self.indexer.active:
+      self.indexer.mark(*dirty)
+    else:
+      reindex(Course, dirty)
+    if self.fingerprints:
+      self.fingerprints.remember(*[r['data'] for r in rows])
+
+  ##
+  # Dimension names are keyed as unicode, which is what comes back from the
+  # database; scrapers hand over UTF-8 str, which never equals it once non-ASCII.
+  def _prepare(self, data):
+    check_payload(data)
+    return {
+      'data': data,
+      'college': smart_unicode(clean(data['college'])) if data.get('college') else None,
+      'level': smart_unicode(clean(data['level'])) if data.get('level') else None,
+      'classification': smart_unicode(data['classification']),
+      'classification_name': smart_unicode(clean(data['classification_name'])),
+      'number': data['number'],
+      'reference_code': data['reference_code'],
+      'meetings': scraped_meetings(data) if 'meetings' in data else None,
+    }
+
+  ##
+  # Cached lookups use the same keys as create_section's get_or_create calls,
+  # so both paths can share one DimensionCache.
+  def _resolve(self, model, scope, field, values, extra=lambda value: {}):
+    found, missing = {}, {}
+    for value in set(values):
+      lookup = dict(scope, **extra(value))
+      lookup[field] = value
+      obj = self.cache.find(model, **lookup)
+      if obj is None:
+        missing[value] = lookup
+      else:
+        found[value] = obj
+    for value, obj in resolve(model, scope, field, missing.keys()).items():
+      self.cache.prime(obj, **missing[value])
+      found[value] = obj
+    return found
+
+  def _resolve_classifications(self, scope, rows, colleges):
+    found, missing = {}, {}
+    for r in rows:
+      college = colleges.get(r['college'])
+      key = (r['classification'], college and college.id, r['classification_name'])
+      lookup = dict(scope, code=key[0], college=college, name=key[2])
+      obj = self.cache.find(Classification, **lookup)
+      if obj is None:
+        missing[key] = lookup
+      else:
+        found[key] = obj
+    if missing:
+      qs = Classification.objects.filter(code__in=set(k[0] for k in missing), **scope).order_by('id')
+      for c in qs:
+        key = (smart_unicode(c.code), c.college_id, smart_unicode(c.name))
+        if key in missing and key not in found:
+          found[key] = c
+      for key, lookup in missing.items():
+        if key not in found:
+          found[key] = Classification(**lookup)
+          found[key].save()
+        self.cache.prime(found[key], **lookup)
+    return found
+
+  def _write_courses(self, network, institution, session, rows):
+    def load():
+      qs = Course.objects.filter(network=network, institution=institution, session=session,
+          number__in=set(r['number'] for r in rows)).order_by('id')
+      found = {}
+      for c in qs:
+        c.session = session # already loaded; saves update_attrs a query per course
+        found.setdefault((c.classification_id, c.number, c.college_id, c.level_id), c)
+      return found
+
+    courses = load()
+    new = {}
+    originals = {}
+    for r in rows:
+      key = r['course_key']
+      if key in courses:
+        course = courses[key]
+        originals.setdefault(key, field_values(course))
+      else:
+        course = new.get(key)
+        if not course:
+          course = new[key] = Course(network=network, institution=institution, session=session,
+              classification=r['classification_obj'], number=r['number'],
+              college=r['college_obj'], level=r['level_obj'], profs='')
+      update_attrs(course, course_attrs(r['data'], session), metrics=self.metrics)
+      if course.name:
+        course.slug = slugify(course.name)[:60]
+
+    dirty = set()
+    updates = []
+    for key, original in originals.items():
+      fields = changed_fields(courses[key], original)
+      if fields:
+        dirty.add(courses[key].id)
+        updates.append((courses[key], fields))
+    bulk_update(Course, updates)
+
+    if new:
+      bulk_insert(Course, new.values())
+      courses = load()
+      dirty |= set(courses[key].id for key in new)
+    return courses, dirty
+
+  def _write_sections(self, network, institution, session, rows, courses):
+    by_id = dict((c.id, c) for c in courses.values())
+    def load():
+      qs = Section.objects.filter(network=network, institution=institution, course__session=session,
+          reference_code__in=set(r['reference_code'] for r in rows)).order_by('id')
+      found = {}
+      for s in qs:
+        if s.course_id in by_id:
+          s.institution, s.course = institution, by_id[s.course_id]
+        found.setdefault((s.reference_code, s.course_id), s)
+      return found
+
+    sections = load()
+    new = {}
+    originals = {}
+    for r in rows:
+      course = courses[r['course_key']]
+      key = r['section_key'] = (r['reference_code'], course.id)
+      if key in sections:
+        section = sections[key]
+        originals.setdefault(key, field_values(section))
+      else:
+        section = new.get(key)
+        if not section:
+          section = new[key] = Section(network=network, reference_code=r['reference_code'],
+              institution=institution, course=course)
+      update_attrs(section, section_attrs(r['data'], institution, course), force_insert=True, metrics=self.metrics)
+
+    changed = set()
+    updates = []
+    for key, original in originals.items():
+      fields = changed_fields(sections[key], original)
+      if fields:
+        changed.add(key)
+        updates.append((sections[key], fields))
+    bulk_update(Section, updates)
+
+    if new:
+      bulk_insert(Section, new.values())
+      sections = load()
+    return sections, set(new.keys()), changed
+
+  ##
+  # Returns the keys of existing sections whose schedule changed.
+  def _write_meetings(self, rows, sections, created):
+    keys = {}
+    scraped = {}
+    for r in rows:
+      if r['meetings'] is not None:
+        section = sections[r['section_key']]
+        keys[section.id] = r['section_key']
+        scraped[section.id] = r['meetings']
+    diffs = reconcile_meetings(scraped)
+    changed = set(keys[section_id] for section_id, diff in diffs.items() if diff) - created
+    self.stats['rescheduled'] += len(changed)
+    return changed
+
+##
+# Look up rows of @model by one @field, creating the ones that don't exist yet.
+# Returns {value: obj}, preferring the oldest row like get_or_create would; values
+# are compared (and returned) as unicode.
+def resolve(model, scope, field, values):
+  values = set(smart_unicode(value) for value in values)
+  found = {}
+  if not values:
+    return found
+  for obj in model.objects.filter(**scope).filter(**{'%s__in' % field: values}).order_by('id'):
+    found.setdefault(smart_unicode(getattr(obj, field)), obj)
+  for value in values - set(found.keys()):
+    obj = model(**scope)
+    setattr(obj, field, value)
+    obj.save()
+    found[value] = obj
+  return found
+
+##
+# Mirrors Course.save(): profs is every section's prof, in section order.
+# Writes only the courses whose value changed.
+def update_profs(courses):
+  profs = {}
+  qs = Section.objects.filter(course__in=[c.id for c in courses]).order_by('course', 'number')
+  for course_id, prof in qs.values_list('course', 'prof'):
+    profs.setdefault(course_id, []).append(prof)
+  updates = []
+  for course in courses:
+    value = " ".join(profs.get(course.id, []))
+    if value != course.profs:
+      course.profs = value
+      updates.append((course, ['profs']))
+  bulk_update(Course, updates)
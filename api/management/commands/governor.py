@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from scrapers.governor import HostGovernor
+
+class Command(BaseCommand):
+  args = '[host ...]'
+  help = 'Shows the request allowance and measured latency of every host scrapers fetch from (or the ones given), as the shared governor has adjusted them.'
+
+  def handle(self, *args, **options):
+    report = HostGovernor().report(args or None)
+    if not report:
+      print "No hosts yet."
+    for host, limits in sorted(report.items()):
+      print "%-32s %2s in flight of %4.1f allowed, %6.2f requests/s, latency %.3fs (%.1fx its baseline), %s errors in %s requests" % (host,
+          limits['in_flight'], limits['limit'], limits['rate'], limits['latency'], limits['slowdown'], limits['errors'], limits['requests'])
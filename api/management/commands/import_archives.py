@@ -0,0 +1,44 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from optparse import make_option
+
+from api.archive import import_archives
+from courses.models import Session
+from networks.models import Network
+
+class Command(BaseCommand):
+  args = '<network> <session> <file> [file ...]'
+  help = 'Backfills a session from archived listings (old pickle dumps or JSONL recordings) through the batched ingest path.'
+  option_list = BaseCommand.option_list + (
+    make_option('--processes', type='int', default=4, help='Files imported in parallel.'),
+    make_option('--batch-size', dest='batch_size', type='int', default=500),
+  )
+
+  def handle(self, *args, **options):
+    if len(args) < 3:
+      raise CommandError('Usage: manage.py import_archives %s' % self.args)
+    try:
+      network = Network.objects.get(slug=args[0])
+      session = Session.objects.get(network=network, slug=args[1])
+    except (Network.DoesNotExist, Session.DoesNotExist), e:
+      raise CommandError(e)
+
+    results = import_archives(args[2:], network.slug, network.institution.slug, session.id,
+        options['processes'], options['batch_size'], self.report)
+
+    sections = sum(result['sections'] for result in results)
+    seconds = sum(result['seconds'] for result in results)
+    errors = [error for result in results for error in result['errors']]
+    print "%s files, %s sections (%.1fs of work), %s errors" % (len(results), sections, seconds, len(errors))
+    if errors:
+      path = settings.LOG_ROOT + '%s_%s_import_errors.log' % (network.slug, session.slug)
+      f = open(path, 'w')
+      f.write(''.join(errors))
+      f.close()
+      print "Errors written to %s" % path
+
+  def report(self, result):
+    stats = result['stats']
+    print "%s: %s sections in %.1fs (%.0f/s), %s created, %s updated, %s errors" % (
+        result['path'], result['sections'], result['seconds'], result['rate'],
+        stats.get('created', 0), stats.get('updated', 0), len(result['errors']))
@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand, CommandError
+from optparse import make_option
+import gzip, json
+
+from api.normalize import compare, benchmark, payload_values
+
+class Command(BaseCommand):
+  args = '<corpus.jsonl[.gz]>'
+  help = 'Checks api.normalize.clean against the old implementation on a corpus of section_data and times both.'
+  option_list = BaseCommand.option_list + (
+    make_option('--repeat', type='int', default=5, help='Timing rounds per implementation (best is reported).'),
+    make_option('--show', type='int', default=10, help='Number of mismatching values to print.'),
+  )
+
+  def handle(self, *args, **options):
+    if len(args) != 1:
+      raise CommandError('Usage: manage.py normalize_bench %s' % self.args)
+    path = args[0]
+    f = gzip.open(path) if path.endswith('.gz') else open(path)
+    values = []
+    try:
+      for line in f:
+        if line.strip():
+          values.extend(payload_values(json.loads(line)))
+    finally:
+      f.close()
+
+    result = compare(values)
+    print "%(values)s values: %(same)s identical, " % result + "%s mismatches" % len(result['mismatches'])
+    for value, old, new in result['mismatches'][:options['show']]:
+      print "  %r: %r != %r" % (value, old, new)
+
+    timings = benchmark(values, options['repeat'])
+    print "legacy:   %.3fs" % timings['legacy']
+    print "compiled: %.3fs (%.1fx)" % (timings['compiled'], timings['legacy'] / max(timings['compiled'], 1e-9))
+    if result['mismatches']:
+      raise CommandError('clean() no longer matches the old implementation')
@@ -0,0 +1,51 @@
+from django.core.management.base import BaseCommand, CommandError
+from optparse import make_option
+from BeautifulSoup import BeautifulSoup
+import os
+
+from networks import network # loads the scrapers in the order they import each other
+from scrapers.pagefields import PageFields, compare, benchmark
+from scrapers.peoplesoft import SECTION_FIELDS, read_section, legacy_read_section
+
+def soup(page):
+  return legacy_read_section(BeautifulSoup(page))
+
+def targeted(page):
+  return read_section(PageFields(page, SECTION_FIELDS))
+
+class Command(BaseCommand):
+  args = '<page.html or directory ...>'
+  help = 'Checks the targeted PeopleSoft detail page parser against the BeautifulSoup one on saved pages (see the save_pages scraper option) and times both.'
+  option_list = BaseCommand.option_list + (
+    make_option('--repeat', type='int', default=3, help='Timing rounds per parser (best is reported).'),
+    make_option('--show', type='int', default=10, help='Number of mismatching pages to print.'),
+  )
+
+  def handle(self, *args, **options):
+    if not args:
+      raise CommandError('Usage: manage.py parse_bench %s' % self.args)
+    paths = []
+    for arg in args:
+      if os.path.isdir(arg):
+        paths.extend(sorted(os.path.join(arg, name) for name in os.listdir(arg) if name.endswith('.html')))
+      else:
+        paths.append(arg)
+    pages = []
+    for path in paths:
+      f = open(path)
+      try:
+        pages.append((path, f.read()))
+      finally:
+        f.close()
+
+    result = compare(pages, soup, targeted)
+    print "%(pages)s pages: %(same)s identical, %(failed)s failing the same way in both, " % result + \
+        "%s mismatches" % len(result['mismatches'])
+    for path, old, new in result['mismatches'][:options['show']]:
+      print "  %s:\n    soup:     %r\n    targeted: %r" % (path, old, new)
+
+    timings = benchmark(pages, (('soup', soup), ('targeted', targeted)), options['repeat'])
+    print "soup:     %.3fs" % timings['soup']
+    print "targeted: %.3fs (%.1fx)" % (timings['targeted'], timings['soup'] / max(timings['targeted'], 1e-9))
+    if result['mismatches']:
+      raise CommandError('The targeted parser no longer matches BeautifulSoup')
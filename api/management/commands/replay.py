@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand, CommandError
+from optparse import make_option
+
+from courses.models import Session
+from networks.models import Network
+from scrapers.replay import ReplayScraper
+
+class Command(BaseCommand):
+  args = '<network> <session> [recording.jsonl.gz]'
+  help = 'Loads a recorded scrape into a session through the ingest path, without network access, and reports throughput.'
+  option_list = BaseCommand.option_list + (
+    make_option('--batch-size', dest='batch_size', type='int', default=None),
+    make_option('--commit-every', dest='commit_every', type='int', default=None),
+    make_option('--commit-seconds', dest='commit_seconds', type='int', default=None),
+    make_option('--skip-unchanged', dest='skip_unchanged', action='store_true', default=False),
+    make_option('--defer-index', dest='defer_index', action='store_true', default=False),
+    make_option('--no-coalesce', dest='coalesce', action='store_false', default=True),
+  )
+
+  def handle(self, *args, **options):
+    if len(args) not in (2, 3):
+      raise CommandError('Usage: manage.py replay %s' % self.args)
+    try:
+      network = Network.objects.get(slug=args[0])
+      session = Session.objects.get(network=network, slug=args[1])
+    except (Network.DoesNotExist, Session.DoesNotExist), e:
+      raise CommandError(e)
+
+    kwargs = dict((k, options[k]) for k in ('batch_size', 'commit_every', 'commit_seconds',
+        'skip_unchanged', 'defer_index', 'coalesce'))
+    scraper = ReplayScraper(network=network.slug, session=session,
+        path=args[2] if len(args) == 3 else None, **kwargs)
+    try:
+      scraper.run()
+    finally:
+      scraper.finish()
+    print "%(sections)s sections in %(seconds)ss: %(sections_per_second)s sections/s, " \
+        "%(queries)s queries (%(queries_per_section)s per section)" % scraper.timing()
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.conf import settings
+import redis
+
+from api.metrics import RunMetrics, PHASES, COUNTERS
+
+class Command(BaseCommand):
+  args = '<runid> [runid ...]'
+  help = 'Shows where the time of each scraper run went: count, total, mean, percentiles and max of each phase (fetch, parse, normalize, ingest, commit, refresh, index; each timing excludes the phases timed inside it, so the totals add up), and the pages, bytes and sections counted.'
+
+  def handle(self, *args, **options):
+    if not args:
+      raise CommandError('Usage: manage.py run_metrics %s' % self.args)
+    r = redis.Redis(settings.REDIS_HOST)
+    for runid in args:
+      keys = sorted(r.keys('runlog:%s:*:metrics' % runid) or ())
+      if not keys:
+        raise CommandError('No metrics for run %s' % runid)
+      for key in keys:
+        network, session = key.split(':')[2:4]
+        metrics = RunMetrics.load(r, key)
+        print "run %s, %s %s: %s" % (runid, network, session,
+            ", ".join("%s %s" % (metrics.fields.get(counter, 0), counter) for counter in COUNTERS))
+        print "  %-10s %8s %10s %10s %10s %10s %10s %10s" % ('phase', 'count', 'total s', 'mean ms', 'p50 ms', 'p90 ms', 'p99 ms', 'max ms')
+        for phase in PHASES:
+          stats = metrics.phase(phase)
+          if stats is None:
+            continue
+          print "  %-10s %8s %10.1f %10.2f %10.2f %10.2f %10.2f %10.2f" % (phase, stats['count'], stats['seconds'],
+              stats['mean'] * 1000, stats['p50'] * 1000, stats['p90'] * 1000, stats['p99'] * 1000, stats['max'] * 1000)
@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand, CommandError
+from optparse import make_option
+
+from networks import network
+
+class Command(BaseCommand):
+  args = '<network> <budget>'
+  help = 'Prints the subjects worth refreshing now in a network\'s active sessions within a budget of <budget> sections, most valuable first; --run scrapes them.'
+  option_list = BaseCommand.option_list + (
+    make_option('--run', dest='run', action='store_true', default=False, help='Scrape the plan (with skip_unchanged, so change rates keep being learnt).'),
+  )
+
+  def handle(self, *args, **options):
+    if len(args) != 2:
+      raise CommandError('Usage: manage.py scrape_plan %s' % self.args)
+    if args[0] not in network.registered():
+      raise CommandError('No scraper registered for %s' % args[0])
+    try:
+      budget = int(args[1])
+    except ValueError:
+      raise CommandError('The budget is a number of sections')
+
+    work = network.plan(args[0], budget)
+    for item in work:
+      print "%-12s %-16s %6s sections  priority %.3f" % (item['session'].slug,
+          item['subject'] or '(all)', item['cost'], item['priority'])
+    print "%s items, %s of %s sections" % (len(work), sum(item['cost'] for item in work), budget)
+    if options['run']:
+      network.run_planned(args[0], budget, skip_unchanged=True)
@@ -0,0 +1,43 @@
+from django.core.management.base import BaseCommand, CommandError
+from optparse import make_option
+
+from networks import network
+from networks.workqueue import WorkQueue, LEASE_SECONDS
+
+class Command(BaseCommand):
+  args = 'enqueue <network> [session] | work | status [runid ...]'
+  help = 'Splits scrapes into subject (or page batch) tasks on the redis work queue, works the queue, or shows how far each job has got.'
+  option_list = BaseCommand.option_list + (
+    make_option('--sweep', dest='sweep', action='store_true', default=False, help='enqueue: retire what the finished job never saw.'),
+    make_option('--skip-unchanged', dest='skip_unchanged', action='store_true', default=False),
+    make_option('--batch-size', dest='batch_size', type='int', default=None),
+    make_option('--wait', dest='wait', action='store_true', default=False, help='work: keep polling once the queue is empty.'),
+    make_option('--poll', dest='poll', type='int', default=10, help='work: seconds between polls with --wait.'),
+    make_option('--lease', dest='lease', type='int', default=LEASE_SECONDS, help='work: seconds a task stays taken without a heartbeat.'),
+  )
+
+  def handle(self, *args, **options):
+    if not args or args[0] not in ('enqueue', 'work', 'status'):
+      raise CommandError('Usage: manage.py scrape_queue %s' % self.args)
+    if args[0] == 'enqueue':
+      if len(args) not in (2, 3):
+        raise CommandError('Usage: manage.py scrape_queue enqueue <network> [session]')
+      if args[1] not in network.registered():
+        raise CommandError('No scraper registered for %s' % args[1])
+      kwargs = dict((k, options[k]) for k in ('sweep', 'skip_unchanged', 'batch_size') if options[k])
+      network.enqueue(args[1], args[2] if len(args) == 3 else None, **kwargs)
+    elif args[0] == 'work':
+      network.work(lease=options['lease'], wait=options['wait'], poll=options['poll'])
+    else:
+      queue = WorkQueue()
+      for runid in args[1:] or queue.jobs():
+        progress = queue.progress(runid)
+        if progress['network'] is None:
+          raise CommandError('No job %s' % runid)
+        print "run %s, %s %s: %s of %s tasks done, %s active, %s pending, %s failed" % (runid,
+            progress['network'], progress['session'], progress['done'], progress['total'],
+            progress['active'], progress['pending'], progress['failed'])
+        if progress['workers']:
+          print "  workers: %s" % ", ".join(progress['workers'])
+        for task, error in queue.failed(runid).items():
+          print "  failed %s: %s" % (task, error)
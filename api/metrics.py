@@ -0,0 +1,119 @@
+import math, threading, time
+
+PHASES = ('fetch', 'parse', 'normalize', 'ingest', 'commit', 'refresh', 'index')
+COUNTERS = ('pages', 'bytes', 'bytes_decoded', 'sections')
+STEPS = 4 # histogram buckets per doubling of microseconds, so each is ~19% wide
+
+class RunMetrics(object):
+  """
+  Per-phase timings and counters of a scraper run, cheap enough to leave on.
+
+  record() drops each timing into a log-scale histogram of the phase, and keeps
+  its count and total; count() adds to a counter. Everything is a plain sum, so
+  save() adds it to the run's redis hash and runs done in pieces by several
+  workers (networks.workqueue) add up. Fields: <phase>:count, <phase>:us (total
+  microseconds), <phase>:<bucket> (see bucket()) and each counter by name.
+  Safe to use from worker threads.
+
+  Phases don't overlap: time a thread spends in a phase timed inside another
+  (normalize, the clean() calls the writes make, inside ingest) is taken out of
+  the outer one's, so each timing is what that phase alone cost and the totals
+  add up. Each phase is timed per unit of its work: a page fetched or parsed, a
+  course or a batch written (ingest), a commit, a batch of seats refreshed.
+  """
+  def __init__(self, fields=None):
+    self.fields = fields or {}
+    self.lock = threading.Lock()
+    self.local = threading.local()
+
+  ##
+  # Begin timing something on this thread; pass what it returns to stop().
+  def start(self):
+    return time.time(), getattr(self.local, 'spent', 0.0)
+
+  ##
+  # Record the time since @started as @phase, less whatever phases were recorded
+  # on this thread in the meantime.
+  def stop(self, phase, started):
+    start, spent = started
+    elapsed = time.time() - start
+    self._add(phase, elapsed - (getattr(self.local, 'spent', 0.0) - spent))
+    self.local.spent = spent + elapsed
+
+  def record(self, phase, seconds):
+    self.local.spent = getattr(self.local, 'spent', 0.0) + seconds
+    self._add(phase, seconds)
+
+  def _add(self, phase, seconds):
+    us = int(max(seconds, 0) * 1e6)
+    self.lock.acquire()
+    try:
+      for field, value in (('%s:count' % phase, 1), ('%s:us' % phase, us), ('%s:%s' % (phase, bucket(us)), 1)):
+        self.fields[field] = self.fields.get(field, 0) + value
+    finally:
+      self.lock.release()
+
+  def count(self, counter, value=1):
+    self.lock.acquire()
+    try:
+      self.fields[counter] = self.fields.get(counter, 0) + value
+    finally:
+      self.lock.release()
+
+  def save(self, conn, key):
+    pipe = conn.pipeline()
+    for field, value in self.fields.items():
+      if value:
+        pipe.hincrby(key, field, value)
+    pipe.execute()
+
+  @classmethod
+  def load(cls, conn, key):
+    return cls(dict((field, int(value)) for field, value in (conn.hgetall(key) or {}).items()))
+
+  ##
+  # {count, seconds, mean, p50, p90, p99, max} of @phase (seconds), or None if it
+  # never ran; percentiles are the middle of the bucket they fall in.
+  def phase(self, phase, percentiles=(50, 90, 99)):
+    count = self.fields.get('%s:count' % phase, 0)
+    if not count:
+      return None
+    prefix = '%s:' % phase
+    buckets = sorted((int(field[len(prefix):]), value) for field, value in self.fields.items()
+        if field.startswith(prefix) and field[len(prefix):].isdigit())
+    seconds = self.fields.get('%s:us' % phase, 0) / 1e6
+    stats = {'count': count, 'seconds': seconds, 'mean': seconds / count, 'max': upper(buckets[-1][0])}
+    for p in percentiles:
+      rank = math.ceil(count * p / 100.0)
+      seen = 0
+      for b, value in buckets:
+        seen += value
+        if seen >= rank:
+          stats['p%s' % p] = middle(b)
+          break
+    return stats
+
+##
+# fn(*args), timed as @phase in @metrics if there are any.
+def timed(metrics, phase, fn, *args):
+  if metrics is None:
+    return fn(*args)
+  started = metrics.start()
+  try:
+    return fn(*args)
+  finally:
+    metrics.stop(phase, started)
+
+##
+# Histogram bucket of a timing of @us microseconds: bucket b holds timings from
+# 2 ** (b / STEPS) up to 2 ** ((b + 1) / STEPS) us; 0 takes anything under 1us.
+def bucket(us):
+  if us <= 1:
+    return 0
+  return int(STEPS * math.log(us, 2))
+
+def middle(b):
+  return 2 ** ((b + 0.5) / STEPS) / 1e6
+
+def upper(b):
+  return 2 ** ((b + 1.0) / STEPS) / 1e6
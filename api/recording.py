@@ -0,0 +1,50 @@
+from django.conf import settings
+import gzip, json
+
+def recording_path(network, session, part=None):
+  path = getattr(settings, 'RECORD_ROOT', settings.LOG_ROOT) + '%s_%s_sections.jsonl.gz' % (network, session)
+  return part_path(path, part) if part else path
+
+##
+# @path for one @part of a run: foo.jsonl.gz becomes foo.<part>.jsonl.gz.
+def part_path(path, part):
+  if '.jsonl' in path:
+    return path.replace('.jsonl', '.%s.jsonl' % part, 1)
+  return '%s.%s' % (path, part)
+
+class SectionRecorder(object):
+  """
+  Writes every section_data a scraper produces to a gzipped JSONL file, one
+  payload per line, so the run can later be replayed through the ingest path
+  without touching the registrar (see scrapers.replay.ReplayScraper).
+
+  The file is opened on the first write: replaced, or with append=True (a resumed
+  run) added to as another gzip member, which read_recording reads straight on.
+  """
+  def __init__(self, path, append=False):
+    self.path = path
+    self.append = append
+    self.f = None
+    self.recorded = 0
+
+  def write(self, data):
+    if self.f is None:
+      self.f = gzip.open(self.path, 'ab' if self.append else 'wb')
+    self.f.write(json.dumps(data, sort_keys=True, default=unicode) + '\n')
+    self.recorded += 1
+
+  def close(self):
+    if self.f is None:
+      # an empty run still leaves an (empty) recording behind
+      self.f = gzip.open(self.path, 'ab' if self.append else 'wb')
+    if not self.f.closed:
+      self.f.close()
+
+def read_recording(path):
+  f = gzip.open(path, 'rb') if path.endswith('.gz') else open(path)
+  try:
+    for line in f:
+      if line.strip():
+        yield json.loads(line)
+  finally:
+    f.close()
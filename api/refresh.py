@@ -0,0 +1,102 @@
+from haystack import site
+from haystack.query import SearchQuerySet
+import json
+
+from api.db import bulk_update, chunks
+from api.normalize import clean
+from courses.models import Course, Section, summarize_status
+
+##
+# Fast path for registration weeks, when the only thing moving is enrollment.
+#
+# Rows are (reference_code, status, seats_capacity, seats_taken, seats_available,
+# waitlist_capacity, waitlist_taken, waitlist_available). Only sections whose values
+# actually changed are written, with one UPDATE per distinct set of changes, and
+# their courses are reindexed with the stored JSON document patched in place
+# instead of rendered again through Course.prepare_json(), and the stored search
+# text reused as it is (nothing in it depends on seats).
+#
+# Pass the run's SectionFingerprints as @fingerprints: the digests of the sections
+# changed here no longer describe what is in the database, so they are dropped, and
+# the next full run writes those sections again instead of skipping them.
+
+SEAT_FIELDS = ('status', 'seats_capacity', 'seats_taken', 'seats_available',
+    'waitlist_capacity', 'waitlist_taken', 'waitlist_available')
+
+def seat_row(data):
+  return tuple([data['reference_code']] + [data.get(field) for field in SEAT_FIELDS])
+
+def seat_values(values):
+  cleaned = {}
+  for name, value in zip(SEAT_FIELDS, values):
+    field = Section._meta.get_field(name)
+    value = field.to_python(clean(value))
+    if value is None and not field.null:
+      raise ValueError("%s can't be empty" % name)
+    cleaned[name] = value
+  return cleaned
+
+def refresh_seats(network, session, rows, log_error=None, fingerprints=None):
+  stats = {'sections': 0, 'changed': 0, 'missing': 0, 'courses': 0, 'errors': 0}
+  wanted = {}
+  for row in rows:
+    stats['sections'] += 1
+    try:
+      wanted['%s' % row[0]] = seat_values(row[1:])
+    except Exception, e:
+      stats['errors'] += 1
+      if log_error:
+        log_error("%s:\n%s\n\n" % (e, row))
+
+  found = set()
+  updates = []
+  changed = {}
+  for codes in chunks(wanted.keys(), 500):
+    qs = Section.objects.filter(network=network, course__session=session, reference_code__in=codes)
+    for row in qs.values_list('id', 'reference_code', 'course', *SEAT_FIELDS):
+      id, code, course_id = row[:3]
+      found.add(code)
+      values = wanted[code]
+      fields = [name for name, current in zip(SEAT_FIELDS, row[3:]) if values[name] != current]
+      if fields:
+        section = Section(id=id, course_id=course_id, reference_code=code, **values)
+        updates.append((section, fields))
+        changed[id] = section
+  bulk_update(Section, updates)
+  if fingerprints:
+    fingerprints.forget(*[section.reference_code for section in changed.values()])
+
+  courses = set(section.course_id for section in changed.values())
+  reindex_patched(courses, changed)
+  stats['missing'] = len(set(wanted.keys()) - found)
+  stats['changed'] = len(changed)
+  stats['courses'] = len(courses)
+  return stats
+
+##
+# Reindex @course_ids, reusing each course's stored JSON with the sections in
+# @sections ({id: Section}) patched in, and its stored text. Courses the index has
+# no document for fall back to a full Course.prepare_json() and template render.
+def reindex_patched(course_ids, sections):
+  index = site.get_index(Course)
+  for ids in chunks(sorted(course_ids), 500):
+    documents = {}
+    for result in SearchQuerySet().models(Course).filter(django_id__in=ids):
+      documents[int(result.pk)] = result
+    courses = list(Course.objects.filter(id__in=ids))
+    for course in courses:
+      document = documents.get(course.id)
+      if document and document.json:
+        course.patched_json = patch_json(course, document.json, sections)
+        course.patched_text = getattr(document, 'text', None)
+    index.backend.update(index, courses)
+
+def patch_json(course, document, sections):
+  data = json.loads(document)
+  for entry in data['sections']:
+    if entry['id'] in sections:
+      entry['status'] = sections[entry['id']].prepare_status()
+  data['status'] = summarize_status([entry['status']['label'] for entry in data['sections']])
+  data['available_stats'].update(course.get_available_stats(data['sections'],
+      ['status.label', 'status.seats', 'status.waitlist']))
+  return json.dumps(data)
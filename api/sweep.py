@@ -0,0 +1,74 @@
+from django.utils.encoding import smart_unicode
+import json
+
+from api.db import bulk_delete, reindex, unindex
+from api.helpers import dimension_names
+from api.ingest import update_profs
+from courses.models import Course, Section, Meeting
+
+def sweep_session(network, session, seen, fingerprints=None, indexer=None):
+  """
+  Retire everything a complete scrape of @session did not see: sections whose
+  key (see section_key) is not in @seen, with their meetings, then courses left
+  with no sections. A section that moved to another course keeps its reference
+  code under a new course, so the row under the old one is retired. A bare
+  reference code in @seen keeps every section with that code. Search documents of the deleted courses are removed; courses
+  that only lost some sections get their profs rebuilt and are reindexed
+  (through @indexer when it is running). @fingerprints, if given, forgets the
+  retired sections.
+
+  Only call this after a full run: anything the scraper didn't reach is deleted.
+  Returns {'sections': n, 'courses': n}.
+  """
+  seen = set('%s' % key for key in seen)
+  codes = set(key for key in seen if not key.startswith('['))
+  stale = {}
+  affected = set()
+  qs = Section.objects.filter(network=network, course__session=session)
+  for row in qs.values_list('id', 'reference_code', 'course', 'course__classification__code',
+      'course__classification__name', 'course__number', 'course__college__name', 'course__level__name'):
+    id, reference_code, course_id = row[:3]
+    if reference_code not in codes and _key(reference_code, *row[3:]) not in seen:
+      stale[id] = reference_code
+      affected.add(course_id)
+  if not stale:
+    return {'sections': 0, 'courses': 0}
+
+  bulk_delete(Meeting, stale.keys(), field='section')
+  bulk_delete(Section, stale.keys())
+
+  alive = set(Section.objects.filter(course__in=affected).values_list('course', flat=True).distinct())
+  empty = affected - alive
+  bulk_delete(Course, empty)
+  unindex(Course, empty)
+
+  update_profs(Course.objects.filter(id__in=alive))
+  if indexer and indexer.active:
+    indexer.mark(*alive)
+  else:
+    reindex(Course, alive)
+
+  if fingerprints:
+    fingerprints.forget(*stale.values())
+  return {'sections': len(stale), 'courses': len(empty)}
+
+##
+# What sweep_session knows a section by: its reference code and its course's
+# natural key (classification code and name, number, college, level), named the
+# way the writes store them, the same key ingest matches sections on. A run that
+# only knows a section's reference code (a page skipped as unchanged, a section
+# an earlier attempt wrote) passes the bare code instead.
+def section_key(data):
+  names = dimension_names(data)
+  return _key(data['reference_code'], data['classification'], names['classification_name'],
+      data['number'], names['college'], names['level'])
+
+##
+# The reference code of a section_key, or of a bare code.
+def key_code(key):
+  if key.startswith('['):
+    return '%s' % json.loads(key)[0]
+  return key
+
+def _key(*values):
+  return json.dumps([smart_unicode(value) if value not in (None, '') else None for value in values])
@@ -158,13 +158,7 @@ class Course(models.Model):
     })
   
   def get_status(self):
-    statuses = self.sections.values_list('status', flat=True).distinct()
-    if "Open" in statuses:
-      return "Open"
-    elif "Wait List" in statuses:
-      return "Wait List"
-    else:
-      return "Closed"
+    return summarize_status(self.sections.values_list('status', flat=True).distinct())
   
   def prepare_json(self):
     data = {
@@ -189,19 +183,7 @@ class Course(models.Model):
           'reference_code': section.reference_code,
           'number': section.number,
           'name': section.name.strip(),
-          'status': {
-            'label': section.status,
-            'seats': {
-              'total': section.seats_capacity,
-              'taken': section.seats_taken,
-              'available': section.seats_available
-            } if section.seats_taken else None,
-            'waitlist': {
-              'total': section.waitlist_capacity,
-              'taken': section.waitlist_taken,
-              'available': section.waitlist_available
-            } if section.waitlist_capacity or section.waitlist_taken else None
-          },
+          'status': section.prepare_status(),
           'component': section.component,
           'prof': section.prof,
           'units': section.units,
@@ -218,18 +200,20 @@ class Course(models.Model):
         } for section in self.sections.all()
       ]
     }
+    data['available_stats'] = self.get_available_stats(data['sections'])
     
+    return json.dumps(data)
+  
+  def get_available_stats(self, sections, fields=None):
     available_stats = {}
-    for field in ['number', 'name', 'status.label', 'status.seats', 'status.waitlist',
+    for field in fields or ['number', 'name', 'status.label', 'status.seats', 'status.waitlist',
                     'component', 'prof', 'units', 'notes', 'meets.day', 'meets.start',
                     'meets.end', 'meets.location', 'meets.room', 'component']:
       available_stats[field] = False
-      for section in data['sections']:
+      for section in sections:
         if self.get_attr(section, field):
           available_stats[field] = True
-    data['available_stats'] = available_stats
-    
-    return json.dumps(data)
+    return available_stats
   
   def get_attr(self, section, attribute_string):
     obj = section
@@ -257,6 +241,16 @@ class Course(models.Model):
     return " ".join(desc_bits)
 
 
+##
+# A course is as open as its most open section.
+def summarize_status(statuses):
+  if "Open" in statuses:
+    return "Open"
+  elif "Wait List" in statuses:
+    return "Wait List"
+  else:
+    return "Closed"
+
 ORDERED_DAYS = ('Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun', 'TBA', '')
 class Section(models.Model):
   updated_at = models.DateTimeField(default=datetime.datetime.now())
@@ -313,6 +307,23 @@ class Section(models.Model):
   def get_profs(self):
     return self.prof.split(', ')
   
+  ##
+  # The 'status' entry of this section in Course.prepare_json()
+  def prepare_status(self):
+    return {
+      'label': self.status,
+      'seats': {
+        'total': self.seats_capacity,
+        'taken': self.seats_taken,
+        'available': self.seats_available
+      } if self.seats_taken else None,
+      'waitlist': {
+        'total': self.waitlist_capacity,
+        'taken': self.waitlist_taken,
+        'available': self.waitlist_available
+      } if self.waitlist_capacity or self.waitlist_taken else None
+    }
+  
   ##
   # See Course.smart_description()
   # If this section's note is being used as the course's description, don't display a note.
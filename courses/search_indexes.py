@@ -7,8 +7,19 @@ from django.template.defaultfilters import slugify
 
 from courses.models import Course, Session
 
+class StoredTextField(CharField):
+  """
+  A template field whose render api.refresh can skip, handing over the text
+  already in the index as obj.patched_<field name>.
+  """
+  def prepare(self, obj):
+    stored = getattr(obj, 'patched_%s' % self.instance_name, None)
+    if stored is not None:
+      return stored
+    return super(StoredTextField, self).prepare(obj)
+
 class CourseIndex(RealTimeSearchIndex):
-  text = CharField(document=True, use_template=True)
+  text = StoredTextField(document=True, use_template=True)
   json = CharField(indexed=False)
   
   network = FacetCharField(model_attr='network')
@@ -49,6 +60,10 @@ class CourseIndex(RealTimeSearchIndex):
     return [section.prof for section in obj.sections.all()]
   
   def prepare_json(self, obj):
+    # api.refresh hands over an already patched document instead of a full re-render
+    patched = getattr(obj, 'patched_json', None)
+    if patched:
+      return patched
     return obj.prepare_json()
     """
     data = {
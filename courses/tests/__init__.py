@@ -0,0 +1,12 @@
+from courses.tests.normalize import *
+from courses.tests.metrics import *
+from courses.tests.db import *
+from courses.tests.dimensions import *
+from courses.tests.coalesce import *
+from courses.tests.commits import *
+from courses.tests.indexing import *
+from courses.tests.meetings import *
+from courses.tests.fingerprints import *
+from courses.tests.refresh import *
+from courses.tests.sweep import *
+from courses.tests.archive import *
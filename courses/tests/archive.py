@@ -0,0 +1,82 @@
+from django.db import transaction
+from django.test import TransactionTestCase
+import datetime, json, os, pickle, shutil, tempfile
+
+from api import archive, indexing
+from api.archive import archive_outline, import_archives
+from courses.models import Institution, Session, Course, Section
+from networks.models import Network
+
+def legacy_records(count, offset=0):
+  records = {}
+  for i in range(count):
+    records['%s' % (5000 + offset + i)] = {'classification': 'HIST-UA' if i % 4 else 'MATH-UA',
+        'number': 200 + offset + i // 2, 'college': 'CAS', 'level': 'Undergraduate', 'section': '%03d' % (i % 2),
+        'course_name': 'Course %s' % (offset + i // 2), 'grading': 'A-F', 'is_open': True, 'units': '4 units',
+        'meet_data': '09/06/2011 - 12/23/2011 Tue,Thu 2.00 PM - 3.15 PM at SILV 206 with Jane Doe'}
+  return records
+
+class ArchiveTest(TransactionTestCase):
+  def setUp(self):
+    institution = Institution.objects.create(slug='nyu', name='NYU')
+    Network.objects.create(slug='nyu', institution=institution, name='NYU', abbr='NYU', active=True)
+    self.session = Session.objects.create(network=Network.objects.get(slug='nyu'), name='Fall', slug='fall',
+        start_date=datetime.date(2011, 9, 1), end_date=datetime.date(2011, 12, 1), system_code='1', active=True)
+    self.root = tempfile.mkdtemp()
+    self.reindex = indexing.reindex
+    self.legacy_section = archive.legacy_section
+
+  def tearDown(self):
+    indexing.reindex = self.reindex
+    archive.legacy_section = self.legacy_section
+    shutil.rmtree(self.root)
+
+  def write_pickle(self, name, records):
+    path = os.path.join(self.root, name)
+    f = open(path, 'wb')
+    pickle.dump(records, f)
+    f.close()
+    return path
+
+  def write_recording(self, name, payloads):
+    path = os.path.join(self.root, name)
+    f = open(path, 'w')
+    f.write(''.join(json.dumps(data) + '\n' for data in payloads))
+    f.close()
+    return path
+
+  def test_outline_keeps_one_payload_per_dimension(self):
+    converted = []
+    def legacy_section(id, c):
+      converted.append(id)
+      return self.legacy_section(id, c)
+    archive.legacy_section = legacy_section
+    records = legacy_records(20)
+    payloads, courses = archive_outline(self.write_pickle('LINK0.txt', records), 'nyu', 'nyu', self.session.id)
+    self.assertEqual(sorted((data['classification'], data['session']) for data in payloads),
+        [('HIST-UA', self.session.id), ('MATH-UA', self.session.id)])
+    self.assertEqual(len(converted), 2)
+    self.assertEqual(courses, set((c['classification'], str(c['number'])) for c in records.values()))
+
+  def test_outline_of_a_recording(self):
+    payloads = [self.legacy_section(id, c) for id, c in sorted(legacy_records(8).items())]
+    outline, courses = archive_outline(self.write_recording('rec.jsonl', payloads), 'nyu', 'nyu', self.session.id)
+    self.assertEqual(len(outline), 2)
+    self.assertEqual(courses, set((data['classification'], data['number']) for data in payloads))
+
+  def test_import_reindexes_after_commit(self):
+    managed = []
+    def reindex(model, ids):
+      managed.append(transaction.is_managed())
+      return self.reindex(model, ids)
+    indexing.reindex = reindex
+    paths = [self.write_pickle('LINK0.txt', legacy_records(20)), self.write_pickle('LINK1.txt', legacy_records(10, 100)),
+        os.path.join(self.root, 'broken.txt')]
+    open(paths[-1], 'w').write('{garbage\n')
+    results = import_archives(paths, 'nyu', 'nyu', self.session.id, processes=1, batch_size=8)
+    self.assertEqual(sorted((os.path.basename(r['path']), r['sections'], len(r['errors'])) for r in results),
+        [('LINK0.txt', 20, 0), ('LINK1.txt', 10, 0), ('broken.txt', 0, 1)])
+    courses = set((c['classification'], c['number']) for c in legacy_records(20).values() + legacy_records(10, 100).values())
+    self.assertEqual((Section.objects.count(), Course.objects.count()), (30, len(courses)))
+    self.assertTrue(managed)
+    self.assertFalse(True in managed)
@@ -0,0 +1,56 @@
+from django.db.models import signals
+from django.test import TestCase
+import datetime
+
+from courses.models import Institution, Session, Course, Section
+from courses.tests.sweep import payload
+from networks.models import Network
+from scrapers.general import Scraper
+
+class CoalesceTest(TestCase):
+  def setUp(self):
+    institution = Institution.objects.create(slug='nyu', name='NYU')
+    Network.objects.create(slug='nyu', institution=institution, name='NYU', abbr='NYU', active=True)
+    self.session = Session.objects.create(network=Network.objects.get(slug='nyu'), name='Fall', slug='fall',
+        start_date=datetime.date(2011, 9, 1), end_date=datetime.date(2011, 12, 1), system_code='1', active=True)
+    self.saves = []
+    signals.post_save.connect(self.saved, sender=Course)
+
+  def tearDown(self):
+    signals.post_save.disconnect(self.saved, sender=Course)
+
+  def saved(self, instance, **kwargs):
+    self.saves.append(instance.number)
+
+  def sections(self):
+    return sorted(Section.objects.values_list('course__number', 'reference_code'))
+
+  def test_course_is_written_once_it_is_complete(self):
+    scraper = Scraper(network='nyu', session=self.session)
+    scraper.create_section(payload(self.session, '101', '1001', prof='Ann'))
+    scraper.create_section(payload(self.session, '101', '1002', prof='Bob'))
+    self.assertEqual(self.sections(), [])
+    scraper.create_section(payload(self.session, '102', '1003'))
+    self.assertEqual(self.sections(), [(u'101', u'1001'), (u'101', u'1002')])
+    scraper.finish()
+    self.assertEqual(len(self.sections()), 3)
+    # created, then saved once with both sections' profs
+    self.assertEqual(self.saves.count('101'), 2)
+    self.assertEqual(sorted(Course.objects.get(number='101').profs.split()), [u'Ann', u'Bob'])
+
+  def test_without_coalescing_each_section_is_written(self):
+    scraper = Scraper(network='nyu', session=self.session, coalesce=False)
+    scraper.create_section(payload(self.session, '101', '1001'))
+    self.assertEqual(self.sections(), [(u'101', u'1001')])
+    scraper.create_section(payload(self.session, '101', '1002'))
+    scraper.finish()
+    self.assertEqual(self.saves.count('101'), 3)
+
+  def test_a_bad_section_costs_only_itself(self):
+    scraper = Scraper(network='nyu', session=self.session)
+    scraper.create_section(payload(self.session, '101', '1001'))
+    scraper.create_section(payload(self.session, '101', '1002', meetings=[{'day': 'X'}]))
+    scraper.create_section(payload(self.session, '101', '1003'))
+    scraper.finish()
+    self.assertEqual(self.sections(), [(u'101', u'1001'), (u'101', u'1003')])
+    self.assertEqual(scraper.errors, 1)
@@ -0,0 +1,54 @@
+from django.db import transaction
+from django.test import TransactionTestCase
+import datetime
+
+from courses.models import Institution, Session, Section
+from courses.tests.sweep import payload
+from networks.models import Network
+from scrapers.general import Scraper
+
+class ChunkedCommitTest(TransactionTestCase):
+  def setUp(self):
+    institution = Institution.objects.create(slug='nyu', name='NYU')
+    Network.objects.create(slug='nyu', institution=institution, name='NYU', abbr='NYU', active=True)
+    self.session = Session.objects.create(network=Network.objects.get(slug='nyu'), name='Fall', slug='fall',
+        start_date=datetime.date(2011, 9, 1), end_date=datetime.date(2011, 12, 1), system_code='1', active=True)
+
+  def scraper(self, **kwargs):
+    scraper = Scraper(network='nyu', session=self.session, **kwargs)
+    scraper.commits = []
+    commit = scraper._commit
+    def counting_commit():
+      if scraper._in_transaction:
+        scraper.commits.append(Section.objects.count())
+      commit()
+    scraper._commit = counting_commit
+    return scraper
+
+  def test_commits_every_n_sections(self):
+    scraper = self.scraper(commit_every=2)
+    for i in range(5):
+      scraper.create_section(payload(self.session, '%s' % (101 + i), '%s' % (1001 + i)))
+    self.assertTrue(transaction.is_managed())
+    scraper.finish()
+    self.assertFalse(transaction.is_managed())
+    self.assertEqual(scraper.commits, [2, 4, 5])
+
+  def test_commits_every_t_seconds(self):
+    scraper = self.scraper(commit_seconds=60)
+    for i in range(3):
+      scraper.create_section(payload(self.session, '%s' % (101 + i), '%s' % (1001 + i)))
+    self.assertEqual(scraper.commits, [])
+    scraper._last_commit -= 61
+    scraper.create_section(payload(self.session, '104', '1004'))
+    self.assertEqual(scraper.commits, [3])
+    scraper.finish()
+    self.assertEqual(scraper.commits, [3, 4])
+
+  def test_autocommit_without_options(self):
+    scraper = self.scraper()
+    scraper.create_section(payload(self.session, '101', '1001'))
+    scraper.create_section(payload(self.session, '102', '1002'))
+    self.assertFalse(transaction.is_managed())
+    scraper.finish()
+    self.assertEqual((scraper.commits, Section.objects.count()), ([], 2))
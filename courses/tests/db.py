@@ -0,0 +1,52 @@
+from django.test import TestCase
+import datetime
+
+from api.db import changed_fields, field_values, bulk_insert, bulk_update, bulk_delete
+from api.helpers import create_course_sections
+from courses.models import Institution, Session, Section, Meeting
+from courses.tests.sweep import payload
+from networks.models import Network
+
+class BulkWriteTest(TestCase):
+  def setUp(self):
+    institution = Institution.objects.create(slug='nyu', name='NYU')
+    network = Network.objects.create(slug='nyu', institution=institution, name='NYU', abbr='NYU', active=True)
+    session = Session.objects.create(network=network, name='Fall', slug='fall',
+        start_date=datetime.date(2011, 9, 1), end_date=datetime.date(2011, 12, 1), system_code='1', active=True)
+    create_course_sections([payload(session, '101', '%s' % (1001 + i)) for i in range(4)])
+    self.sections = list(Section.objects.order_by('reference_code'))
+
+  def test_insert_is_one_statement(self):
+    meetings = [Meeting(section=section, day=day, location='SILV', room='206')
+        for section in self.sections for day in ('Mon', 'Wed')]
+    self.assertNumQueries(1, bulk_insert, Meeting, meetings)
+    self.assertEqual(sorted(Meeting.objects.values_list('section__reference_code', 'day')),
+        sorted((section.reference_code, day) for section in self.sections for day in (u'Mon', u'Wed')))
+    self.assertNumQueries(0, bulk_insert, Meeting, [])
+
+  def test_changed_fields_compares_stored_values(self):
+    section = self.sections[0]
+    original = field_values(section)
+    section.seats_capacity, section.status = u'30', 'Open'
+    self.assertEqual(changed_fields(section, original), [])
+    section.seats_capacity, section.status = 40, 'Closed'
+    self.assertEqual(changed_fields(section, original), ['status', 'seats_capacity'])
+
+  def test_identical_changes_share_an_update(self):
+    for section in self.sections:
+      section.status = 'Closed'
+    self.sections[0].seats_taken = 30
+    updates = [(section, ['status']) for section in self.sections[1:]]
+    updates += [(self.sections[0], ['status', 'seats_taken']), (self.sections[1], [])]
+    self.assertNumQueries(2, bulk_update, Section, updates)
+    self.assertEqual(sorted(Section.objects.values_list('reference_code', 'status', 'seats_taken')),
+        [(u'1001', u'Closed', 30), (u'1002', u'Closed', 10), (u'1003', u'Closed', 10), (u'1004', u'Closed', 10)])
+
+  def test_delete_by_field_in_chunks(self):
+    bulk_insert(Meeting, [Meeting(section=section, day='Mon') for section in self.sections])
+    bulk_delete(Meeting, [section.id for section in self.sections[:3]], field='section')
+    self.assertEqual(list(Meeting.objects.values_list('section', flat=True)), [self.sections[3].id])
+    codes = [section.reference_code for section in self.sections[:2]] + ['%s' % i for i in range(600)]
+    self.assertNumQueries(2, bulk_delete, Section, codes, field='reference_code')
+    self.assertEqual([section.reference_code for section in Section.objects.order_by('reference_code')],
+        [u'1003', u'1004'])
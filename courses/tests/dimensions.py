@@ -0,0 +1,44 @@
+from django.test import TestCase
+import datetime
+
+from api.dimensions import DimensionCache
+from api.helpers import create_course_sections
+from courses.models import Institution, Session, Classification, College, Level
+from courses.tests.sweep import payload
+from networks.models import Network
+
+class DimensionCacheTest(TestCase):
+  def setUp(self):
+    self.institution = Institution.objects.create(slug='nyu', name='NYU')
+    self.network = Network.objects.create(slug='nyu', institution=self.institution, name='NYU', abbr='NYU', active=True)
+    self.session = Session.objects.create(network=self.network, name='Fall', slug='fall',
+        start_date=datetime.date(2011, 9, 1), end_date=datetime.date(2011, 12, 1), system_code='1', active=True)
+    self.cache = DimensionCache()
+
+  def test_rows_are_looked_up_once_per_run(self):
+    self.assertNumQueries(1, self.cache.get, Network, slug='nyu')
+    self.assertNumQueries(0, self.cache.get, Network, slug='nyu')
+    self.cache.prime(self.session, id=self.session.id)
+    self.assertNumQueries(0, self.cache.get, Session, id=self.session.id)
+    self.assertEqual((self.cache.hits, self.cache.misses), (2, 1))
+
+  def test_later_courses_reuse_the_dimensions(self):
+    create_course_sections([payload(self.session, '101', '1001', level='Undergraduate')], self.cache)
+    misses = self.cache.misses
+    create_course_sections([payload(self.session, '102', '1002', level='Undergraduate')], self.cache)
+    self.assertEqual(self.cache.misses, misses)
+    self.assertEqual((Classification.objects.count(), College.objects.count(), Level.objects.count()), (1, 1, 1))
+    self.assertEqual(list(self.session.classifications.values_list('code', flat=True)), [u'BIO-UA'])
+
+  def test_session_links_are_added_once(self):
+    level = Level.objects.create(network=self.network, institution=self.institution, name='Graduate')
+    self.cache.link(self.session, 'levels', level)
+    self.assertNumQueries(0, self.cache.link, self.session, 'levels', level)
+    self.assertEqual(list(self.session.levels.all()), [level])
+
+  def test_reset_keeps_only_the_run_rows(self):
+    level = self.cache.get_or_create(Level, network=self.network, institution=self.institution, name='Graduate')
+    self.cache.get(Network, slug='nyu')
+    self.cache.reset()
+    self.assertNumQueries(0, self.cache.get, Network, slug='nyu')
+    self.assertNumQueries(1, self.cache.get_or_create, Level, network=self.network, institution=self.institution, name='Graduate')
@@ -0,0 +1,88 @@
+from django.test import TestCase
+import datetime
+
+from api.fingerprints import SectionFingerprints, fingerprint
+from courses.models import Institution, Session, Section
+from courses.tests.sweep import payload
+from networks.models import Network
+from networks.tests.workqueue import MemoryRedis
+from scrapers.general import Scraper
+
+class FingerprintsTest(TestCase):
+  def setUp(self):
+    institution = Institution.objects.create(slug='nyu', name='NYU')
+    network = Network.objects.create(slug='nyu', institution=institution, name='NYU', abbr='NYU', active=True)
+    self.session = Session.objects.create(network=network, name='Fall', slug='fall',
+        start_date=datetime.date(2011, 9, 1), end_date=datetime.date(2011, 12, 1), system_code='1', active=True)
+    self.conn = MemoryRedis()
+    self.payloads = [payload(self.session, '101', '1001'), payload(self.session, '101', '1002'),
+        payload(self.session, '102', '1003')]
+
+  def fingerprints(self):
+    return SectionFingerprints('nyu', 'fall', self.conn)
+
+  def scrape(self, payloads, **kwargs):
+    scraper = Scraper(network='nyu', session=self.session, skip_unchanged=True, **kwargs)
+    scraper.fingerprints = self.fingerprints()
+    scraper.fingerprints.autocommit = not scraper.transactional
+    for data in payloads:
+      scraper.create_section(dict(data))
+    scraper.finish()
+    return scraper
+
+  def test_digests_are_kept_across_runs(self):
+    fingerprints = self.fingerprints()
+    fingerprints.remember(*self.payloads[:2])
+    self.assertEqual(self.conn.hget('fingerprints:nyu:fall', '1001'), fingerprint(self.payloads[0]))
+    fingerprints = self.fingerprints()
+    self.assertEqual([fingerprints.matches(data) for data in self.payloads], [True, True, False])
+    self.assertFalse(fingerprints.matches(dict(self.payloads[0], status='Closed')))
+
+  def test_digests_wait_for_commit(self):
+    fingerprints = self.fingerprints()
+    fingerprints.autocommit = False
+    fingerprints.saw_page('1001', 'page-1')
+    fingerprints.remember(self.payloads[0])
+    self.assertTrue(fingerprints.matches(self.payloads[0]))
+    self.assertEqual(self.conn.hgetall('fingerprints:nyu:fall'), {})
+    fingerprints.commit()
+    self.assertEqual(self.fingerprints().page_match('page-1'), '1001')
+
+  def test_page_digest_is_kept_once_its_section_is_written(self):
+    fingerprints = self.fingerprints()
+    fingerprints.saw_page('1001', 'page-1')
+    self.assertEqual(fingerprints.page_match('page-1'), None)
+    fingerprints.confirm_pages('1001')
+    fingerprints.saw_page('1001', 'page-2')
+    fingerprints.confirm_pages('1001')
+    self.assertEqual((fingerprints.page_match('page-1'), fingerprints.page_match('page-2')), (None, '1001'))
+    fingerprints.forget('1001')
+    self.assertEqual(fingerprints.page_match('page-2'), None)
+    self.assertEqual(self.conn.hgetall('pages:nyu:fall'), {})
+
+  def test_unchanged_sections_are_not_written_again(self):
+    first = self.scrape(self.payloads)
+    self.assertEqual((first.skipped, Section.objects.count()), (0, 3))
+    Section.objects.filter(reference_code='1003').update(status='Cancelled')
+    changed = dict(self.payloads[1], status='Closed')
+    second = self.scrape([self.payloads[0], changed, self.payloads[2]])
+    self.assertEqual((second.processed, second.skipped), (3, 2))
+    self.assertEqual(sorted(Section.objects.values_list('reference_code', 'status')),
+        [(u'1001', u'Open'), (u'1002', u'Closed'), (u'1003', u'Cancelled')])
+    self.assertEqual(second.tally, {'BIO-UA': [3, 1]})
+
+  def test_unchanged_page_is_not_parsed(self):
+    scraper = Scraper(network='nyu', session=self.session, skip_unchanged=True)
+    scraper.fingerprints = self.fingerprints()
+    scraper.create_section(dict(self.payloads[0]), page_digest='page-1')
+    scraper.finish()
+    self.assertEqual(scraper.page_unchanged('page-1'), '1001')
+    self.assertEqual(scraper.page_unchanged('page-1', '1002'), None)
+    self.assertEqual(scraper.page_unchanged(None, '1001'), None)
+    scraper.skip_page('1001', 'BIO-UA')
+    self.assertEqual((scraper.skipped, scraper.pages_skipped), (1, 1))
+
+  def test_transactional_run_records_digests_at_commit(self):
+    self.scrape(self.payloads, commit_every=100)
+    self.assertEqual(sorted(self.conn.hgetall('fingerprints:nyu:fall')), ['1001', '1002', '1003'])
+    self.assertEqual(self.scrape(self.payloads, commit_every=100).skipped, 3)
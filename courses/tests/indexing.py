@@ -0,0 +1,67 @@
+from django.test import TransactionTestCase
+import datetime
+
+from api import indexing
+from api.indexing import DeferredIndexer
+from courses.models import Institution, Session, Course
+from courses.tests.sweep import payload
+from networks.models import Network
+from scrapers.general import Scraper
+
+class DeferredIndexTest(TransactionTestCase):
+  def setUp(self):
+    institution = Institution.objects.create(slug='nyu', name='NYU')
+    Network.objects.create(slug='nyu', institution=institution, name='NYU', abbr='NYU', active=True)
+    self.session = Session.objects.create(network=Network.objects.get(slug='nyu'), name='Fall', slug='fall',
+        start_date=datetime.date(2011, 9, 1), end_date=datetime.date(2011, 12, 1), system_code='1', active=True)
+    self.reindex = indexing.reindex
+    self.reindexed = []
+    indexing.reindex = lambda model, ids: self.reindexed.append(sorted(ids))
+
+  def tearDown(self):
+    indexing.reindex = self.reindex
+
+  def numbers(self, ids):
+    return sorted(Course.objects.filter(id__in=ids).values_list('number', flat=True))
+
+  def test_each_course_is_indexed_once_per_run(self):
+    scraper = Scraper(network='nyu', session=self.session, defer_index=True)
+    for number, reference_code in [('101', '1001'), ('101', '1002'), ('102', '1003')]:
+      scraper.create_section(payload(self.session, number, reference_code))
+    scraper.create_section(payload(self.session, '101', '1004'))
+    self.assertEqual(self.reindexed, [])
+    scraper.finish()
+    self.assertEqual([self.numbers(ids) for ids in self.reindexed], [[u'101', u'102']])
+    self.assertEqual(scraper.indexer.indexed, 2)
+    self.assertFalse(scraper.indexer.active)
+
+  def test_indexed_at_each_commit(self):
+    scraper = Scraper(network='nyu', session=self.session, defer_index=True, commit_every=1)
+    scraper.create_section(payload(self.session, '101', '1001'))
+    scraper.create_section(payload(self.session, '102', '1002'))
+    self.assertEqual([self.numbers(ids) for ids in self.reindexed], [[u'101']])
+    scraper.finish()
+    self.assertEqual([self.numbers(ids) for ids in self.reindexed], [[u'101'], [u'102']])
+
+  def test_batches_and_discard(self):
+    indexer = DeferredIndexer(Course, batch_size=2)
+    indexer.mark(5, 3, 1)
+    indexer.flush()
+    self.assertEqual(self.reindexed, [[1, 3], [5]])
+    indexer.mark(7)
+    indexer.discard()
+    indexer.flush()
+    self.assertEqual((len(self.reindexed), indexer.indexed), (2, 3))
+
+  def test_saves_are_only_marked_while_started(self):
+    indexer = DeferredIndexer(Course)
+    scraper = Scraper(network='nyu', session=self.session)
+    scraper.create_section(payload(self.session, '101', '1001'))
+    scraper.finish()
+    course = Course.objects.get()
+    indexer.start()
+    course.save()
+    self.assertEqual(indexer.dirty, set([course.id]))
+    indexer.stop()
+    course.save()
+    self.assertEqual((indexer.dirty, self.reindexed), (set(), [[course.id]]))
@@ -0,0 +1,53 @@
+from django.test import TestCase
+import datetime
+
+from api.db import bulk_insert
+from api.helpers import create_course_sections, reconcile_meetings, scraped_meetings
+from courses.models import Institution, Session, Section, Meeting
+from courses.tests.sweep import payload
+from networks.models import Network
+
+def meeting(day, start='10:00', end='11:15', room='101'):
+  return {'day': day, 'start': start, 'end': end, 'location': 'SILV', 'room': room}
+
+class ReconcileMeetingsTest(TestCase):
+  def setUp(self):
+    institution = Institution.objects.create(slug='nyu', name='NYU')
+    network = Network.objects.create(slug='nyu', institution=institution, name='NYU', abbr='NYU', active=True)
+    session = Session.objects.create(network=network, name='Fall', slug='fall',
+        start_date=datetime.date(2011, 9, 1), end_date=datetime.date(2011, 12, 1), system_code='1', active=True)
+    create_course_sections([payload(session, '101', '1001', meetings=[meeting('M'), meeting('W')]),
+        payload(session, '102', '1002', meetings=[meeting('Tue')])])
+    self.first, self.second = Section.objects.order_by('reference_code')
+
+  def schedule(self):
+    return sorted((m.section.reference_code, m.day, m.start.strftime('%H:%M'), m.room) for m in Meeting.objects.all())
+
+  def test_unchanged_schedule_writes_nothing(self):
+    ids = dict((m.day, m.id) for m in Meeting.objects.filter(section=self.first))
+    scraped = {self.first.id: scraped_meetings({'meetings': [meeting('W'), meeting('M')]})}
+    diffs = {}
+    self.assertNumQueries(1, lambda: diffs.update(reconcile_meetings(scraped)))
+    self.assertFalse(diffs[self.first.id])
+    self.assertEqual(dict((m.day, m.id) for m in Meeting.objects.filter(section=self.first)), ids)
+
+  def test_only_the_difference_is_written(self):
+    monday = Meeting.objects.get(section=self.first, day='Mon')
+    scraped = {self.first.id: scraped_meetings({'meetings': [meeting('M', room='202'), meeting('F')]}),
+        self.second.id: []}
+    diffs = reconcile_meetings(scraped)
+    first, second = diffs[self.first.id], diffs[self.second.id]
+    self.assertEqual(([m.day for m in first.added], [m.id for m in first.changed], [m.day for m in first.removed]),
+        (['Fri'], [monday.id], [u'Wed']))
+    self.assertEqual(([], [], [u'Tue']), (second.added, second.changed, [m.day for m in second.removed]))
+    self.assertEqual(self.schedule(), [(u'1001', u'Fri', '10:00', u'101'), (u'1001', u'Mon', '10:00', u'202')])
+    self.assertEqual(Meeting.objects.get(section=self.first, day='Mon').id, monday.id)
+
+  def test_duplicate_rows_for_a_day_are_removed(self):
+    bulk_insert(Meeting, [Meeting(section=self.second, day='Tue', location='SILV', room='101')])
+    kept = Meeting.objects.filter(section=self.second).order_by('id')[0]
+    duplicate = Meeting.objects.filter(section=self.second).order_by('-id')[0]
+    diffs = reconcile_meetings({self.second.id: scraped_meetings({'meetings': [meeting('Tue')]})})
+    self.assertEqual([m.id for m in diffs[self.second.id].removed], [duplicate.id])
+    self.assertFalse(diffs[self.second.id].added or diffs[self.second.id].changed)
+    self.assertEqual(list(Meeting.objects.filter(section=self.second).values_list('id', flat=True)), [kept.id])
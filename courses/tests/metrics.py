@@ -0,0 +1,76 @@
+from django.utils import unittest
+
+from api import metrics
+from api.metrics import RunMetrics, timed
+from api.ingest import SectionIngest
+
+class Clock(object):
+  def __init__(self):
+    self.now = 1000.0
+
+  def time(self):
+    return self.now
+
+  def tick(self, seconds):
+    self.now += seconds
+
+class MetricsTest(unittest.TestCase):
+  def setUp(self):
+    self.clock = Clock()
+    self.real_time = metrics.time
+    metrics.time = self.clock
+
+  def tearDown(self):
+    metrics.time = self.real_time
+
+  def test_nested_phases_are_exclusive(self):
+    m = RunMetrics()
+    def normalize():
+      self.clock.tick(0.25)
+    def ingest():
+      self.clock.tick(0.5)
+      timed(m, 'normalize', normalize)
+      timed(m, 'normalize', normalize)
+      self.clock.tick(0.5)
+    timed(m, 'ingest', ingest)
+    self.assertEqual(m.fields['ingest:count'], 1)
+    self.assertEqual(m.fields['ingest:us'], 1000000)
+    self.assertEqual(m.fields['normalize:count'], 2)
+    self.assertEqual(m.fields['normalize:us'], 500000)
+
+  def test_recorded_time_is_taken_out(self):
+    m = RunMetrics()
+    started = m.start()
+    self.clock.tick(2)
+    m.record('fetch', 1.5)
+    m.stop('commit', started)
+    self.assertEqual(m.fields['commit:us'], 500000)
+    self.assertEqual(m.fields['fetch:us'], 1500000)
+
+  def test_sequential_phases_are_unaffected(self):
+    m = RunMetrics()
+    timed(m, 'normalize', self.clock.tick, 0.25)
+    timed(m, 'ingest', self.clock.tick, 1)
+    self.assertEqual(m.fields['ingest:us'], 1000000)
+
+  def test_phase_stats(self):
+    m = RunMetrics()
+    for seconds in [0.001] * 9 + [1.0]:
+      m.record('fetch', seconds)
+    stats = m.phase('fetch')
+    self.assertEqual(stats['count'], 10)
+    self.assertAlmostEqual(stats['seconds'], 1.009)
+    self.assertTrue(0.0008 < stats['p50'] < 0.0012)
+    self.assertTrue(0.8 < stats['p99'] < 1.2)
+    self.assertTrue(stats['max'] >= 1.0)
+    self.assertEqual(m.phase('index'), None)
+
+  def test_one_ingest_timing_per_flush(self):
+    m = RunMetrics()
+    ingest = SectionIngest(metrics=m)
+    ingest._flush = lambda: setattr(ingest, 'buffer', [])
+    ingest.flush()
+    self.assertFalse('ingest:count' in m.fields)
+    ingest.buffer = [{}, {}, {}]
+    ingest.flush()
+    self.assertEqual(m.fields['ingest:count'], 1)
@@ -0,0 +1,54 @@
+from django.utils import unittest
+import datetime, json, os
+
+from api.normalize import clean, legacy_clean, compare, payload_values
+
+# section_data payloads as scrapers hand them over, markup and all
+CORPUS = os.path.join(os.path.dirname(__file__), 'data', 'sections.jsonl')
+
+def corpus_values():
+  values = []
+  f = open(CORPUS)
+  try:
+    for line in f:
+      for value in payload_values(json.loads(line)):
+        values.append(value)
+        if type(value) is unicode:
+          values.append(value.encode('utf-8')) # scrapers hand over utf-8 str as often
+  finally:
+    f.close()
+  return values
+
+class CleanTest(unittest.TestCase):
+  def test_corpus_matches_legacy(self):
+    values = corpus_values()
+    result = compare(values)
+    self.assertEqual(result['mismatches'], [])
+    self.assertEqual(result['same'], len(values))
+    self.assertTrue([v for v in values if isinstance(v, basestring) and '<br />' in v])
+    self.assertTrue([v for v in values if isinstance(v, basestring) and '&amp;' in v])
+
+  def test_values(self):
+    for value, expected in (
+        ('Intro to R&amp;D', 'Intro to R&D'),
+        ('Writing&nbsp;Workshop', 'Writing Workshop'),
+        ('Women&#039;s History', "Women's History"),
+        ('&quot;Great Books&quot;', '"Great Books"'),
+        ('Lab<br />Section', 'LabSection'),
+        ('&amp;nbsp;', '&nbsp;'), # decoded once, as by the chain of replaces
+        ('&nb<br />sp;', ''), # the <br /> goes first, then the &nbsp; it leaves; stripped
+        ('&#0<br />39;', '&#039;'), # ...but &#039; went before it
+        ('&#233;crit', '&#233;crit'), # other entities stay as they were
+        ('  None ', ''),
+        (u'Caf\xe9&nbsp;', u'Caf\xe9'),
+        (4, 4),
+        (None, None)):
+      self.assertEqual(clean(value), expected)
+      self.assertEqual(clean(value), legacy_clean(value))
+      self.assertEqual(type(clean(value)), type(legacy_clean(value)))
+
+  def test_times(self):
+    self.assertEqual(clean('09:30'), datetime.time(9, 30))
+    self.assertEqual(clean(u'14:05'), datetime.time(14, 5))
+    self.assertRaises(ValueError, clean, '10:30pm')
+    self.assertRaises(ValueError, legacy_clean, '10:30pm')
@@ -0,0 +1,63 @@
+from django.test import TestCase
+import datetime, json
+
+from api.fingerprints import SectionFingerprints
+from api.helpers import create_course_sections
+from api import refresh
+from api.refresh import refresh_seats, seat_row, patch_json
+from courses.models import Institution, Session, Course, Section
+from courses.tests.sweep import payload
+from networks.models import Network
+from networks.tests.workqueue import MemoryRedis
+
+class RefreshSeatsTest(TestCase):
+  def setUp(self):
+    institution = Institution.objects.create(slug='nyu', name='NYU')
+    self.network = Network.objects.create(slug='nyu', institution=institution, name='NYU', abbr='NYU', active=True)
+    self.session = Session.objects.create(network=self.network, name='Fall', slug='fall',
+        start_date=datetime.date(2011, 9, 1), end_date=datetime.date(2011, 12, 1), system_code='1', active=True)
+    self.payloads = [payload(self.session, '101', '1001'), payload(self.session, '101', '1002'),
+        payload(self.session, '102', '1003')]
+    create_course_sections(self.payloads[:2])
+    create_course_sections(self.payloads[2:])
+    self.fingerprints = SectionFingerprints('nyu', 'fall', MemoryRedis())
+    self.fingerprints.remember(*self.payloads)
+    # the simple search backend can't look documents up by id, so just see what is asked for
+    self.reindex_patched = refresh.reindex_patched
+    self.reindexed = []
+    refresh.reindex_patched = lambda course_ids, sections: self.reindexed.append((course_ids, sections))
+
+  def tearDown(self):
+    refresh.reindex_patched = self.reindex_patched
+
+  def seats(self):
+    return sorted(Section.objects.values_list('reference_code', 'status', 'seats_taken'))
+
+  def test_only_changed_sections_are_written(self):
+    errors = []
+    closed = dict(self.payloads[0], status='Closed', seats_taken='30')
+    rows = [seat_row(closed), seat_row(dict(self.payloads[1], status='Closed', seats_taken='30')),
+        seat_row(self.payloads[2]), seat_row(payload(self.session, '104', '1004')),
+        seat_row(dict(self.payloads[2], reference_code='1005', seats_taken='many'))]
+    stats = {}
+    self.assertNumQueries(1, lambda: stats.update(refresh_seats(self.network, self.session, rows[2:3], errors.append)))
+    self.assertEqual(stats, {'sections': 1, 'changed': 0, 'missing': 0, 'courses': 0, 'errors': 0})
+    stats = refresh_seats(self.network, self.session, rows, errors.append, self.fingerprints)
+    self.assertEqual(stats, {'sections': 5, 'changed': 2, 'missing': 1, 'courses': 1, 'errors': 1})
+    self.assertEqual(len(errors), 1)
+    self.assertEqual(self.seats(), [(u'1001', u'Closed', 30), (u'1002', u'Closed', 30), (u'1003', u'Open', 10)])
+    self.assertEqual([self.fingerprints.matches(data) for data in self.payloads], [False, False, True])
+    [course_ids, sections] = self.reindexed[-1]
+    self.assertEqual(course_ids, set([Course.objects.get(number='101').id]))
+    self.assertEqual(sorted(section.reference_code for section in sections.values()), [u'1001', u'1002'])
+
+  def test_stored_document_is_patched(self):
+    course = Course.objects.get(number='101')
+    document = course.prepare_json()
+    section = Section.objects.get(reference_code='1001')
+    section.status, section.seats_taken = 'Closed', 30
+    data = json.loads(patch_json(course, document, {section.id: section}))
+    self.assertEqual(sorted((entry['id'], entry['status']['label'], entry['status']['seats']['taken'])
+        for entry in data['sections']), sorted([(section.id, 'Closed', 30),
+        (Section.objects.get(reference_code='1002').id, 'Open', 10)]))
+    self.assertEqual(data['status'], 'Open')
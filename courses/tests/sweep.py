@@ -0,0 +1,77 @@
+from django.test import TestCase
+import datetime
+
+from api.helpers import create_course_sections
+from api.sweep import sweep_session, section_key, key_code
+from courses.models import Institution, Session, Course, Section
+from networks.models import Network
+from scrapers.general import Scraper
+
+def payload(session, number, reference_code, **fields):
+  data = {'network': 'nyu', 'institution': 'nyu', 'session': session.id, 'classification': 'BIO-UA',
+      'classification_name': 'Biology &amp; Health', 'college': 'College of Arts', 'level': '',
+      'number': number, 'section': '001', 'course_name': 'Course %s' % number, 'description': '',
+      'grading': 'A-F', 'status': 'Open', 'component': 'Lecture', 'units': '4', 'prof': 'Staff',
+      'notes': '', 'reference_code': reference_code, 'seats_capacity': '30', 'seats_taken': '10',
+      'meetings': []}
+  data.update(fields)
+  return data
+
+class SweepTest(TestCase):
+  def setUp(self):
+    institution = Institution.objects.create(slug='nyu', name='NYU')
+    self.network = Network.objects.create(slug='nyu', institution=institution, name='NYU', abbr='NYU', active=True)
+    self.session = Session.objects.create(network=self.network, name='Fall', slug='fall',
+        start_date=datetime.date(2011, 9, 1), end_date=datetime.date(2011, 12, 1), system_code='1', active=True)
+    self.payloads = [payload(self.session, '101', '1001'), payload(self.session, '101', '1002'),
+        payload(self.session, '102', '1003')]
+    for data in self.payloads:
+      create_course_sections([data])
+
+  def sections(self):
+    return sorted(Section.objects.values_list('reference_code', 'course__number'))
+
+  def test_key_matches_what_was_written(self):
+    self.assertEqual(sweep_session(self.network, self.session, [section_key(data) for data in self.payloads]),
+        {'sections': 0, 'courses': 0})
+    self.assertEqual(key_code(section_key(self.payloads[0])), '1001')
+
+  def test_moved_section_is_retired_under_its_old_course(self):
+    moved = payload(self.session, '103', '1001')
+    create_course_sections([moved])
+    seen = [section_key(moved), section_key(self.payloads[1]), section_key(self.payloads[2])]
+    self.assertEqual(sweep_session(self.network, self.session, seen), {'sections': 1, 'courses': 0})
+    self.assertEqual(self.sections(), [(u'1001', u'103'), (u'1002', u'101'), (u'1003', u'102')])
+
+  def test_renamed_classification_is_another_course(self):
+    renamed = payload(self.session, '102', '1003', classification_name='Biology')
+    create_course_sections([renamed])
+    seen = [section_key(data) for data in self.payloads[:2]] + [section_key(renamed)]
+    self.assertEqual(sweep_session(self.network, self.session, seen), {'sections': 1, 'courses': 1})
+    self.assertEqual(Course.objects.filter(number='102').count(), 1)
+
+  def test_bare_code_keeps_every_section_with_it(self):
+    create_course_sections([payload(self.session, '103', '1001')])
+    seen = ['1001', section_key(self.payloads[1])]
+    self.assertEqual(sweep_session(self.network, self.session, seen), {'sections': 1, 'courses': 1})
+    self.assertEqual(self.sections(), [(u'1001', u'101'), (u'1001', u'103'), (u'1002', u'101')])
+
+  def test_partial_runs_do_not_sweep(self):
+    for kwargs in ({'subjects': ['BIO-UA']}, {}):
+      scraper = Scraper(network='nyu', session=self.session, sweep=True, **kwargs)
+      scraper.create_section(payload(self.session, '101', '1001'))
+      scraper.finish()
+      if not kwargs:
+        scraper._log_error('a page failed\n')
+      scraper.sweep()
+      self.assertEqual(scraper.swept, None)
+    self.assertEqual(Section.objects.count(), 3)
+
+  def test_full_run_sweeps(self):
+    scraper = Scraper(network='nyu', session=self.session, sweep=True)
+    scraper.create_section(payload(self.session, '103', '1001'))
+    scraper.create_section(payload(self.session, '101', '1002'))
+    scraper.finish()
+    scraper.sweep()
+    self.assertEqual(scraper.swept, {'sections': 2, 'courses': 1})
+    self.assertEqual(self.sections(), [(u'1001', u'103'), (u'1002', u'101')])
@@ -1,8 +1,13 @@
 from django.conf import settings
-import redis, datetime
+import redis, datetime, hashlib, json, os, socket, time
 r = redis.Redis(settings.REDIS_HOST)
 
 from networks.models import Network
+from networks import schedule
+from networks.workqueue import WorkQueue, Heartbeat, LEASE_SECONDS
+from api.checkpoints import RunCheckpoint
+from api.fingerprints import SectionFingerprints
+from api.sweep import sweep_session
 from api.bulk import generate_bulk
 
 class NetworkScraper(object):
@@ -14,6 +19,15 @@ class NetworkScraper(object):
     f = open(settings.MEDIA_ROOT + 'network_errors.log', 'a')
     f.write('%s' % e)
     f.close()
+
+  ##
+  # Called from the finally after a run: losing the metrics to a redis hiccup must
+  # not replace whatever exception run() raised.
+  def _save_metrics(self, scraper, r, runid):
+    try:
+      scraper.metrics.save(r, 'runlog:%s:%s:%s:metrics' % (runid, scraper.network.slug, scraper.session.slug))
+    except Exception, e:
+      self._log_error("%s run %s: saving metrics failed: %s\n" % (scraper.network.slug, runid, e))
   
   def registered(self):
     return self._registry.keys()
@@ -33,31 +47,187 @@ class NetworkScraper(object):
     except Exception, e:
       self._log_error(e)
   
-  def run(self, network_slug, session_slug=None):
-    for scraper in self._active_scrapers_for_network(network_slug):
+  ##
+  # Scrapes the network's active sessions (or just @session_slug). resume=True
+  # continues a session's unfinished run, under the same run id, instead of
+  # starting over, and checkpoints the run (api.checkpoints) so that it can in turn
+  # be resumed; without it nothing is checkpointed.
+  def run(self, network_slug, session_slug=None, resume=False, **kwargs):
+    for scraper in self._active_scrapers_for_network(network_slug, **kwargs):
       if not session_slug or session_slug == scraper.session.slug:
-        r.incr('runlog')
-        runid = r.get('runlog')
-        r.set('runlog:%s:%s:%s:start' % (runid, network_slug, scraper.session.slug), "%s" % datetime.datetime.now())
-        print "Running %s scraper: %s" % (network_slug, scraper.session.name)
+        self._run_scraper(network_slug, scraper, resume)
+  
+  ##
+  # The subjects (networks.schedule) worth refreshing now across the network's
+  # active sessions, within @budget sections.
+  def plan(self, network_slug, budget, now=None):
+    return schedule.plan(network_slug, self._active_sessions_for_network(network_slug), budget,
+        by_subject=self.get_scraper(network_slug).plannable, now=now, conn=r)
+  
+  ##
+  # Like run(), but only scrapes what plan() picks for @budget.
+  def run_planned(self, network_slug, budget, resume=False, **kwargs):
+    for session, subjects in schedule.by_session(self.plan(network_slug, budget)):
+      if subjects is None:
+        scraper = self._get_scraper_for_session(network_slug, session, **kwargs)
+      else:
+        known = schedule.SubjectHistory(network_slug, session.slug, r).load().keys()
+        scraper = self._get_scraper_for_session(network_slug, session,
+            subjects=subjects, known_subjects=known, **kwargs)
+      self._run_scraper(network_slug, scraper, resume)
+  
+  def _run_scraper(self, network_slug, scraper, resume=False):
+    checkpoint = RunCheckpoint.unfinished(network_slug, scraper.session.slug, r) if resume else None
+    if checkpoint:
+      runid = checkpoint.runid
+      print "Resuming %s scraper: %s (run %s, %s subjects and %s sections done)" % (network_slug,
+          scraper.session.name, runid, len(checkpoint.subjects), len(checkpoint.sections))
+    else:
+      r.incr('runlog')
+      runid = r.get('runlog')
+      r.set('runlog:%s:%s:%s:start' % (runid, network_slug, scraper.session.slug), "%s" % datetime.datetime.now())
+      if resume:
+        checkpoint = RunCheckpoint(runid, network_slug, scraper.session.slug, r)
+        checkpoint.start()
+      print "Running %s scraper: %s" % (network_slug, scraper.session.name)
+    if checkpoint:
+      scraper.resume_from(checkpoint)
+    try:
+      scraper.run()
+    finally:
+      # commit, flush and reindex whatever was scraped, even if run() died
+      scraper.finish()
+      self._save_metrics(scraper, r, runid)
+    # only reached when run() completed, so a crashed run never sweeps
+    scraper.sweep()
+    schedule.SubjectHistory(network_slug, scraper.session.slug, r).record(scraper.tally, bool(scraper.fingerprints))
+    r.set('runlog:%s:%s:%s:end' % (runid, network_slug, scraper.session.slug), "%s" % datetime.datetime.now())
+    r.hmset('runlog:%s:%s:%s:stats' % (runid, network_slug, scraper.session.slug), scraper.summary())
+    if checkpoint:
+      checkpoint.close()
+    
+    # Update the bulk files
+    generate_bulk(network_slug, scraper.session.id)
+  
+  ##
+  # Splits the run of each active session (or just @session_slug) into tasks
+  # (Scraper.work_units) on the shared work queue, for work() to do on any node.
+  # Returns the run ids; their progress is in networks.workqueue.
+  def enqueue(self, network_slug, session_slug=None, **kwargs):
+    queue = WorkQueue(r)
+    runids = []
+    for scraper in self._active_scrapers_for_network(network_slug, **kwargs):
+      if session_slug and session_slug != scraper.session.slug:
+        continue
+      tasks = scraper.work_units() or [{}]
+      scraper.transport.close()
+      job_kwargs = dict(kwargs)
+      subjects = sorted(set(code for task in tasks for code in task.get('subjects', ())))
+      if subjects:
+        # so that a task's scraper doesn't take other subjects for new ones
+        job_kwargs['known_subjects'] = subjects
+      r.incr('runlog')
+      runid = r.get('runlog')
+      r.set('runlog:%s:%s:%s:start' % (runid, network_slug, scraper.session.slug), "%s" % datetime.datetime.now())
+      queue.enqueue(runid, network_slug, scraper.session.slug, tasks, job_kwargs)
+      print "Queued %s scraper: %s (run %s, %s tasks)" % (network_slug, scraper.session.name, runid, len(tasks))
+      runids.append(runid)
+    return runids
+  
+  ##
+  # Takes tasks off the work queue and does them until there are none left, or
+  # with @wait, forever, checking every @poll seconds. Any number of processes on
+  # any number of nodes can work the queue at once; the last to finish a job's
+  # task wraps the job up (sweep, runlog, bulk files).
+  def work(self, name=None, lease=LEASE_SECONDS, wait=False, poll=10):
+    queue = WorkQueue(r)
+    name = name or '%s:%s' % (socket.gethostname(), os.getpid())
+    while True:
+      claimed = queue.claim(name, lease)
+      if claimed is None:
+        if not wait:
+          return
+        time.sleep(poll)
+        continue
+      runid, job, task = claimed
+      self._work_on(queue, runid, job, task, name, lease)
+  
+  def _work_on(self, queue, runid, job, task, name, lease):
+    from courses.models import Session
+    network_slug = job['network']
+    session = Session.objects.get(network__slug=network_slug, slug=job['session'])
+    kwargs = dict((str(k), v) for k, v in job['kwargs'].items() + json.loads(task).items())
+    kwargs['part'] = '%s-%s' % (runid, hashlib.md5(task).hexdigest()[:8])
+    print "Working on %s: %s (run %s) %s" % (network_slug, session.name, runid, task)
+    heartbeat = Heartbeat(queue, runid, task, name, lease)
+    heartbeat.start()
+    try:
+      scraper = self._get_scraper_for_session(network_slug, session, **kwargs)
+      checkpoint = RunCheckpoint(runid, network_slug, session.slug, r)
+      written = set(checkpoint.written)
+      scraper.resume_from(checkpoint)
+      try:
         scraper.run()
-        r.set('runlog:%s:%s:%s:end' % (runid, network_slug, scraper.session.slug), "%s" % datetime.datetime.now())
-        
-        # Update the bulk files
-        generate_bulk(network_slug, scraper.session.id)
+      finally:
+        scraper.finish()
+        # added to what the job's other tasks saved
+        self._save_metrics(scraper, r, runid)
+    except Exception, e:
+      heartbeat.stop()
+      heartbeat.join()
+      self._log_error("%s run %s, task %s: %s\n" % (network_slug, runid, task, e))
+      finished = queue.fail(runid, task, '%s' % e)
+    else:
+      heartbeat.stop()
+      heartbeat.join()
+      schedule.SubjectHistory(network_slug, session.slug, r).record(scraper.tally, bool(scraper.fingerprints))
+      checkpoint.saw(*(scraper.seen - written))
+      stats = 'runlog:%s:%s:%s:stats' % (runid, network_slug, session.slug)
+      for key, value in scraper.summary().items():
+        if type(value) in (int, long):
+          r.hincrby(stats, key, value)
+      finished = queue.complete(runid, task)
+    if finished:
+      self._finish_job(queue, runid, job, session)
+  
+  def _finish_job(self, queue, runid, job, session):
+    network_slug = job['network']
+    checkpoint = RunCheckpoint(runid, network_slug, session.slug, r)
+    failed = queue.failed(runid)
+    errors = int(r.hget('runlog:%s:%s:%s:stats' % (runid, network_slug, session.slug), 'errors') or 0)
+    # listed by a finished task, or written by any attempt at one
+    seen = checkpoint.seen() | checkpoint.written
+    if failed:
+      print "Run %s: %s tasks failed, not sweeping" % (runid, len(failed))
+    elif job['kwargs'].get('start') or job['kwargs'].get('end'):
+      print "Run %s: only covered part of the listings, not sweeping" % runid
+    elif errors:
+      print "Run %s: %s errors logged, not sweeping" % (runid, errors)
+    elif job['kwargs'].get('sweep') and seen:
+      fingerprints = SectionFingerprints(network_slug, session.slug, r) if job['kwargs'].get('skip_unchanged') else None
+      swept = sweep_session(session.network, session, seen, fingerprints)
+      print "Swept %(sections)s sections and %(courses)s courses no longer listed" % swept
+      r.hmset('runlog:%s:%s:%s:stats' % (runid, network_slug, session.slug),
+          {'retired_sections': swept['sections'], 'retired_courses': swept['courses']})
+    r.set('runlog:%s:%s:%s:end' % (runid, network_slug, session.slug), "%s" % datetime.datetime.now())
+    checkpoint.close()
+    queue.close(runid)
+    
+    # Update the bulk files
+    generate_bulk(network_slug, session.id)
   
   def _active_sessions_for_network(self, network_slug):
     from courses.models import Session
     network = Network.objects.get(slug=network_slug)
     return Session.objects.filter(network=network, active=True)
   
-  def _active_scrapers_for_network(self, network_slug):
+  def _active_scrapers_for_network(self, network_slug, **kwargs):
     for session in self._active_sessions_for_network(network_slug):
-      yield self._get_scraper_for_session(network_slug, session)
+      yield self._get_scraper_for_session(network_slug, session, **kwargs)
   
-  def _get_scraper_for_session(self, network_slug, session):
+  def _get_scraper_for_session(self, network_slug, session, **kwargs):
     scraper_class = self._registry[network_slug]['scraper']
-    return scraper_class(debug=False, network=network_slug, session=session)
+    return scraper_class(debug=False, network=network_slug, session=session, **kwargs)
   
   def _get_or_create_scraper(self, network_slug, **session_attrs):
     network = Network.objects.get(slug=network_slug)
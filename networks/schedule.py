@@ -0,0 +1,132 @@
+from django.conf import settings
+import datetime, json, math, redis, time
+
+##
+# Partial scrapes under a request budget. Every run that goes through
+# NetworkScraper records, for each subject, how many sections it saw and how many
+# had changed (SubjectHistory); plan() picks the subjects most worth refreshing
+# now, and the scrapers walk only those (see Scraper.planned).
+
+LEARNING_RATE = 0.3 # weight of the latest run in a subject's change rate
+PRIOR_RATE = 0.01 # changes per section per hour assumed until some are observed
+START_WINDOW = 10 # days; refreshes around a session's start_date are worth up to
+START_BOOST = 3.0 # 1 + START_BOOST times more, falling off over START_WINDOW days
+
+class SubjectHistory(object):
+  """
+  What past runs saw of each subject of a network's session, in the redis hash
+  schedule:<network>:<session> (field: classification code, value: json with
+  sections, rate and refreshed).
+
+  rate is how often a section of the subject changes, per hour. Changes are taken
+  to arrive independently, so a run that finds a fraction f of the subject's
+  sections changed h hours after its last refresh observes -ln(1 - f) / h; rate
+  is a moving average of those observations. Runs that can't tell changed
+  sections from unchanged ones (no skip_unchanged) only move refreshed along.
+  """
+  def __init__(self, network, session, conn=None):
+    self.key = 'schedule:%s:%s' % (network, session)
+    self.r = conn or redis.Redis(settings.REDIS_HOST)
+
+  def load(self):
+    return dict((subject, json.loads(value)) for subject, value in (self.r.hgetall(self.key) or {}).items())
+
+  ##
+  # @tally maps subject -> [sections seen, sections changed] for a run that ended
+  # at @now; @changes_known is False if the run wrote every section it saw.
+  def record(self, tally, changes_known=True, now=None):
+    if not tally:
+      return
+    now = now or time.time()
+    history = self.load()
+    updates = {}
+    for subject, (sections, changed) in tally.items():
+      entry = history.get(subject, {})
+      rate = entry.get('rate')
+      if changes_known and sections and entry.get('refreshed') and now > entry['refreshed']:
+        hours = max((now - entry['refreshed']) / 3600.0, 0.25)
+        fraction = min(float(changed) / sections, 0.99)
+        observed = -math.log1p(-fraction) / hours
+        rate = observed if rate is None else LEARNING_RATE * observed + (1 - LEARNING_RATE) * rate
+      updates[subject] = json.dumps({'sections': sections, 'rate': rate, 'refreshed': now})
+    self.r.hmset(self.key, updates)
+
+##
+# How much a refresh of @session is worth on @day, relative to the rest of the
+# term: 1 well away from its start_date, up to 1 + START_BOOST around it, when
+# sections open, close and move the most.
+def session_weight(session, day=None):
+  day = day or datetime.date.today()
+  if not session.start_date:
+    return 1.0
+  start = session.start_date
+  if isinstance(start, datetime.datetime):
+    start = start.date()
+  days = (day - start).days
+  return 1.0 + START_BOOST * math.exp(-0.5 * (float(days) / START_WINDOW) ** 2)
+
+##
+# The expected fraction of a subject's sections that changed since its @entry
+# was refreshed; 1 for a subject never scraped.
+def staleness(entry, now):
+  if not entry.get('refreshed'):
+    return 1.0
+  rate = entry.get('rate')
+  if rate is None:
+    rate = PRIOR_RATE
+  hours = max(now - entry['refreshed'], 0) / 3600.0
+  return 1 - math.exp(-rate * hours)
+
+##
+# The work to do now in @sessions of @network (a slug), most valuable first, as
+# dicts of session, subject, cost and priority, within @budget. Costs are in
+# sections, i.e. detail pages, which is where a scrape spends its requests.
+#
+# priority is the expected fraction of stale sections a request brings back
+# (staleness times session_weight), so taking items in that order gets the most
+# changes found for the budget. A session no run has recorded yet is scraped
+# whole, first. With @by_subject False (a scraper that can't be limited to some
+# subjects) each session is a single item, subject None.
+def plan(network, sessions, budget, by_subject=True, now=None, conn=None):
+  now = now or time.time()
+  day = datetime.date.fromtimestamp(now)
+  items = []
+  for session in sessions:
+    history = SubjectHistory(network, session.slug, conn).load()
+    weight = session_weight(session, day)
+    if not history:
+      items.append({'session': session, 'subject': None, 'cost': 0, 'priority': float('inf')})
+    elif by_subject:
+      for subject, entry in history.items():
+        items.append({'session': session, 'subject': subject, 'cost': entry['sections'],
+            'priority': staleness(entry, now) * weight})
+    else:
+      cost = sum(entry['sections'] for entry in history.values())
+      stale = sum(staleness(entry, now) * entry['sections'] for entry in history.values())
+      items.append({'session': session, 'subject': None, 'cost': cost,
+          'priority': stale * weight / max(cost, 1)})
+
+  work, spent = [], 0
+  for item in sorted(items, key=lambda item: (-item['priority'], item['session'].slug, item['subject'])):
+    if work and spent + item['cost'] > budget:
+      continue
+    work.append(item)
+    spent += item['cost']
+  return work
+
+##
+# @work (from plan()) as [(session, [subject, ...] in priority order), ...],
+# sessions in the order their first item comes; None for a whole session.
+def by_session(work):
+  sessions = []
+  subjects = {}
+  for item in work:
+    session = item['session']
+    if session.id not in subjects:
+      sessions.append(session)
+      subjects[session.id] = []
+    if item['subject'] is None:
+      subjects[session.id] = None
+    elif subjects[session.id] is not None:
+      subjects[session.id].append(item['subject'])
+  return [(session, subjects[session.id]) for session in sessions]
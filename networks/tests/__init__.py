@@ -0,0 +1,8 @@
+from networks.tests.peoplesoft import *
+from networks.tests.transport import *
+from networks.tests.checkpoints import *
+from networks.tests.flatpage import *
+from networks.tests.workqueue import *
+from networks.tests.schedule import *
+from networks.tests.replay import *
+from networks.tests.ucla import *
@@ -0,0 +1,78 @@
+from django.test import TestCase
+import datetime
+
+from api.checkpoints import RunCheckpoint
+from api.sweep import key_code
+from courses.models import Institution, Session
+from networks.models import Network
+from scrapers.general import Scraper
+
+class RecordingRedis(object):
+  # counts round trips: a pipeline's commands go in as one
+  def __init__(self):
+    self.trips = []
+
+  def smembers(self, key):
+    self.trips.append([('smembers', key)])
+    return set()
+
+  def pipeline(self):
+    return RecordingPipeline(self)
+
+class RecordingPipeline(object):
+  def __init__(self, conn):
+    self.conn = conn
+    self.commands = []
+
+  def sadd(self, key, *values):
+    self.commands.append(('sadd', key, sorted(values)))
+
+  def execute(self):
+    self.conn.trips.append(self.commands)
+
+class CheckpointTest(TestCase):
+  def setUp(self):
+    institution = Institution.objects.create(slug='nyu', name='NYU')
+    Network.objects.create(slug='nyu', institution=institution, name='NYU', abbr='NYU', active=True)
+    self.session = Session.objects.create(network=Network.objects.get(slug='nyu'), name='Fall', slug='fall',
+        start_date=datetime.date(2011, 9, 1), end_date=datetime.date(2011, 12, 1), system_code='1', active=True)
+    self.conn = RecordingRedis()
+    self.checkpoint = RunCheckpoint('1', 'nyu', 'fall', self.conn)
+    del self.conn.trips[:]
+
+  def section(self, number, reference_code):
+    return {'classification': 'BIO-UA', 'classification_name': 'Biology', 'college': '', 'level': 'Undergraduate',
+        'number': number, 'section': reference_code[-3:], 'course_name': 'Course %s' % number,
+        'description': '', 'grading': 'A-F', 'status': 'Open', 'component': 'Lecture', 'units': '4',
+        'prof': 'Staff', 'notes': '', 'reference_code': reference_code, 'seats_capacity': '30',
+        'seats_taken': '10', 'meetings': []}
+
+  def test_done_is_one_round_trip(self):
+    self.checkpoint.done(['1', '2'], 'BIO-UA')
+    self.assertEqual(self.conn.trips, [[('sadd', 'runlog:1:nyu:fall:sections', ['1', '2']),
+        ('sadd', 'runlog:1:nyu:fall:subjects', ['BIO-UA'])]])
+    self.checkpoint.done(['1', '2'], 'BIO-UA')
+    self.assertEqual(len(self.conn.trips), 1)
+
+  def test_sections_are_checkpointed_once_per_subject(self):
+    scraper = Scraper(network='nyu', session=self.session)
+    scraper.resume_from(self.checkpoint)
+    for number, reference_code in [('101', '1001'), ('101', '1002'), ('102', '1003'), ('103', '1004')]:
+      scraper.create_section(self.section(number, reference_code))
+    self.assertEqual(self.conn.trips, [])
+    scraper.subject_done('BIO-UA')
+    scraper.finish()
+    (sections, key, keys), subjects = self.conn.trips[0]
+    self.assertEqual(len(self.conn.trips), 1)
+    self.assertEqual(sorted(key_code(key) for key in keys), ['1001', '1002', '1003', '1004'])
+    self.assertEqual(subjects, ('sadd', 'runlog:1:nyu:fall:subjects', ['BIO-UA']))
+    self.assertEqual(self.checkpoint.written, scraper.seen)
+
+  def test_sections_are_checkpointed_once_per_commit(self):
+    scraper = Scraper(network='nyu', session=self.session, commit_every=2)
+    scraper.resume_from(self.checkpoint)
+    for number, reference_code in [('101', '1001'), ('101', '1002'), ('102', '1003'), ('103', '1004')]:
+      scraper.create_section(self.section(number, reference_code))
+    scraper.finish()
+    self.assertEqual([[sorted(key_code(key) for key in keys) for command, name, keys in trip] for trip in self.conn.trips],
+        [[['1001', '1002']], [['1003', '1004']]])
@@ -0,0 +1,125 @@
+from django.test import TestCase
+import datetime, os, re
+
+from courses.models import Institution, Session, Section
+from networks.models import Network
+from networks.tests.server import LocalServer, Handler
+from scrapers.columbia import ColumbiaScraper
+
+# the Columbia bulletin as saved: the subject index, each subject's course
+# listing and a page per course; the AMST and BIOL listings also have a course
+# of another term
+PAGES = os.path.join(os.path.dirname(__file__), 'pages', 'columbia')
+
+class BulletinHandler(Handler):
+  def respond(self):
+    parts = self.path.strip('/').split('/')[1:]
+    path = os.path.join(PAGES, '%s.html' % (parts[-1] if parts else 'index'))
+    if not os.path.exists(path):
+      self.send_error(404)
+      return
+    self.page = lambda: open(path).read()
+    Handler.respond(self)
+
+class SavedColumbiaScraper(ColumbiaScraper):
+  # ColumbiaScraper.parse_url builds section_data but never hands it on; this
+  # reads the same rows of the saved pages into a full payload
+  def parse_url(self, url, soup):
+    fields = dict((cell.find('font').renderContents(), cell.findNextSibling('td').renderContents())
+        for cell in soup.findAll('td', bgcolor='#99CCFF'))
+    taken, capacity = re.search('(\d+) students \((\d+) max\)', fields['Enrollment']).groups()
+    self.create_section({
+      'classification': url.split('/')[-3],
+      'classification_name': fields['Subject'],
+      'college': fields['Division'],
+      'number': fields['Number'],
+      'section': fields['Section'],
+      'course_name': soup.find('font', size='+2').renderContents(),
+      'description': '',
+      'grading': '',
+      'status': 'Open',
+      'component': fields['Type'],
+      'units': fields['Points'],
+      'prof': fields['Instructor'],
+      'reference_code': fields['Call Number'],
+      'seats_taken': taken,
+      'seats_capacity': capacity,
+    })
+
+COURSES = ['AMST/AMST1001-20113-001/', 'AMST/AMST3930-20113-001/', 'BIOL/BIOL2005-20113-001/',
+    'BIOL/BIOL2005-20113-002/', 'CHEM/CHEM1403-20113-001/']
+SECTIONS = [
+  (u'11223', u'AMST', u'American Studies', u'1001', u'001', u'Intro to American Studies', u'Casey Jordan', 12, 30),
+  (u'11224', u'AMST', u'American Studies', u'3930', u'001', u'Senior Seminar', u'Robin Lee', 15, 15),
+  (u'20001', u'BIOL', u'Biological Sciences', u'2005', u'001', u'Introductory Biology I', u'Sam Patel', 180, 200),
+  (u'20002', u'BIOL', u'Biological Sciences', u'2005', u'002', u'Introductory Biology I', u'Sam Patel', 75, 80),
+  (u'30001', u'CHEM', u'Chemistry', u'1403', u'001', u'General Chemistry I', u'Alex Kim', 0, 150),
+]
+
+class ColumbiaTest(TestCase):
+  def setUp(self):
+    institution = Institution.objects.create(slug='columbia', name='Columbia')
+    Network.objects.create(slug='columbia', institution=institution, name='Columbia', abbr='CU', active=True)
+    self.session = Session.objects.create(network=Network.objects.get(slug='columbia'), name='Fall 2011',
+        slug='fall-2011', start_date=datetime.date(2011, 9, 1), end_date=datetime.date(2011, 12, 1),
+        system_code='20113', active=True)
+    self.server = LocalServer(BulletinHandler)
+    self.base_url = self.server.url + '/subj/'
+
+  def tearDown(self):
+    self.server.stop()
+
+  def scraper(self, **kwargs):
+    scraper = SavedColumbiaScraper(network='columbia', session=self.session, **kwargs)
+    scraper.base_url = self.base_url
+    return scraper
+
+  def run_scraper(self, scraper):
+    try:
+      scraper.run()
+    finally:
+      scraper.finish()
+      scraper.transport.close()
+    self.assertEqual(scraper.errors, 0)
+    return scraper
+
+  def sections(self):
+    return sorted((s.reference_code, s.course.classification.code, s.course.classification.name, s.course.number,
+        s.number, s.course.name, s.prof, s.seats_taken, s.seats_capacity) for s in Section.objects.all())
+
+  def paths(self):
+    return [path for method, path, body in self.server.requests]
+
+  def test_index_lists_this_terms_courses(self):
+    scraper = self.scraper()
+    scraper.get_all_urls()
+    scraper.transport.close()
+    self.assertEqual(scraper.urls, [self.base_url + course for course in COURSES])
+    self.assertEqual(self.paths(), ['/subj/', '/subj/AMST/', '/subj/BIOL/', '/subj/CHEM/'])
+
+  def test_run(self):
+    scraper = self.run_scraper(self.scraper())
+    self.assertEqual(scraper.pages, 5)
+    self.assertEqual(self.sections(), SECTIONS)
+
+  def test_run_concurrently(self):
+    scraper = self.run_scraper(self.scraper(workers=4))
+    self.assertEqual(scraper.pages, 5)
+    self.assertEqual(self.sections(), SECTIONS)
+
+  def test_tasks_fetch_only_their_urls(self):
+    units = self.scraper(url_batch=2).work_units()
+    self.assertEqual(units, [{'urls': [self.base_url + course for course in COURSES[i:i + 2]]} for i in (0, 2, 4)])
+    del self.server.requests[:]
+    for workers, unit in zip((1, 4, 1), units):
+      self.run_scraper(self.scraper(workers=workers, **unit))
+    self.assertEqual(sorted(self.paths()), sorted('/subj/' + course for course in COURSES))
+    self.assertEqual(self.sections(), SECTIONS)
+
+  def test_missing_page_is_logged(self):
+    scraper = self.scraper(urls=[self.base_url + 'CHEM/CHEM9999-20113-001/'] + [self.base_url + COURSES[-1]])
+    scraper.run()
+    scraper.finish()
+    scraper.transport.close()
+    self.assertEqual(scraper.errors, 1)
+    self.assertEqual(self.sections(), SECTIONS[-1:])
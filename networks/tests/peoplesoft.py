@@ -0,0 +1,173 @@
+from BeautifulSoup import BeautifulSoup
+from django.utils import unittest
+import os, Queue, re
+
+from api.checkpoints import RunCheckpoint
+from api.dimensions import DimensionCache
+from networks.tests.server import LocalServer, Handler
+from scrapers.pagefields import PageFields, compare, hidden_inputs, page_digest
+from scrapers.peoplesoft import PeopleSoftScraperV2, SECTION_FIELDS, read_section, legacy_read_section
+from scrapers.transport import Transport
+
+# class detail pages as PeopleSoft serves them, a few odd ones by name
+PAGES = os.path.join(os.path.dirname(__file__), 'pages', 'peoplesoft')
+
+def load_pages(directory):
+  pages = []
+  for name in sorted(os.listdir(directory)):
+    f = open(os.path.join(directory, name))
+    try:
+      pages.append((name, f.read()))
+    finally:
+      f.close()
+  return pages
+
+class Stand(object):
+  def __init__(self, **attrs):
+    self.__dict__.update(attrs)
+
+class DetailPageTest(unittest.TestCase):
+  def setUp(self):
+    self.pages = load_pages(PAGES)
+    self.scraper = PeopleSoftScraperV2.__new__(PeopleSoftScraperV2)
+    self.scraper.subjects = dict((code, {'name': '%s name' % code, 'college': '%s college' % code})
+        for code in ('ACCT', 'CHEM', 'ENGL', 'MATH'))
+    self.scraper.institution = Stand(slug='nyu')
+    self.scraper.session = Stand(id=7)
+
+  ##
+  # What the scraper's parse_section returned before PageFields: the soup reading
+  # plus the fields it took from the scraper.
+  def soup_section(self, page):
+    section_data = legacy_read_section(BeautifulSoup(page))
+    classification = section_data['classification']
+    section_data['classification_name'] = self.scraper.subjects[classification]['name']
+    section_data['college'] = self.scraper.subjects[classification]['college']
+    section_data['institution'] = self.scraper.institution.slug
+    section_data['session'] = self.scraper.session.id
+    return section_data
+
+  def test_parse_section_matches_soup(self):
+    for name, page in self.pages:
+      if name == 'no_class_number.html':
+        continue
+      self.assertEqual(self.scraper.parse_section(page), self.soup_section(page), name)
+
+  def test_missing_field_fails_both_ways(self):
+    page = dict(self.pages)['no_class_number.html']
+    self.assertRaises(AttributeError, self.soup_section, page)
+    self.assertRaises(KeyError, self.scraper.parse_section, page)
+
+  def test_compare_reports_no_mismatches(self):
+    result = compare(self.pages, lambda page: legacy_read_section(BeautifulSoup(page)),
+        lambda page: read_section(PageFields(page, SECTION_FIELDS)))
+    self.assertEqual(result['mismatches'], [])
+    self.assertEqual((result['pages'], result['failed']), (len(self.pages), 1))
+
+  def test_compare_catches_a_difference(self):
+    result = compare(self.pages[:1], lambda page: legacy_read_section(BeautifulSoup(page)),
+        lambda page: dict(read_section(PageFields(page, SECTION_FIELDS)), units='?'))
+    self.assertEqual(len(result['mismatches']), 1)
+
+class ShardBrowserTest(unittest.TestCase):
+  def setUp(self):
+    self.scraper = PeopleSoftScraperV2.__new__(PeopleSoftScraperV2)
+    self.scraper.__dict__.update({'_initial_params': {'ICSID': '1'}, 'transport': Transport(),
+        'subjects': {'ACCT': {}}, 'sections': [], 'section_data': {'1': {}}, 'classes': {'1': {}},
+        'hold': {}, 'last_section': '1', 'longs': ['1'], 'timers': {}, 'finished_subjects': ['ACCT'],
+        'missed_subjects': [], 'seen': set(['1']), 'tally': {'ACCT': [1, 1]}, 'processed': 1,
+        'skipped': 0, 'pages_skipped': 0, 'resumed': 0, 'errors': 0, '_course_key': None,
+        '_course_sections': [{}], '_unrecorded': ['1'], '_seat_rows': [], 'dimensions': DimensionCache(),
+        'ingest': None, 'indexer': None, 'recorder': None, 'fingerprints': None, 'shards': 2})
+    self.scraper.checkpoint = RunCheckpoint.__new__(RunCheckpoint)
+    self.scraper.checkpoint.__dict__.update({'subjects': set(), 'written': set(['1001']), 'sections': set(['1001']), 'r': None})
+    self.results = Queue.Queue()
+    self.browser = self.scraper._browser(['CHEM'], self.results, self.scraper.checkpoint.snapshot())
+
+  def tearDown(self):
+    self.scraper.transport.close()
+    self.browser.transport.close()
+
+  def test_state_is_its_own(self):
+    for name, value in self.scraper.__dict__.items():
+      if isinstance(value, (list, dict, set)) and value is not self.scraper._initial_params:
+        self.assertFalse(getattr(self.browser, name) is value, name)
+    self.assertEqual((self.browser.seen, self.browser.tally, self.browser.finished_subjects), (set(), {}, []))
+    self.assertFalse(self.browser.transport is self.scraper.transport)
+    self.assertEqual((self.browser.dimensions, self.browser.recorder), (None, None))
+
+  def test_checkpoint_is_read_only(self):
+    self.assertFalse(self.browser.checkpoint is self.scraper.checkpoint)
+    self.scraper.checkpoint.sections.add('1002')
+    self.assertEqual(self.browser.checkpoint.sections, frozenset(['1001']))
+    self.assertRaises(AttributeError, self.browser.checkpoint.done, ['1003'])
+
+  def test_results_come_back_over_the_queue(self):
+    self.assertTrue(self.browser.already_done('1001'))
+    self.assertFalse(self.browser.already_done('1002'))
+    self.browser.create_section({'reference_code': '1002'})
+    self.browser._log_error('oops')
+    self.assertEqual([self.results.get_nowait() for i in range(3)],
+        [('resumed', '1001'), ('section', ({'reference_code': '1002'}, None)), ('error', 'oops')])
+    self.assertEqual((self.scraper.processed, self.scraper.seen, self.scraper.errors), (1, set(['1']), 0))
+
+class FormHandler(Handler):
+  # a PeopleSoft form for /form?state=N, anything else is a bare page
+  def page(self):
+    if self.path.startswith('/form'):
+      return ('<form><input type="hidden" name="ICSID" value="a&amp;b">'
+          '<INPUT TYPE="hidden" NAME="ICStateNum" VALUE="%s"></form>' % self.path.split('=')[1])
+    return '<html>moved on</html>'
+
+class StateTrackingTest(unittest.TestCase):
+  def setUp(self):
+    self.server = LocalServer(FormHandler)
+    self.scraper = PeopleSoftScraperV2.__new__(PeopleSoftScraperV2)
+    self.scraper.__dict__.update({'transport': Transport(compress=False), 'scrape_url': self.server.url + '/form?state=1',
+        'params': {}, '_initial_params': None, 'timers': {}, 'debug': False})
+
+  def tearDown(self):
+    self.scraper.transport.close()
+    self.server.stop()
+
+  def test_hidden_inputs_match_soup(self):
+    for name, page in load_pages(PAGES):
+      inputs = BeautifulSoup(page).findAll('input', type='hidden')
+      self.assertEqual(hidden_inputs(page), dict((i['name'], i.get('value', '')) for i in inputs), name)
+
+  def test_params_follow_the_form(self):
+    self.scraper._click(soupify=False)
+    self.assertEqual(self.scraper.params, {'ICSID': 'a&b', 'ICStateNum': '1'})
+    self.scraper._click(self.server.url + '/form?state=4', {'ICAction': 'go'}, soupify=False)
+    self.assertEqual(self.scraper.params['ICStateNum'], '4')
+    self.scraper._click(self.server.url + '/other', soupify=False)
+    self.assertEqual(self.scraper.params, {'ICSID': 'a&b', 'ICStateNum': 5})
+    self.assertEqual(self.scraper._initial_params, {})
+    self.assertEqual(self.server.requests[1], ('POST', '/form?state=4', 'ICAction=go'))
+
+class PageDigestTest(unittest.TestCase):
+  def setUp(self):
+    self.page = dict(load_pages(PAGES))['detail_00.html']
+    self.scraper = PeopleSoftScraperV2.__new__(PeopleSoftScraperV2)
+    self.scraper.__dict__.update({'params': {}, 'scrape_url': None, 'save_pages': None, 'checkpoint': None,
+        'fingerprints': True, 'subject': 'ACCT', 'metrics': None, 'calls': []})
+    self.scraper._click = lambda url, params, soupify=True: self.page
+    self.scraper.parse_section = lambda page: self.scraper.calls.append('parse') or {'reference_code': '1001'}
+    self.scraper.create_section = lambda section_data, digest=None: self.scraper.calls.append(('create', digest))
+    self.scraper.skip_page = lambda code, subject=None: self.scraper.calls.append(('skip', code, subject))
+
+  def test_digest_ignores_hidden_inputs(self):
+    revisited = re.sub(r'(name="ICStateNum"[^>]*value=")\d+', r'\g<1>99', self.page, flags=re.I)
+    self.assertNotEqual(revisited, self.page)
+    self.assertEqual(page_digest(revisited), page_digest(self.page))
+    self.assertNotEqual(page_digest(self.page + '<p>moved</p>'), page_digest(self.page))
+    self.assertNotEqual(page_digest(self.page, {'units': '4'}), page_digest(self.page, {'units': '3'}))
+
+  def test_known_page_is_not_parsed(self):
+    known = page_digest(self.page)
+    self.scraper.page_unchanged = lambda digest, reference_code=None: digest == known and '1001' or None
+    self.scraper.process_section(0, 0)
+    self.assertEqual(self.scraper.calls, [('skip', '1001', 'ACCT')])
+    self.page += '<p>moved</p>'
+    self.scraper.process_section(0, 0)
+    self.assertEqual(self.scraper.calls[1:], ['parse', ('create', page_digest(self.page))])
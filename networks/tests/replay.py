@@ -0,0 +1,54 @@
+from django.test import TestCase
+import datetime, os, shutil, tempfile
+
+from api.recording import SectionRecorder, read_recording, part_path
+from courses.models import Institution, Session, Section
+from courses.tests.sweep import payload
+from networks.models import Network
+from scrapers.general import Scraper
+from scrapers.replay import ReplayScraper
+
+class ReplayTest(TestCase):
+  def setUp(self):
+    institution = Institution.objects.create(slug='nyu', name='NYU')
+    network = Network.objects.create(slug='nyu', institution=institution, name='NYU', abbr='NYU', active=True)
+    self.fall = Session.objects.create(network=network, name='Fall', slug='fall',
+        start_date=datetime.date(2011, 9, 1), end_date=datetime.date(2011, 12, 1), system_code='1', active=True)
+    self.spring = Session.objects.create(network=network, name='Spring', slug='spring',
+        start_date=datetime.date(2012, 1, 20), end_date=datetime.date(2012, 5, 1), system_code='2', active=True)
+    self.root = tempfile.mkdtemp()
+    self.path = os.path.join(self.root, 'nyu_fall_sections.jsonl.gz')
+    self.payloads = [payload(self.fall, '101', '1001'), payload(self.fall, '101', '1002'),
+        payload(self.fall, '102', '1003')]
+
+  def tearDown(self):
+    shutil.rmtree(self.root)
+
+  def sections(self, session):
+    return sorted(Section.objects.filter(course__session=session).values_list('course__number', 'reference_code'))
+
+  def test_replay_writes_what_was_recorded(self):
+    scraper = Scraper(network='nyu', session=self.fall, record=self.path)
+    for data in self.payloads:
+      scraper.create_section(dict(data))
+    scraper.finish()
+    self.assertEqual(scraper.recorder.recorded, 3)
+    replay = ReplayScraper(network='nyu', session=self.spring, path=self.path)
+    replay.run()
+    replay.finish()
+    self.assertEqual(self.sections(self.spring), self.sections(self.fall))
+    timing = replay.timing()
+    self.assertEqual(timing['sections'], 3)
+    self.assertTrue(timing['queries'] > 0)
+
+  def test_resumed_recording_is_read_straight_on(self):
+    path = part_path(self.path, '7-ab')
+    self.assertEqual(os.path.basename(path), 'nyu_fall_sections.7-ab.jsonl.gz')
+    for data in self.payloads:
+      recorder = SectionRecorder(path, append=True)
+      recorder.write(data)
+      recorder.close()
+    empty = SectionRecorder(os.path.join(self.root, 'empty.jsonl.gz'))
+    empty.close()
+    self.assertEqual([data['reference_code'] for data in read_recording(path)], ['1001', '1002', '1003'])
+    self.assertEqual(list(read_recording(empty.path)), [])
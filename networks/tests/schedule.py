@@ -0,0 +1,103 @@
+from django.utils import unittest
+import datetime, json, math, time
+
+from networks import schedule
+from networks.schedule import SubjectHistory, session_weight, staleness, plan, by_session
+from networks.tests.workqueue import MemoryRedis
+
+HOUR = 3600.0
+NOW = time.mktime(datetime.datetime(2011, 10, 3, 12).timetuple())
+
+class FakeSession(object):
+  def __init__(self, id, slug, start_date=None):
+    self.id, self.slug, self.start_date = id, slug, start_date
+
+class HistoryTest(unittest.TestCase):
+  def setUp(self):
+    self.history = SubjectHistory('nyu', 'fall', MemoryRedis())
+
+  def test_rate_is_a_moving_average_of_observed_changes(self):
+    self.history.record({'ACCT': [100, 100]}, now=NOW)
+    self.assertEqual(self.history.load()['ACCT'], {'sections': 100, 'rate': None, 'refreshed': NOW})
+    self.history.record({'ACCT': [100, 20]}, now=NOW + 2 * HOUR)
+    first = -math.log(0.8) / 2
+    self.assertAlmostEqual(self.history.load()['ACCT']['rate'], first)
+    self.history.record({'ACCT': [50, 0]}, now=NOW + 4 * HOUR)
+    self.assertAlmostEqual(self.history.load()['ACCT']['rate'], (1 - schedule.LEARNING_RATE) * first)
+    self.assertEqual(self.history.load()['ACCT']['sections'], 50)
+
+  def test_runs_that_wrote_everything_only_move_refreshed(self):
+    self.history.record({'ACCT': [10, 1]}, now=NOW)
+    self.history.record({'ACCT': [10, 1]}, now=NOW + HOUR)
+    rate = self.history.load()['ACCT']['rate']
+    self.history.record({'ACCT': [12, 12], 'BIOL': [5, 5]}, changes_known=False, now=NOW + 2 * HOUR)
+    entries = self.history.load()
+    self.assertEqual((entries['ACCT']['rate'], entries['ACCT']['refreshed'], entries['ACCT']['sections']),
+        (rate, NOW + 2 * HOUR, 12))
+    self.assertEqual(entries['BIOL']['rate'], None)
+
+  def test_every_section_changed_is_a_finite_rate(self):
+    self.history.record({'ACCT': [10, 0]}, now=NOW)
+    self.history.record({'ACCT': [10, 10]}, now=NOW + 60)
+    self.assertAlmostEqual(self.history.load()['ACCT']['rate'], -math.log(0.01) / 0.25)
+
+class PlanTest(unittest.TestCase):
+  def setUp(self):
+    self.conn = MemoryRedis()
+    self.fall = FakeSession(1, 'fall', datetime.date(2011, 9, 6))
+    self.spring = FakeSession(2, 'spring', datetime.date(2012, 1, 23))
+
+  def record(self, session, tally, rates):
+    history = SubjectHistory('nyu', session.slug, self.conn)
+    history.record(tally, now=NOW - 10 * HOUR)
+    for subject, rate in rates.items():
+      entry = history.load()[subject]
+      entry['rate'] = rate
+      self.conn.hset(history.key, subject, json.dumps(entry))
+
+  def test_staleness(self):
+    self.assertEqual(staleness({}, NOW), 1.0)
+    self.assertAlmostEqual(staleness({'refreshed': NOW - 10 * HOUR, 'rate': None}, NOW), 1 - math.exp(-0.1))
+    self.assertAlmostEqual(staleness({'refreshed': NOW - 2 * HOUR, 'rate': 0.5}, NOW), 1 - math.exp(-1))
+    self.assertEqual(staleness({'refreshed': NOW + HOUR, 'rate': 0.5}, NOW), 0)
+
+  def test_session_weight_peaks_at_the_start_date(self):
+    start = self.fall.start_date
+    self.assertEqual(session_weight(self.fall, start), 1 + schedule.START_BOOST)
+    self.assertAlmostEqual(session_weight(self.fall, start + datetime.timedelta(schedule.START_WINDOW)),
+        1 + schedule.START_BOOST * math.exp(-0.5))
+    self.assertAlmostEqual(session_weight(self.fall, start - datetime.timedelta(120)), 1)
+    self.assertEqual(session_weight(FakeSession(3, 'summer')), 1)
+
+  def test_unrecorded_session_comes_first_and_whole(self):
+    self.record(self.fall, {'ACCT': [10, 0]}, {'ACCT': 0.1})
+    work = plan('nyu', [self.fall, self.spring], 5, now=NOW, conn=self.conn)
+    self.assertEqual([(item['session'].slug, item['subject'], item['cost']) for item in work], [('spring', None, 0)])
+
+  def test_budget_is_spent_on_the_stalest_subjects(self):
+    self.record(self.fall, {'ACCT': [40, 0], 'BIOL': [30, 0], 'CHEM': [20, 0], 'DANC': [10, 0]},
+        {'ACCT': 0.2, 'BIOL': 0.1, 'CHEM': 0.05, 'DANC': 0.01})
+    work = plan('nyu', [self.fall], 65, now=NOW, conn=self.conn)
+    self.assertEqual([item['subject'] for item in work], ['ACCT', 'CHEM'])
+    self.assertTrue(work[0]['priority'] > work[1]['priority'])
+    self.assertEqual(sum(item['cost'] for item in work), 60)
+    self.assertEqual([item['subject'] for item in plan('nyu', [self.fall], 5, now=NOW, conn=self.conn)], ['ACCT'])
+
+  def test_sessions_compete_through_their_weight(self):
+    self.record(self.fall, {'ACCT': [10, 0]}, {'ACCT': 0.1})
+    self.record(self.spring, {'ACCT': [10, 0]}, {'ACCT': 0.1})
+    self.spring.start_date = datetime.date.fromtimestamp(NOW)
+    work = plan('nyu', [self.fall, self.spring], 10, now=NOW, conn=self.conn)
+    self.assertEqual([item['session'].slug for item in work], ['spring'])
+
+  def test_whole_sessions_without_subjects(self):
+    self.record(self.fall, {'ACCT': [30, 0], 'BIOL': [10, 0]}, {'ACCT': 0.1, 'BIOL': 0.5})
+    [item] = plan('nyu', [self.fall], 100, by_subject=False, now=NOW, conn=self.conn)
+    weight = session_weight(self.fall, datetime.date.fromtimestamp(NOW))
+    self.assertEqual((item['subject'], item['cost']), (None, 40))
+    self.assertAlmostEqual(item['priority'], (30 * (1 - math.exp(-1)) + 10 * (1 - math.exp(-5))) * weight / 40)
+
+  def test_by_session(self):
+    work = [{'session': self.spring, 'subject': 'ACCT'}, {'session': self.fall, 'subject': None},
+        {'session': self.spring, 'subject': 'BIOL'}, {'session': self.fall, 'subject': 'CHEM'}]
+    self.assertEqual(by_session(work), [(self.spring, ['ACCT', 'BIOL']), (self.fall, None)])
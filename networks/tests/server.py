@@ -0,0 +1,47 @@
+import BaseHTTPServer, SocketServer, threading
+
+class LocalServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+  """
+  An HTTP server on a free local port, serving requests with @handler (a
+  BaseHTTPRequestHandler subclass) from a background thread until stop().
+  self.requests lists (method, path, body) of every request it got.
+  """
+  daemon_threads = True
+
+  def __init__(self, handler):
+    BaseHTTPServer.HTTPServer.__init__(self, ('127.0.0.1', 0), handler)
+    self.requests = []
+    self.url = 'http://127.0.0.1:%s' % self.server_address[1]
+    self.thread = threading.Thread(target=self.serve_forever)
+    self.thread.daemon = True
+    self.thread.start()
+
+  def stop(self):
+    self.shutdown()
+    self.server_close()
+
+class Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+  protocol_version = 'HTTP/1.1'
+
+  def do_GET(self):
+    self.server.requests.append(('GET', self.path, None))
+    self.respond()
+
+  def do_POST(self):
+    body = self.rfile.read(int(self.headers.getheader('Content-Length') or 0))
+    self.server.requests.append(('POST', self.path, body))
+    self.respond()
+
+  def respond(self):
+    body = self.page()
+    self.send_response(200)
+    self.send_header('Content-Type', 'text/html')
+    self.send_header('Content-Length', str(len(body)))
+    self.end_headers()
+    self.wfile.write(body)
+
+  def page(self):
+    return 'page %s' % self.path
+
+  def log_message(self, *args):
+    pass
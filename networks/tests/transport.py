@@ -0,0 +1,180 @@
+from django.utils import unittest
+import hashlib, os, shutil, tempfile, time, urllib2
+
+from networks.tests.server import LocalServer, Handler
+from scrapers import transport
+from scrapers.transport import Transport
+from scrapers.httpcache import HTTPCache
+
+class DroppingHandler(Handler):
+  # answers one request per connection, then hangs up without saying so
+  def respond(self):
+    Handler.respond(self)
+    self.wfile.flush()
+    self.close_connection = 1
+
+class ServerTest(unittest.TestCase):
+  handler = Handler
+
+  def setUp(self):
+    self.server = LocalServer(self.handler)
+    self.transport = Transport(compress=False)
+
+  def tearDown(self):
+    self.transport.close()
+    self.server.stop()
+
+class KeepAliveTest(ServerTest):
+  def test_reuses_connection(self):
+    for i in range(3):
+      self.assertEqual(self.transport.open(self.server.url + '/%s' % i).read(), 'page /%s' % i)
+    self.assertEqual(self.transport.stats['connections'], 1)
+    self.assertEqual(self.transport.stats['reused'], 2)
+
+class DroppedConnectionTest(ServerTest):
+  handler = DroppingHandler
+
+  def setUp(self):
+    ServerTest.setUp(self)
+    self.transport.open(self.server.url + '/first').read()
+    time.sleep(0.1) # let the server's close reach us
+
+  def test_opens_new_connection(self):
+    self.assertEqual(self.transport.open(self.server.url + '/postback', 'ICAction=next').read(), 'page /postback')
+    self.assertEqual(self.server.requests[1:], [('POST', '/postback', 'ICAction=next')])
+    self.assertEqual(self.transport.stats['connections'], 2)
+
+class UnnoticedDropTest(ServerTest):
+  handler = DroppingHandler
+
+  # the server hangs up between the check and the request going out
+  def setUp(self):
+    ServerTest.setUp(self)
+    self.transport.open(self.server.url + '/first').read()
+    time.sleep(0.1)
+    self.dropped, transport.dropped = transport.dropped, lambda connection: False
+
+  def tearDown(self):
+    transport.dropped = self.dropped
+    ServerTest.tearDown(self)
+
+  def test_get_is_sent_again(self):
+    self.assertEqual(self.transport.open(self.server.url + '/second').read(), 'page /second')
+    self.assertEqual(self.transport.stats['connections'], 2)
+    self.assertEqual([path for method, path, body in self.server.requests], ['/first', '/second'])
+
+  def test_post_is_not_replayed(self):
+    self.assertRaises(urllib2.URLError, self.transport.open, self.server.url + '/postback', 'ICAction=next')
+    self.assertEqual(self.server.requests, [('GET', '/first', None)])
+
+class CountingBudget(object):
+  def __init__(self):
+    self.waits = 0
+
+  def wait(self):
+    self.waits += 1
+
+class CountingGovernor(object):
+  def __init__(self):
+    self.acquired = []
+
+  def acquire(self, host):
+    self.acquired.append(host)
+    return len(self.acquired)
+
+  def release(self, host, token, latency, error=False, kind=''):
+    pass
+
+class PacingTest(ServerTest):
+  def setUp(self):
+    ServerTest.setUp(self)
+    self.root = tempfile.mkdtemp()
+
+  def tearDown(self):
+    shutil.rmtree(self.root)
+    ServerTest.tearDown(self)
+
+  def test_budget_paces_each_request(self):
+    budget = CountingBudget()
+    paced = Transport(compress=False, budget=budget)
+    for i in range(3):
+      paced.open(self.server.url + '/%s' % i).read()
+    paced.close()
+    self.assertEqual(budget.waits, 3)
+
+  def test_governor_is_the_only_pacer(self):
+    budget, governor = CountingBudget(), CountingGovernor()
+    paced = Transport(compress=False, governor=governor, budget=budget)
+    paced.open(self.server.url + '/page').read()
+    paced.close()
+    self.assertEqual(len(governor.acquired), 1)
+    self.assertEqual(budget.waits, 0)
+
+  def test_cached_pages_are_not_paced(self):
+    online = Transport(compress=False, cache=HTTPCache(self.root))
+    online.open(self.server.url + '/page').read()
+    online.close()
+    budget = CountingBudget()
+    offline = Transport(compress=False, cache=HTTPCache(self.root, offline=True), budget=budget)
+    self.assertEqual(offline.open(self.server.url + '/page').read(), 'page /page')
+    self.assertEqual(offline.stats['cache_hits'], 1)
+    self.assertEqual(budget.waits, 0)
+
+class ValidatingHandler(Handler):
+  # serves self.server.pages ({path: body}), tagged, and 304s a matching If-None-Match
+  def respond(self):
+    body = self.server.pages.get(self.path.split('?')[0], 'page %s' % self.path)
+    etag = '"%s"' % hashlib.md5(body).hexdigest()
+    self.server.conditional.append(self.headers.getheader('If-None-Match'))
+    if self.headers.getheader('If-None-Match') == etag:
+      self.send_response(304)
+      self.send_header('ETag', etag)
+      self.send_header('Content-Length', '0')
+      self.end_headers()
+      return
+    self.send_response(200)
+    self.send_header('Content-Type', 'text/html')
+    self.send_header('ETag', etag)
+    self.send_header('Content-Length', str(len(body)))
+    self.end_headers()
+    self.wfile.write(body)
+
+class CacheTest(ServerTest):
+  handler = ValidatingHandler
+
+  def setUp(self):
+    ServerTest.setUp(self)
+    self.server.pages, self.server.conditional = {}, []
+    self.root = tempfile.mkdtemp()
+    self.transport = Transport(compress=False, cache=HTTPCache(self.root, volatile=['ICSID']))
+
+  def tearDown(self):
+    shutil.rmtree(self.root)
+    ServerTest.tearDown(self)
+
+  def test_unchanged_page_is_revalidated(self):
+    self.server.pages['/page'] = 'first'
+    self.assertEqual(self.transport.open(self.server.url + '/page').read(), 'first')
+    self.assertEqual(self.transport.open(self.server.url + '/page').read(), 'first')
+    self.assertEqual(self.server.conditional, [None, '"%s"' % hashlib.md5('first').hexdigest()])
+    self.assertEqual((self.transport.stats['cache_misses'], self.transport.stats['cache_hits']), (1, 1))
+    self.server.pages['/page'] = 'second'
+    self.assertEqual(self.transport.open(self.server.url + '/page').read(), 'second')
+    self.assertEqual(self.transport.stats['cache_misses'], 2)
+
+  def test_offline_replays_posts_without_volatile_fields(self):
+    self.transport.open(self.server.url + '/search', 'ICSID=abc&subject=ACCT').read()
+    self.transport.open(self.server.url + '/other').read()
+    offline = Transport(compress=False, cache=HTTPCache(self.root, offline=True, volatile=['ICSID']))
+    self.assertEqual(offline.open(self.server.url + '/search', 'subject=ACCT&ICSID=xyz').read(), 'page /search')
+    self.assertRaises(urllib2.URLError, offline.open, self.server.url + '/search', 'subject=BIOL&ICSID=xyz')
+    self.assertEqual((offline.stats['cache_hits'], offline.stats['cache_misses']), (1, 1))
+    self.assertEqual(len(self.server.requests), 2)
+
+  def test_identical_bodies_are_stored_once(self):
+    self.server.pages.update({'/a': 'same', '/b': 'same'})
+    self.transport.open(self.server.url + '/a').read()
+    self.transport.open(self.server.url + '/b').read()
+    bodies = [name for path, dirs, names in os.walk(os.path.join(self.root, 'bodies')) for name in names]
+    entries = [name for path, dirs, names in os.walk(os.path.join(self.root, 'entries')) for name in names]
+    self.assertEqual((len(bodies), len(entries)), (1, 2))
@@ -0,0 +1,96 @@
+from django.utils import unittest
+import random, threading, time
+
+from scrapers.concurrency import RequestBudget, ordered_map, thread_pool
+from scrapers.ucla import UCLAScraper
+
+class StubUCLAScraper(UCLAScraper):
+  # the registrar's pages stood in for by a fixed listing, fetched at random speeds
+  def __init__(self, workers, broken=()):
+    self.workers, self.term, self.broken = workers, '11F', set(broken)
+    self.calls, self.threads = [], set()
+    self.plan, self.checkpoint, self.known_subjects = None, None, set()
+
+  def _fetch(self, result):
+    self.threads.add(threading.current_thread().name)
+    time.sleep(random.random() * 0.005)
+    return result
+
+  def _get_subjects(self):
+    return [{'code': code, 'name': code} for code in ('ANTHRO', 'BIOL', 'CHEM')]
+
+  def _get_courses(self, term, subject):
+    return self._fetch([{'code': '%s%s' % (subject['code'], i), 'name': '%s' % i} for i in range(3)])
+
+  def _get_sections(self, term, subject, course):
+    return self._fetch([{'reference_code': '%s-%s' % (course['code'], i), 'classification': subject['code']}
+        for i in range(4)])
+
+  def _get_section_detail(self, term, code, section):
+    if code in self.broken:
+      raise ValueError(code)
+    if code.endswith('-3'):
+      return self._fetch((None, None))
+    return self._fetch(({'reference_code': code}, 'digest %s' % code))
+
+  def already_done(self, code):
+    return False
+
+  def create_section(self, data, digest=None):
+    self.calls.append(('create', data['reference_code'], digest))
+
+  def skip_page(self, code, subject=None):
+    self.calls.append(('skip', code, subject))
+
+  def subject_done(self, subject):
+    self.calls.append(('done', subject))
+
+  def _log_error(self, e):
+    self.calls.append(('error', '%s' % e))
+
+class ConcurrentUCLATest(unittest.TestCase):
+  def test_same_sections_in_the_same_order(self):
+    serial = StubUCLAScraper(1)
+    serial.run()
+    concurrent = StubUCLAScraper(4)
+    concurrent.run()
+    self.assertEqual(concurrent.calls, serial.calls)
+    self.assertEqual(len([call for call in serial.calls if call[0] == 'create']), 27)
+    self.assertTrue(len(concurrent.threads) > 1)
+
+  def test_subject_with_a_failed_page_is_not_done(self):
+    scraper = StubUCLAScraper(4, broken=['BIOL1-2'])
+    scraper.run()
+    self.assertTrue(('error', 'BIOL1-2') in scraper.calls)
+    self.assertEqual([call for call in scraper.calls if call[0] == 'done'], [('done', 'ANTHRO'), ('done', 'CHEM')])
+
+class ConcurrencyTest(unittest.TestCase):
+  def test_ordered_map_keeps_order_and_errors(self):
+    pool = thread_pool(4)
+    try:
+      def fn(i):
+        time.sleep(random.random() * 0.005)
+        if i == 3:
+          raise ValueError(i)
+        return i * i
+      results = list(ordered_map(pool, fn, range(8)))
+    finally:
+      pool.terminate()
+      pool.join()
+    self.assertEqual([(item, result) for item, result, error in results], [(i, None if i == 3 else i * i) for i in range(8)])
+    self.assertEqual([item for item, result, error in results if error], [3])
+
+  def test_budget_spaces_callers_across_threads(self):
+    budget = RequestBudget(50)
+    turns = []
+    def take():
+      budget.wait()
+      turns.append(time.time())
+    threads = [threading.Thread(target=take) for i in range(5)]
+    for thread in threads:
+      thread.start()
+    for thread in threads:
+      thread.join()
+    turns.sort()
+    self.assertTrue(min(b - a for a, b in zip(turns, turns[1:])) > 0.015)
+    self.assertEqual(RequestBudget().interval, 0)
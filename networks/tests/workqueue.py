@@ -0,0 +1,163 @@
+from django.utils import unittest
+import json, time
+
+from networks import workqueue
+from networks.workqueue import WorkQueue, Heartbeat, MAX_ATTEMPTS
+
+class MemoryRedis(object):
+  # just the commands WorkQueue uses, with redis' return values
+  def __init__(self):
+    self.data = {}
+
+  def hash(self, key):
+    return self.data.setdefault(key, {})
+
+  def hmset(self, key, mapping):
+    self.hash(key).update((field, str(value)) for field, value in mapping.items())
+
+  def hset(self, key, field, value):
+    self.hash(key)[field] = str(value)
+
+  def hget(self, key, field):
+    return self.data.get(key, {}).get(field)
+
+  def hgetall(self, key):
+    return dict(self.data.get(key, {}))
+
+  def hdel(self, key, *fields):
+    return len([field for field in fields if self.hash(key).pop(field, None) is not None])
+
+  def hincrby(self, key, field, amount=1):
+    self.hset(key, field, int(self.hget(key, field) or 0) + amount)
+    return int(self.hget(key, field))
+
+  def lpush(self, key, value):
+    self.data.setdefault(key, []).insert(0, value)
+
+  def rpoplpush(self, source, destination):
+    if not self.data.get(source):
+      return None
+    value = self.data[source].pop()
+    self.lpush(destination, value)
+    return value
+
+  def lrange(self, key, start, end):
+    return list(self.data.get(key, []))
+
+  def lrem(self, key, value, count):
+    items = self.data.get(key, [])
+    removed = items.count(value)
+    items[:] = [item for item in items if item != value]
+    return removed
+
+  def llen(self, key):
+    return len(self.data.get(key, []))
+
+  def sadd(self, key, value):
+    self.data.setdefault(key, set()).add(value)
+
+  def srem(self, key, value):
+    self.data.get(key, set()).discard(value)
+
+  def smembers(self, key):
+    return set(self.data.get(key, set()))
+
+  def scard(self, key):
+    return len(self.data.get(key, set()))
+
+  def setnx(self, key, value):
+    if key in self.data:
+      return False
+    self.data[key] = str(value)
+    return True
+
+  def expire(self, key, seconds):
+    pass
+
+class Clock(object):
+  def __init__(self):
+    self.now = 1000.0
+
+  def time(self):
+    return self.now
+
+class WorkQueueTest(unittest.TestCase):
+  def setUp(self):
+    self.clock = Clock()
+    workqueue.time = self.clock
+    self.queue = WorkQueue(MemoryRedis())
+    self.tasks = [{'subjects': ['ACCT']}, {'subjects': ['BIOL']}]
+    self.queue.enqueue('7', 'nyu', 'fall', self.tasks, {'resume': True})
+
+  def tearDown(self):
+    workqueue.time = time
+
+  def claim(self, name='a', lease=60):
+    runid, job, task = self.queue.claim(name, lease)
+    return json.loads(task)
+
+  def test_tasks_are_taken_in_order_under_a_lease(self):
+    self.queue.enqueue('12', 'nyu', 'spring', [{'subjects': ['CHEM']}], {})
+    self.assertEqual(self.queue.jobs(), ['7', '12'])
+    runid, job, task = self.queue.claim('a', 60)
+    self.assertEqual((runid, job['session'], job['kwargs'], json.loads(task)), ('7', 'fall', {'resume': True}, self.tasks[0]))
+    self.assertEqual(json.loads(self.queue.r.hget('workqueue:7:leases', task)), {'worker': 'a', 'expires': 1060.0})
+    self.assertEqual(self.claim('b'), self.tasks[1])
+    self.assertEqual(self.claim('c'), {'subjects': ['CHEM']})
+    self.assertEqual(self.queue.claim('d'), None)
+    progress = self.queue.progress('7')
+    self.assertEqual((progress['pending'], progress['active'], progress['workers']), (0, 2, ['a', 'b']))
+
+  def test_expired_lease_goes_back_in_line(self):
+    first = self.claim('a', 60)
+    self.clock.now += 30
+    self.assertEqual(self.claim('b', 60), self.tasks[1])
+    self.clock.now += 31
+    self.assertEqual(self.claim('c', 60), first)
+    self.assertEqual(self.queue.r.hget('workqueue:7:attempts', json.dumps(first, sort_keys=True)), '2')
+    self.assertEqual(self.queue.progress('7')['workers'], ['b', 'c'])
+
+  def test_renewal_keeps_the_lease(self):
+    runid, job, task = self.queue.claim('a', 60)
+    self.clock.now += 50
+    self.queue.renew(runid, task, 'a', 60)
+    self.clock.now += 50
+    self.queue.reap(runid)
+    self.assertEqual(self.queue.r.lrange('workqueue:7:active', 0, -1), [task])
+
+  def test_task_taken_before_its_lease_was_written_gets_one(self):
+    task = self.queue.r.rpoplpush('workqueue:7:pending', 'workqueue:7:active')
+    self.queue.reap('7')
+    self.clock.now += workqueue.LEASE_SECONDS - 1
+    self.assertEqual(self.claim('b'), self.tasks[1])
+    self.assertEqual(self.queue.r.lrange('workqueue:7:active', 0, -1)[-1], task)
+
+  def test_failures_are_retried_then_given_up_on(self):
+    runid, job, task = self.queue.claim('a')
+    self.assertFalse(self.queue.fail(runid, task, 'attempt 1'))
+    runid, job, held = self.queue.claim('b')
+    self.assertEqual(json.loads(held), self.tasks[1])
+    for attempt in range(2, MAX_ATTEMPTS + 1):
+      self.assertEqual(self.claim('a'), self.tasks[0])
+      self.assertFalse(self.queue.fail(runid, task, 'attempt %s' % attempt))
+    self.assertEqual(self.queue.failed('7'), {task: 'attempt %s' % MAX_ATTEMPTS})
+    self.assertEqual(self.queue.claim('a'), None)
+    self.assertTrue(self.queue.complete(runid, held))
+    self.assertFalse(self.queue.complete(runid, held))
+    progress = self.queue.progress('7')
+    self.assertEqual((progress['done'], progress['failed'], progress['active']), (1, 1, 0))
+
+  def test_heartbeat_renews_until_stopped(self):
+    workqueue.time = time
+    runid, job, task = self.queue.claim('a', 0.06)
+    heartbeat = Heartbeat(self.queue, runid, task, 'a', 0.06)
+    heartbeat.start()
+    time.sleep(0.2)
+    self.queue.reap(runid)
+    self.assertEqual(self.queue.r.lrange('workqueue:7:active', 0, -1), [task])
+    heartbeat.stop()
+    heartbeat.join(1)
+    self.assertFalse(heartbeat.is_alive())
+    time.sleep(0.1)
+    self.queue.reap(runid)
+    self.assertEqual(self.queue.r.lrange('workqueue:7:active', 0, -1), [])
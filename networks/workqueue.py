@@ -0,0 +1,156 @@
+from django.conf import settings
+import json, redis, threading, time
+
+LEASE_SECONDS = 600 # a worker that hasn't renewed its lease for this long is presumed dead
+MAX_ATTEMPTS = 3 # times a task is taken before it is given up on
+KEEP_SECONDS = 7 * 24 * 3600 # how long a finished job's keys stay around
+
+class WorkQueue(object):
+  """
+  Scrapes split into tasks that workers on any number of nodes take from redis.
+
+  A job is one run of a network's session, under its runlog id; each task is a
+  dict of scraper kwargs limiting the run to part of the session, such as
+  {'subjects': ['ACCT']} or {'urls': [...]} (see Scraper.work_units), stored as
+  json. Under workqueue:<runid>:
+    (the hash itself)  network, session, kwargs (json), total, created
+    :pending           list of tasks waiting, next at the right
+    :active            list of tasks a worker has taken
+    :leases            hash task -> json {worker, expires}
+    :attempts          hash task -> times taken
+    :done              set of finished tasks
+    :failed            hash task -> last error, for tasks given up on
+  and workqueue:jobs is the set of runids with work left.
+
+  A worker holds its task under a lease, renewed while it works (Heartbeat). A
+  task whose lease ran out goes back to the end of pending, as does one that
+  failed, until it has been taken MAX_ATTEMPTS times.
+  """
+  def __init__(self, conn=None):
+    self.r = conn or redis.Redis(settings.REDIS_HOST)
+
+  def key(self, runid, suffix=''):
+    return 'workqueue:%s%s' % (runid, suffix)
+
+  def enqueue(self, runid, network, session, tasks, kwargs):
+    tasks = [json.dumps(task, sort_keys=True) for task in tasks]
+    self.r.hmset(self.key(runid), {'network': network, 'session': session, 'total': len(tasks),
+        'kwargs': json.dumps(kwargs, sort_keys=True), 'created': time.time()})
+    for task in tasks:
+      self.r.lpush(self.key(runid, ':pending'), task)
+    self.r.sadd('workqueue:jobs', runid)
+
+  def jobs(self):
+    return sorted(self.r.smembers('workqueue:jobs') or (), key=int)
+
+  def job(self, runid):
+    job = self.r.hgetall(self.key(runid)) or {}
+    if job:
+      job['kwargs'] = json.loads(job['kwargs'])
+    return job
+
+  ##
+  # The next task of the oldest job with any waiting, as (runid, job, task), taken
+  # by worker @name under a lease of @lease seconds; None if there is nothing to do.
+  def claim(self, name, lease=LEASE_SECONDS):
+    for runid in self.jobs():
+      self.reap(runid)
+      task = self.r.rpoplpush(self.key(runid, ':pending'), self.key(runid, ':active'))
+      if task is None:
+        continue
+      self.r.hincrby(self.key(runid, ':attempts'), task, 1)
+      self.renew(runid, task, name, lease)
+      return runid, self.job(runid), task
+    return None
+
+  def renew(self, runid, task, name, lease=LEASE_SECONDS):
+    self.r.hset(self.key(runid, ':leases'), task, json.dumps({'worker': name, 'expires': time.time() + lease}))
+
+  ##
+  # Put the tasks of workers that stopped renewing their leases back in line.
+  def reap(self, runid):
+    now = time.time()
+    leases = self.r.hgetall(self.key(runid, ':leases')) or {}
+    for task in self.r.lrange(self.key(runid, ':active'), 0, -1):
+      if task not in leases:
+        # just taken, or its worker died before writing the lease: give it one
+        self.renew(runid, task, None)
+        continue
+      lease = json.loads(leases[task])
+      if lease['expires'] < now and self.r.lrem(self.key(runid, ':active'), task, 0):
+        self.r.hdel(self.key(runid, ':leases'), task)
+        self._retry(runid, task, 'lease of %s expired' % lease['worker'])
+
+  ##
+  # @task is finished; True if that finished the job, for exactly one caller.
+  def complete(self, runid, task):
+    self._release(runid, task)
+    self.r.lrem(self.key(runid, ':pending'), task, 0) # in case it was reaped meanwhile
+    self.r.hdel(self.key(runid, ':failed'), task)
+    self.r.sadd(self.key(runid, ':done'), task)
+    return self._finished(runid)
+
+  ##
+  # @task raised @error: it is retried, or given up on after MAX_ATTEMPTS. True if
+  # that finished the job, as for complete().
+  def fail(self, runid, task, error):
+    self._release(runid, task)
+    self._retry(runid, task, error)
+    return self._finished(runid)
+
+  def failed(self, runid):
+    return self.r.hgetall(self.key(runid, ':failed')) or {}
+
+  def progress(self, runid):
+    job = self.job(runid)
+    leases = [json.loads(lease) for lease in (self.r.hgetall(self.key(runid, ':leases')) or {}).values()]
+    return {
+      'network': job.get('network'),
+      'session': job.get('session'),
+      'total': int(job.get('total', 0)),
+      'pending': self.r.llen(self.key(runid, ':pending')),
+      'active': self.r.llen(self.key(runid, ':active')),
+      'done': self.r.scard(self.key(runid, ':done')),
+      'failed': len(self.failed(runid)),
+      'workers': sorted(set(lease['worker'] for lease in leases if lease['worker'])),
+    }
+
+  ##
+  # The job is over: it leaves workqueue:jobs, and its keys expire after KEEP_SECONDS.
+  def close(self, runid):
+    self.r.srem('workqueue:jobs', runid)
+    for suffix in ('', ':pending', ':active', ':leases', ':attempts', ':done', ':failed', ':finished'):
+      self.r.expire(self.key(runid, suffix), KEEP_SECONDS)
+
+  def _release(self, runid, task):
+    self.r.lrem(self.key(runid, ':active'), task, 0)
+    self.r.hdel(self.key(runid, ':leases'), task)
+
+  def _retry(self, runid, task, error):
+    if int(self.r.hget(self.key(runid, ':attempts'), task) or 0) < MAX_ATTEMPTS:
+      self.r.lpush(self.key(runid, ':pending'), task)
+    else:
+      self.r.hset(self.key(runid, ':failed'), task, error)
+
+  def _finished(self, runid):
+    total = int(self.r.hget(self.key(runid), 'total') or 0)
+    if self.r.scard(self.key(runid, ':done')) + len(self.failed(runid)) < total:
+      return False
+    return bool(self.r.setnx(self.key(runid, ':finished'), time.time()))
+
+class Heartbeat(threading.Thread):
+  """
+  Renews a task's lease every third of @lease seconds until stop() is called.
+  """
+  def __init__(self, queue, runid, task, name, lease=LEASE_SECONDS):
+    super(Heartbeat, self).__init__()
+    self.daemon = True
+    self.queue, self.runid, self.task, self.name, self.lease = queue, runid, task, name, lease
+    self.stopped = threading.Event()
+
+  def run(self):
+    while not self.stopped.wait(self.lease / 3.0):
+      self.queue.renew(self.runid, self.task, self.name, self.lease)
+
+  def stop(self):
+    self.stopped.set()
@@ -6,26 +6,24 @@ from scrapers.flatpage import FlatpageScraper
 #http://www.college.columbia.edu/unify/bulletinSearch.php?school=CC&header=www.college.columbia.edu/include/popup_header.php&subjectVar=AMST&termVar=x
 
 class ColumbiaScraper(FlatpageScraper):
+  base_url = 'http://www.columbia.edu/cu/bulletin/uwb/subj/'
+  
   def __init__(self, *args, **kwargs):
     super(ColumbiaScraper, self).__init__(*args, **kwargs)
   
-  def get_all_urls(self):
+  def get_index_urls(self):
     # get list of all subjects
-    page = urllib2.urlopen('http://www.columbia.edu/cu/bulletin/uwb/subj/').read()
+    page = self._fetch(self.base_url)
     subject_codes = re.findall(">([A-Z]{4})\/<", page)
     print "%s subjects found." % len(subject_codes)
-    
-    for subject in subject_codes:
-      # get list of all courses in subject
-      page = urllib2.urlopen('http://www.columbia.edu/cu/bulletin/uwb/subj/%s/' % subject).read()
-      course_codes = re.findall(">(\w+-%s-\w+)\/<" % self.session.system_code, page)
-      
-      for course in course_codes:
-        self.urls.append('http://www.columbia.edu/cu/bulletin/uwb/subj/%s/%s/' % (subject, course))
-      
-      print "%s courses found in %s." % (len(course_codes), subject)
-    
-    print "%s courses found total." % len(self.urls)
+    return ['%s%s/' % (self.base_url, subject) for subject in subject_codes]
+  
+  def parse_index(self, url, page):
+    # list of all courses in subject
+    subject = url.split('/')[-2]
+    course_codes = re.findall(">(\w+-%s-\w+)\/<" % self.session.system_code, page)
+    print "%s courses found in %s." % (len(course_codes), subject)
+    return ['%s%s/%s/' % (self.base_url, subject, course) for course in course_codes]
   
   def parse_url(self, url, soup):
     section_data = {
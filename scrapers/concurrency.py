@@ -0,0 +1,43 @@
+from multiprocessing.pool import ThreadPool
+import itertools, threading, time
+
+class RequestBudget(object):
+  """
+  Caps the request rate to one host: wait() returns no sooner than 1/per_second
+  after the previous caller's turn, whichever thread that was. per_second=None
+  means no cap.
+  """
+  def __init__(self, per_second=None):
+    self.interval = 1.0 / per_second if per_second else 0
+    self.lock = threading.Lock()
+    self.next = 0.0
+
+  def wait(self):
+    if not self.interval:
+      return
+    self.lock.acquire()
+    try:
+      now = time.time()
+      turn = max(now, self.next)
+      self.next = turn + self.interval
+    finally:
+      self.lock.release()
+    if turn > now:
+      time.sleep(turn - now)
+
+##
+# Call fn(item) for every item on @pool and yield (item, result, error) in the
+# order of @items; error is the exception fn raised, if any, so the caller can log
+# it from its own thread.
+def ordered_map(pool, fn, items):
+  def call(item):
+    try:
+      return fn(item), None
+    except Exception, e:
+      return None, e
+  items = list(items)
+  for item, (result, error) in itertools.izip(items, pool.imap(call, items)):
+    yield item, result, error
+
+def thread_pool(workers):
+  return ThreadPool(workers)
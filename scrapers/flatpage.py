@@ -1,18 +1,122 @@
-import urllib2, urllib, re, time
+import urllib2, urllib, re, time, Queue
 from BeautifulSoup import BeautifulSoup
 
 from scrapers.general import Scraper
+from scrapers.concurrency import thread_pool
 
 class FlatpageScraper(Scraper):
+  """
+  Scrapes registrars that publish one static page per course. Subclasses either
+  fill self.urls in get_all_urls(), or list their index pages in get_index_urls()
+  and pull page urls out of each index in parse_index(). Every page is handed to
+  parse_url(url, soup).
+  """
   def __init__(self, *args, **kwargs):
     super(FlatpageScraper, self).__init__(*args, **kwargs)
     self.urls = []
+    
+    # workers=N fetches index and course pages on N threads, discovering and
+    # fetching at the same time; the transport paces them either way (max_rps)
+    self.workers = kwargs.get('workers') or 1
+    self.pages = 0
+    self.fetch_seconds = 0.0
+    
+    # urls=[...] fetches just those pages, skipping the index (a networks.workqueue
+    # task); work_units() deals the session's pages out url_batch at a time
+    self.assigned_urls = kwargs.get('urls')
+    self.url_batch = kwargs.get('url_batch') or 50
   
   def run(self):
+    start = time.time()
+    if self.workers > 1:
+      self._run_concurrently()
+    else:
+      if self.assigned_urls is None:
+        self.get_all_urls()
+      else:
+        self.urls = list(self.assigned_urls)
+      for url in self.urls:
+        try:
+          self._process_url(url)
+        except Exception, e:
+          self._log_error("%s: %s\n\n" % (url, e))
+    self.fetch_seconds = time.time() - start
+    print "%s pages in %.1fs (%.1f pages/s)" % (self.pages, self.fetch_seconds, self.pages_per_second())
+  
+  def work_units(self):
     self.get_all_urls()
-    for url in self.urls:
-      self._process_url(url)
+    return [{'urls': self.urls[i:i + self.url_batch]} for i in range(0, len(self.urls), self.url_batch)]
+  
+  def get_all_urls(self):
+    for url in self.get_index_urls():
+      self.urls.extend(self.parse_index(url, self._fetch(url)))
+  
+  def get_index_urls(self):
+    return []
+  
+  def parse_index(self, url, page):
+    return []
+  
+  def pages_per_second(self):
+    return self.pages / max(self.fetch_seconds, 1e-6)
+  
+  def summary(self):
+    stats = super(FlatpageScraper, self).summary()
+    stats.update({'pages': self.pages, 'pages_per_second': round(self.pages_per_second(), 1)})
+    return stats
+  
+  def _fetch(self, url):
+    return self.transport.open(url).read()
   
   def _process_url(self, url):
-    soup = BeautifulSoup(urllib2.urlopen(url))
-    self.parse_url(url, soup)
\ No newline at end of file
+    soup = self.timed('parse', BeautifulSoup, self._fetch(url))
+    self.pages += 1
+    self.parse_url(url, soup)
+  
+  ##
+  # Index and course pages are fetched (and course pages parsed into soup) on the
+  # pool; this thread picks up each result as it lands, queueing the pages an index
+  # lists and passing course pages to parse_url in arrival order. Only this thread
+  # touches the database.
+  def _run_concurrently(self):
+    results = Queue.Queue()
+    def fetch(kind, url):
+      try:
+        page = self._fetch(url)
+        if kind == 'page':
+          page = self.timed('parse', BeautifulSoup, page)
+        results.put((kind, url, page, None))
+      except Exception, e:
+        results.put((kind, url, None, e))
+    
+    pool = thread_pool(self.workers)
+    try:
+      outstanding = 0
+      if self.assigned_urls is None:
+        for url in self.get_index_urls():
+          pool.apply_async(fetch, ('index', url))
+          outstanding += 1
+      else:
+        for url in self.assigned_urls:
+          self.urls.append(url)
+          pool.apply_async(fetch, ('page', url))
+          outstanding += 1
+      while outstanding:
+        kind, url, page, error = results.get()
+        outstanding -= 1
+        if error:
+          self._log_error("%s: %s\n\n" % (url, error))
+        elif kind == 'index':
+          for page_url in self.parse_index(url, page):
+            self.urls.append(page_url)
+            pool.apply_async(fetch, ('page', page_url))
+            outstanding += 1
+        else:
+          self.pages += 1
+          try:
+            self.parse_url(url, page)
+          except Exception, e:
+            self._log_error("%s: %s\n\n" % (url, e))
+    finally:
+      pool.terminate()
+      pool.join()
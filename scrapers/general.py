@@ -1,18 +1,160 @@
-from api.helpers import create_section
+from api.helpers import create_section, create_course_sections
+from api.db import in_savepoint
+from api.ingest import SectionIngest
+from api.dimensions import DimensionCache
+from api.fingerprints import SectionFingerprints
+from api.indexing import DeferredIndexer
+from api.recording import SectionRecorder, recording_path, part_path
+from api.metrics import RunMetrics, timed
+from api.sweep import sweep_session, section_key
+from api.refresh import refresh_seats, seat_row
+from scrapers.transport import Transport
+from scrapers.httpcache import HTTPCache
+from scrapers.governor import HostGovernor
+from scrapers.concurrency import RequestBudget
+from courses.models import Course
 from django.conf import settings
+from django.db import transaction
 from networks.models import Network
 from django.template.defaultfilters import slugify
+import time
 
 class Scraper(object):
+  # whether run() honours subjects= (see planned)
+  plannable = False
+  
   def __init__(self, *args, **kwargs):
     self.debug = kwargs.get('debug', False)
     self.processed = 0
+    self.skipped = 0
+    self.errors = 0
     self._set_session(**kwargs)
-    open(settings.LOG_ROOT + '%s_%s_errors.log' % (self.network.slug, self.session.slug), 'w').close()
+    # part=NAME, one task of a run split across workers (networks.workqueue), keeps
+    # its error log and recording in files of its own, appended to across attempts
+    self.part = kwargs.get('part')
+    if self.part:
+      self.error_log = settings.LOG_ROOT + '%s_%s_%s_errors.log' % (self.network.slug, self.session.slug, self.part)
+    else:
+      self.error_log = settings.LOG_ROOT + '%s_%s_errors.log' % (self.network.slug, self.session.slug)
+      open(self.error_log, 'w').close()
     self._log_error('test')
+    self.errors = 0 # counts what _log_error records during the run; see sweep
+    
+    # pages are fetched through self.transport: pooled keep-alive connections and
+    # gzip unless keep_alive=False / compress=False, timeout=N seconds per request.
+    # http_cache=True (or a directory) keeps every response on disk and revalidates
+    # it on the next run; offline=True replays a cached run without the network
+    if kwargs.get('http_cache') or kwargs.get('offline'):
+      root = kwargs.get('http_cache')
+      if not root or root is True:
+        root = getattr(settings, 'HTTP_CACHE_ROOT', settings.LOG_ROOT + 'http_cache/')
+      cache = HTTPCache(root, offline=kwargs.get('offline', False))
+    else:
+      cache = None
+    # max_rps caps the requests per second this scraper sends; govern=True paces
+    # them per host with a HostGovernor shared through redis with every other
+    # scraper instead, max_rps still capping this one. Pages served from the cache,
+    # and offline runs, aren't paced at all.
+    if kwargs.get('offline'):
+      governor, budget = None, None
+    elif kwargs.get('govern'):
+      governor, budget = HostGovernor(kwargs.get('max_rps')), None
+    else:
+      governor, budget = None, RequestBudget(kwargs.get('max_rps'))
+    # self.metrics times each phase of the run, fetch, parse (scrapers call
+    # timed()), normalize (the writes' clean() calls), ingest (each course or batch
+    # written), commit, refresh and index, and counts pages, bytes and sections;
+    # NetworkScraper saves it to redis next to the run's runlog
+    self.metrics = RunMetrics()
+    self.transport = Transport(kwargs.get('keep_alive', True), kwargs.get('compress', True), kwargs.get('timeout'),
+        cache=cache, governor=governor, budget=budget, metrics=self.metrics)
+    
+    self.dimensions = DimensionCache()
+    self.dimensions.prime(self.network, slug=self.network.slug)
+    self.dimensions.prime(self.institution, slug=self.institution.slug)
+    self.dimensions.prime(self.session, id=self.session.id)
+    
+    # skip_unchanged=True drops sections identical to what the last run wrote, and
+    # lets scrapers skip parsing detail pages identical to last run's (page_unchanged)
+    if kwargs.get('skip_unchanged'):
+      self.fingerprints = SectionFingerprints(self.network.slug, self.session.slug)
+    else:
+      self.fingerprints = None
+    self.pages_skipped = 0
+    
+    # sections are held back until their course is complete (see create_section);
+    # coalesce=False writes each one as soon as it arrives
+    self.coalesce = kwargs.get('coalesce', True)
+    self._course_key = None
+    self._course_sections = []
+    
+    # commit_every=N / commit_seconds=T run the scrape's writes in one managed
+    # transaction, committed every N sections or T seconds, whichever comes first
+    self.commit_every = kwargs.get('commit_every')
+    self.commit_seconds = kwargs.get('commit_seconds')
+    self.transactional = bool(self.commit_every or self.commit_seconds)
+    self._in_transaction = False
+    self._uncommitted = 0
+    if self.transactional and self.fingerprints:
+      self.fingerprints.autocommit = False
+    
+    # defer_index=True stops courses being reindexed on every save; each course
+    # written during the run is reindexed once, at the next commit or in finish()
+    if kwargs.get('defer_index'):
+      self.indexer = DeferredIndexer(Course)
+    else:
+      self.indexer = None
+    
+    # record=True keeps every section_data of the run in a gzipped JSONL file under
+    # LOG_ROOT (or at the path given) for scrapers.replay.ReplayScraper to load later
+    if kwargs.get('record'):
+      path = kwargs['record']
+      if path is True:
+        path = recording_path(self.network.slug, self.session.slug, self.part)
+      elif self.part:
+        path = part_path(path, self.part)
+      self.recorder = SectionRecorder(path, append=bool(self.part))
+    else:
+      self.recorder = None
+    
+    # sweep=True retires sections (and emptied courses) this run never saw, once the
+    # run has finished; only for scrapers that walk the entire session. self.seen
+    # holds the api.sweep.section_key of every section seen
+    self.sweeping = kwargs.get('sweep', False)
+    self.seen = set()
+    self.swept = None
+    
+    # subjects=[code, ...], a work plan from networks.schedule, limits the run to
+    # those subjects in that order, plus any not in known_subjects (new since the
+    # plan's history was recorded). Such a run never sweeps. Either way,
+    # self.tally counts each subject's sections seen and changed, for the schedule
+    self.plan = kwargs.get('subjects')
+    self.known_subjects = set(kwargs.get('known_subjects') or ())
+    self.tally = {}
+    
+    # a RunCheckpoint (see resume_from) records finished subjects and written
+    # sections as the run goes, once per commit or subject, so that a restart can
+    # skip them
+    self.checkpoint = None
+    self.resumed = 0
+    self._unrecorded = []
+    
+    # refresh_seats=True only writes status, seats and waitlist counts (see api.refresh),
+    # 500 sections at a time; everything else in section_data is ignored
+    self.refreshing = kwargs.get('refresh_seats', False)
+    self._seat_rows = []
+    self.refreshed = {}
+    
+    # batch_size=N buffers sections and writes them N at a time through api.ingest
+    if kwargs.get('batch_size'):
+      self.ingest = SectionIngest(kwargs['batch_size'], log_error=self._log_error,
+          cache=self.dimensions, fingerprints=self.fingerprints, indexer=self.indexer, metrics=self.metrics)
+    else:
+      self.ingest = None
   
   def _log_error(self, e):
-    f = open(settings.LOG_ROOT + '%s_%s_errors.log' % (self.network.slug, self.session.slug), 'a')
+    self.errors += 1
+    f = open(self.error_log, 'a')
     f.write('%s' % e)
     f.close()
   
@@ -27,16 +169,331 @@ class Scraper(object):
     except Exception, e:
       self._log_error(e)
   
-  def create_section(self, section_data):
+  ##
+  # @page_digest is the digest of the detail page section_data was parsed from, if
+  # the scraper checked it with page_unchanged.
+  def create_section(self, section_data, page_digest=None):
     try:
       section_data['network'] = self.network.slug
       section_data['institution'] = self.network.institution.slug
       section_data['session'] = self.session.id
+      if self.already_done(section_data['reference_code']):
+        return
       self.processed += 1
+      key = section_key(section_data)
+      self.seen.add(key)
       print "*** %s sections processed." % self.processed
-      result = create_section(section_data)
+      if self.recorder:
+        self.recorder.write(section_data)
+      if self.fingerprints and page_digest:
+        self.fingerprints.saw_page(section_data['reference_code'], page_digest)
+      if self.fingerprints and self.fingerprints.matches(section_data):
+        self.skipped += 1
+        self.fingerprints.confirm_pages(section_data['reference_code'])
+        self._tally(section_data.get('classification'), False)
+        self._completed(key)
+        return
+      self._tally(section_data.get('classification'), True)
     except Exception, e:
       self._log_error("%s:\n%s\n\n" % (e, section_data))
+      return
+    
+    if self.refreshing:
+      self._seat_rows.append(seat_row(section_data))
+      if len(self._seat_rows) >= 500:
+        self._refresh()
+      return
+    
+    # Scrapers emit a course's sections back to back, each repeating the course's
+    # name, description and grading. Hold them until the next course starts and
+    # write the course once for all of them.
+    key = self._get_course_key(section_data)
+    if key != self._course_key:
+      self._write_course()
+      self._course_key = key
+    self._course_sections.append(section_data)
+    if not self.coalesce:
+      self._write_course()
+  
+  ##
+  # For scrapers with a section's detail page in hand, and its page_digest (None
+  # without skip_unchanged): the reference code of the section if the page is the
+  # one last run parsed and wrote, so it needn't be parsed at all; then call
+  # skip_page(code). Pass @reference_code when it is known without parsing;
+  # otherwise the digest is looked up across the session. Safe on worker threads.
+  def page_unchanged(self, digest, reference_code=None):
+    if digest is None or not self.fingerprints or self.recorder:
+      return None
+    if reference_code is None:
+      return self.fingerprints.page_match(digest)
+    if self.fingerprints.known_pages().get('%s' % reference_code) == digest:
+      return reference_code
+    return None
+  
+  def skip_page(self, reference_code, subject=None):
+    self.processed += 1
+    self.skipped += 1
+    self.pages_skipped += 1
+    self.seen.add('%s' % reference_code)
+    self._tally(subject, False)
+    self._completed('%s' % reference_code)
+  
+  ##
+  # Carry on from @checkpoint, an earlier attempt at this run (or a new one): its
+  # finished subjects are left out of planned(), and its sections count as seen.
+  def resume_from(self, checkpoint):
+    self.checkpoint = checkpoint
+    self.seen.update(checkpoint.written)
+    if self.recorder and (checkpoint.subjects or checkpoint.sections):
+      # keep what was recorded before the restart
+      self.recorder.append = True
+  
+  ##
+  # True if this run already wrote the section before it was restarted; for
+  # scrapers that know a section's reference code before fetching its page.
+  def already_done(self, reference_code):
+    if not self.checkpoint or '%s' % reference_code not in self.checkpoint.sections:
+      return False
+    self.processed += 1
+    self.resumed += 1
+    return True
+  
+  ##
+  # Called by scrapers once every section of @subject went to create_section:
+  # writes them out, and checkpoints the subject as finished.
+  def subject_done(self, subject):
+    if not self.checkpoint:
+      return
+    self._write_course()
+    if self.ingest:
+      self.ingest.flush()
+    self._commit()
+    self._record_progress(True, subject)
+  
+  def _completed(self, *reference_codes):
+    if self.checkpoint:
+      self._unrecorded.extend(reference_codes)
+  
+  ##
+  # Checkpoint the completed sections that are in the database by now: all but
+  # those in an uncommitted transaction or still in the ingest buffer; and
+  # @subject, if none of its sections are held back.
+  def _record_progress(self, committed=False, subject=None):
+    if self._in_transaction and not committed:
+      return
+    held = set(section_key(data) for data in self.ingest.buffer) if self.ingest else set()
+    done = [code for code in self._unrecorded if code not in held]
+    self._unrecorded = [code for code in self._unrecorded if code in held]
+    self.checkpoint.done(done, None if self._unrecorded else subject)
+  
+  ##
+  # The session split into tasks for networks.workqueue: a list of kwargs, each
+  # limiting a run to part of the session (subjects=[code] for scrapers that
+  # honour a plan). None when the scraper can only do the whole session at once.
+  def work_units(self):
+    return None
+  
+  def _tally(self, subject, changed):
+    if subject:
+      counts = self.tally.setdefault(subject, [0, 0])
+      counts[0] += 1
+      if changed:
+        counts[1] += 1
+  
+  ##
+  # @items (subjects, in the scraper's own order) to walk this run: all of them,
+  # or with a plan, the planned ones in plan order and then any new ones; less
+  # those a resumed run already finished. @key gives an item's classification code.
+  def planned(self, items, key=None):
+    key = key or (lambda item: item)
+    if self.checkpoint:
+      items = [item for item in items if key(item) not in self.checkpoint.subjects]
+    if self.plan is None:
+      return list(items)
+    by_code = dict((key(item), item) for item in items)
+    work = [by_code[code] for code in self.plan if code in by_code]
+    planned = set(self.plan)
+    return work + [item for item in items if key(item) not in planned and key(item) not in self.known_subjects]
+  
+  ##
+  # fn(*args), timed as @phase of the run; scrapers wrap their parsing in it, e.g.
+  # soup = self.timed('parse', BeautifulSoup, page). Safe on worker threads.
+  def timed(self, phase, fn, *args):
+    return timed(self.metrics, phase, fn, *args)
+  
+  def _get_course_key(self, section_data):
+    return tuple(section_data.get(k) for k in ('classification', 'number', 'college', 'level'))
+  
+  def _write_course(self):
+    payloads, self._course_sections = self._course_sections, []
+    if not payloads:
+      return
+    self._begin()
+    # batched, the ingest times its own flushes
+    started = self.metrics.start()
+    written = payloads
+    try:
+      in_savepoint(self._write, payloads)
+    except Exception, e:
+      self.dimensions.reset()
+      if self.ingest or len(payloads) == 1:
+        self._log_error("%s:\n%s\n\n" % (e, payloads))
+        written = []
+      else:
+        # one bad payload shouldn't cost the rest of the course
+        written = []
+        for section_data in payloads:
+          try:
+            in_savepoint(self._write, [section_data])
+            written.append(section_data)
+          except Exception, e:
+            self.dimensions.reset()
+            self._log_error("%s:\n%s\n\n" % (e, section_data))
+    if not self.ingest:
+      self.metrics.stop('ingest', started)
+    self._completed(*[section_key(data) for data in written])
+    self._uncommitted += len(payloads)
+    if self.commit_every and self._uncommitted >= self.commit_every:
+      self.commit()
+    elif self.commit_seconds and time.time() - self._last_commit >= self.commit_seconds:
+      self.commit()
+  
+  def _write(self, payloads):
+    if self.ingest:
+      self.ingest.add(*payloads)
+    else:
+      create_course_sections(payloads, self.dimensions, self.metrics)
+      if self.fingerprints:
+        self.fingerprints.remember(*payloads)
+  
+  def _refresh(self):
+    rows, self._seat_rows = self._seat_rows, []
+    if rows:
+      stats = self.timed('refresh', refresh_seats, self.network, self.session, rows, self._log_error, self.fingerprints)
+      for key, value in stats.items():
+        self.refreshed[key] = self.refreshed.get(key, 0) + value
+  
+  def _begin(self):
+    if self.indexer:
+      self.indexer.start()
+    if self.transactional and not self._in_transaction:
+      transaction.enter_transaction_management()
+      transaction.managed(True)
+      self._in_transaction = True
+      self._last_commit = time.time()
+  
+  def commit(self):
+    self._commit()
+    if self.checkpoint:
+      self._record_progress(committed=True)
+  
+  def _commit(self):
+    if self._in_transaction:
+      started = self.metrics.start()
+      transaction.commit()
+      if self.fingerprints:
+        self.fingerprints.commit()
+      self.metrics.stop('commit', started)
+      if self.indexer:
+        self.timed('index', self.indexer.flush)
+      self._uncommitted = 0
+      self._last_commit = time.time()
+  
+  ##
+  # Called once the scraper's run() has returned: writes out anything still held back.
+  def finish(self):
+    self._write_course()
+    if self.refreshing:
+      self._refresh()
+      print "Seats: %(changed)s of %(sections)s sections changed in %(courses)s courses, %(missing)s not found" % self.refreshed
+    if self.ingest:
+      try:
+        self.ingest.flush()
+      except Exception, e:
+        self._log_error("%s\n\n" % e)
+      print "Sections: %s" % self.ingest.summary()
+    if self._in_transaction:
+      self.commit()
+      transaction.leave_transaction_management()
+      self._in_transaction = False
+    if self.checkpoint:
+      self._record_progress()
+    if self.indexer:
+      self.timed('index', self.indexer.stop)
+      print "Search index: %s courses reindexed" % self.indexer.indexed
+    if self.fingerprints:
+      print "Sections: %s skipped as unchanged (%s without parsing the page)" % (self.skipped, self.pages_skipped)
+    if self.resumed:
+      print "Resumed: %s sections were written before the restart" % self.resumed
+    if self.recorder:
+      self.recorder.close()
+      print "Recorded %s sections to %s" % (self.recorder.recorded, self.recorder.path)
+    self.transport.close()
+    self.metrics.count('sections', self.processed)
+    self.metrics.count('bytes', self.transport.stats['bytes'])
+    self.metrics.count('bytes_decoded', self.transport.stats['bytes_decoded'])
+    if self.transport.stats['requests']:
+      print "HTTP: %(requests)s requests over %(connections)s connections (%(reused)s reused), %(bytes)s bytes read, %(bytes_decoded)s decoded" % self.transport.stats
+    if self.transport.cache:
+      print "HTTP cache: %(cache_hits)s hits, %(cache_misses)s misses, %(cache_bytes_saved)s bytes served from disk" % self.transport.stats
+    if self.transport.governor and self.transport.hosts:
+      for host, limits in sorted(self.transport.governor.report(self.transport.hosts).items()):
+        print "%s: %s in flight of %.1f allowed, %.2f requests/s, latency %.3fs (%.1fx its baseline), %s errors in %s requests" % (host,
+            limits['in_flight'], limits['limit'], limits['rate'], limits['latency'], limits['slowdown'], limits['errors'], limits['requests'])
+  
+  ##
+  # Called after finish(), and only when run() completed: deletes what the registrar
+  # no longer lists. Only a run over the whole session sweeps (see partial). A run
+  # that produced nothing is assumed broken and sweeps nothing, as is one that logged
+  # any error: a page that failed to load or parse looks just like sections the
+  # registrar dropped.
+  def sweep(self):
+    if not self.sweeping:
+      return
+    partial = self.partial()
+    if partial:
+      self._log_error("Sweep skipped: %s\n\n" % partial)
+      return
+    if not self.seen:
+      self._log_error("Sweep skipped: the run saw no sections\n\n")
+      return
+    if self.errors:
+      self._log_error("Sweep skipped: the run logged %s errors\n\n" % self.errors)
+      return
+    self.swept = sweep_session(self.network, self.session, self.seen, self.fingerprints)
+    print "Swept %(sections)s sections and %(courses)s courses no longer listed" % self.swept
+  
+  ##
+  # Why this run didn't cover the whole session, or None if it did. Subclasses
+  # that can scrape part of a session add their own reasons.
+  def partial(self):
+    if self.plan is not None:
+      return "the run only covered planned subjects"
+    return None
+  
+  def summary(self):
+    stats = {'processed': self.processed, 'skipped': self.skipped}
+    if self.errors:
+      stats['errors'] = self.errors
+    if self.pages_skipped:
+      stats['pages_skipped'] = self.pages_skipped
+    if self.resumed:
+      stats['resumed'] = self.resumed
+    if self.ingest:
+      stats.update(self.ingest.stats)
+    if self.indexer:
+      stats['indexed'] = self.indexer.indexed
+    if self.transport.stats['requests'] or self.transport.cache:
+      for key, value in self.transport.stats.items():
+        stats['http_%s' % key] = value
+    for key, value in self.refreshed.items():
+      stats['refresh_%s' % key] = value
+    if self.plan is not None:
+      stats['planned_subjects'] = len(self.plan)
+    if self.swept:
+      stats['retired_sections'] = self.swept['sections']
+      stats['retired_courses'] = self.swept['courses']
+    return stats
 
   def _optional(self, l):
     try:
@@ -0,0 +1,163 @@
+from django.conf import settings
+import itertools, os, redis, socket, threading, time
+
+# starting point, bounds and steps of each host's limits
+START_CONCURRENCY = 2.0
+MAX_CONCURRENCY = 16.0
+START_RATE = 2.0 # requests per second
+MIN_RATE = 0.2
+MAX_RATE = 50.0
+RATE_STEP = 2.0 # requests/s the rate gains over a second of good responses
+BACKOFF = 0.5 # multiplicative decrease on a throttling signal...
+COOLDOWN = 5.0 # ...at most once per this many seconds, however many responses carry it
+SLOW = 3.0 # average latency this many times the host's baseline counts as a throttling signal
+SMOOTHING = 0.2 # weight of the latest response in the latency average
+SLOT_SECONDS = 300 # a slot its holder never gave back (it died) is reclaimed after this
+WAIT = 0.05 # seconds between looks for a free slot
+
+# responses that mean "slow down", as opposed to a page that isn't there
+THROTTLE_CODES = set([408, 429, 500, 502, 503, 504])
+
+class HostGovernor(object):
+  """
+  Paces requests per host across every scraper and process sharing a redis, so
+  that UNL, UNO and UNK (all csprdnu.nebraska.edu) share one allowance.
+
+  Each host has a concurrency limit and a request rate, adjusted AIMD style from
+  what its responses look like: every good response adds 1/limit to the limit and
+  RATE_STEP/rate to the rate (one more request in flight per round of requests,
+  RATE_STEP more requests/s per second), and an error
+  (THROTTLE_CODES, timeouts, dropped connections), or average latency grown to SLOW
+  times the host's baseline for that kind of response, halves both, at most once
+  per COOLDOWN. @max_rps caps the rate this process asks for.
+
+  In redis, governor:<host> holds limit, rate, latency (seconds, moving average),
+  latency:<kind> and baseline:<kind> for each kind of response, slowdown (the
+  latest response's kind's latency over its baseline), requests, errors and
+  decreased (time of the last backoff);
+  governor:<host>:slots the requests in flight (a zset of token -> expiry) and
+  governor:<host>:next the earliest time the next request may go. governor:hosts
+  lists the hosts seen.
+  """
+  def __init__(self, max_rps=None, conn=None):
+    self.max_rps = max_rps
+    self.r = conn or redis.Redis(settings.REDIS_HOST)
+    self.tokens = itertools.count()
+    self.owner = '%s:%s' % (socket.gethostname(), os.getpid())
+    self.lock = threading.Lock()
+
+  def key(self, host, suffix=''):
+    return 'governor:%s%s' % (host, suffix)
+
+  ##
+  # Wait for a slot and a turn at @host; returns the slot's token for release().
+  # Each look for a slot is one round trip to redis, taking it another.
+  def acquire(self, host):
+    self.lock.acquire()
+    try:
+      token = '%s:%s' % (self.owner, self.tokens.next())
+    finally:
+      self.lock.release()
+    slots = self.key(host, ':slots')
+    while True:
+      pipe = self.r.pipeline()
+      pipe.hgetall(self.key(host))
+      pipe.zremrangebyscore(slots, '-inf', time.time()) # slots of holders that died
+      pipe.zcard(slots)
+      state, _, taken = pipe.execute()
+      if not state:
+        state = self._start(host)
+      limit, rate = float(state['limit']), float(state['rate'])
+      if taken < int(limit):
+        pipe = self.r.pipeline()
+        pipe.zadd(slots, **{token: time.time() + SLOT_SECONDS})
+        pipe.zcard(slots)
+        if pipe.execute()[1] <= int(limit):
+          break
+        self.r.zrem(slots, token) # another process took the last one first
+      time.sleep(WAIT)
+    if self.max_rps:
+      rate = min(rate, self.max_rps)
+    self._take_turn(host, 1.0 / rate)
+    return token
+
+  def _start(self, host):
+    pipe = self.r.pipeline()
+    pipe.hsetnx(self.key(host), 'limit', START_CONCURRENCY)
+    pipe.hsetnx(self.key(host), 'rate', START_RATE)
+    pipe.sadd('governor:hosts', host)
+    pipe.hgetall(self.key(host))
+    return pipe.execute()[-1]
+
+  def _take_turn(self, host, interval):
+    now = time.time()
+    turn = self.r.incrbyfloat(self.key(host, ':next'), interval) - interval
+    if turn < now - interval:
+      # idle for a while: start again from now
+      self.r.set(self.key(host, ':next'), now + interval)
+      turn = now
+    if turn > now:
+      time.sleep(turn - now)
+
+  ##
+  # The request holding @token took @latency seconds; @error is True if it failed
+  # in a way that means the host wants fewer requests. @kind is the class of the
+  # response (see response_class()): latency is only compared with that of
+  # responses like it, or one fast 304 would make every full page look slow.
+  # The read-modify-write of the host's state is a WATCH/MULTI transaction, retried
+  # when another worker's release() got in between, so none is lost.
+  def release(self, host, token, latency, error=False, kind=''):
+    key = self.key(host)
+    def change(pipe):
+      state = pipe.hgetall(key) or {}
+      limit = float(state.get('limit', START_CONCURRENCY))
+      rate = float(state.get('rate', START_RATE))
+      average = float(state.get('latency:%s' % kind, latency))
+      baseline = float(state.get('baseline:%s' % kind, latency))
+      now = time.time()
+      update = {
+        'latency': (1 - SMOOTHING) * float(state.get('latency', latency)) + SMOOTHING * latency,
+        'latency:%s' % kind: (1 - SMOOTHING) * average + SMOOTHING * latency,
+        # the fastest responses of this kind have been lately: follows drops at once, rises slowly
+        'baseline:%s' % kind: latency if latency < baseline else baseline * (1 - SMOOTHING / 10) + latency * SMOOTHING / 10,
+      }
+      update['slowdown'] = update['latency:%s' % kind] / baseline if baseline else 1.0
+      if error or update['slowdown'] > SLOW:
+        if now - float(state.get('decreased', 0)) > COOLDOWN:
+          update.update({'limit': max(1.0, limit * BACKOFF), 'rate': max(MIN_RATE, rate * BACKOFF), 'decreased': now})
+      else:
+        update.update({'limit': min(MAX_CONCURRENCY, limit + 1.0 / limit), 'rate': min(MAX_RATE, rate + RATE_STEP / rate)})
+      pipe.multi()
+      pipe.zrem(self.key(host, ':slots'), token)
+      pipe.hmset(key, update)
+      pipe.hincrby(key, 'requests', 1)
+      if error:
+        pipe.hincrby(key, 'errors', 1)
+    self.r.transaction(change, key)
+
+  ##
+  # {host: {limit, rate, latency, slowdown, requests, errors, in_flight}}
+  # for @hosts, or every host any scraper has been through.
+  def report(self, hosts=None):
+    hosts = sorted(hosts if hosts is not None else (self.r.smembers('governor:hosts') or ()))
+    report = {}
+    now = time.time()
+    for host in hosts:
+      state = self.r.hgetall(self.key(host)) or {}
+      report[host] = {
+        'limit': float(state.get('limit', START_CONCURRENCY)),
+        'rate': float(state.get('rate', START_RATE)),
+        'latency': float(state.get('latency', 0)),
+        'slowdown': float(state.get('slowdown', 1)),
+        'requests': int(state.get('requests', 0)),
+        'errors': int(state.get('errors', 0)),
+        'in_flight': len(self.r.zrangebyscore(self.key(host, ':slots'), now, '+inf')),
+      }
+    return report
+
+##
+# What release() compares a response's latency within: its status and the order
+# of magnitude of its size, so a 304 or an error page is not held against a full
+# results page and the other way round.
+def response_class(code, size=0):
+  return '%s:%s' % (code, len(str(size)))
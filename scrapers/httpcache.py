@@ -0,0 +1,131 @@
+import hashlib, json, os, StringIO, tempfile, time, urllib, urllib2, urlparse, zlib
+import mimetools
+
+class HTTPCache(object):
+  """
+  An on-disk cache of the responses a scraper fetched, under @root.
+
+  Requests are keyed by a fingerprint of method, URL and (for POSTs) the form
+  fields, sorted, less any names in self.volatile (a per-session token, say).
+  Each key's entry records status, headers and validators; bodies are stored
+  zlib-compressed under the sha1 of their content, so a page served again under
+  another key takes no more space.
+
+  Online, a GET with a cached entry is sent with If-None-Match / If-Modified-Since
+  and a 304 is answered from disk; everything else goes to the network and its
+  response is stored. offline=True never touches the network: whatever was stored
+  by an earlier run is replayed, and anything else fails with a URLError.
+  """
+  def __init__(self, root, offline=False, volatile=()):
+    self.root = root
+    self.offline = offline
+    self.volatile = set(volatile)
+    for directory in ('entries', 'bodies'):
+      path = os.path.join(root, directory)
+      if not os.path.isdir(path):
+        try:
+          os.makedirs(path)
+        except OSError:
+          pass # another shard got there first
+
+  def fingerprint(self, url, data=None):
+    if data is None:
+      return hashlib.sha1('GET %s' % url).hexdigest()
+    fields = sorted((k, v) for k, v in urlparse.parse_qsl(data, True) if k not in self.volatile)
+    return hashlib.sha1('POST %s\n%s' % (url, urllib.urlencode(fields))).hexdigest()
+
+  ##
+  # Fetch through @transport, or answer from disk; see the class docstring.
+  def open(self, transport, url, data=None):
+    key = self.fingerprint(url, data)
+    entry = self._load(key)
+    if self.offline:
+      if entry is None:
+        transport.merge({'cache_misses': 1})
+        raise urllib2.URLError('not in the HTTP cache: %s' % url)
+      return self._hit(transport, entry)
+
+    request = urllib2.Request(url, data)
+    if entry is not None and data is None:
+      if entry.get('etag'):
+        request.add_header('If-None-Match', entry['etag'])
+      if entry.get('last_modified'):
+        request.add_header('If-Modified-Since', entry['last_modified'])
+    try:
+      response = transport.fetch(request)
+    except urllib2.HTTPError, e:
+      if e.code == 304 and entry is not None:
+        return self._hit(transport, entry)
+      raise
+    body = response.read()
+    self._store(key, url, data, response, body)
+    transport.merge({'cache_misses': 1})
+    return self._response(response.geturl(), response.code, response.msg, response.info(), body)
+
+  def _hit(self, transport, entry):
+    body = self._read(os.path.join(self.root, 'bodies', entry['body'][:2], entry['body']))
+    if body is None:
+      raise urllib2.URLError('HTTP cache body missing for %s' % entry['url'])
+    body = zlib.decompress(body)
+    transport.merge({'cache_hits': 1, 'cache_bytes_saved': len(body)})
+    return self._response(entry['final_url'], entry['status'], entry['reason'],
+        mimetools.Message(StringIO.StringIO(entry['headers'])), body)
+
+  def _response(self, url, code, msg, headers, body):
+    response = urllib.addinfourl(StringIO.StringIO(body), headers, url)
+    response.code = code
+    response.msg = msg
+    return response
+
+  def _load(self, key):
+    entry = self._read(os.path.join(self.root, 'entries', key[:2], key))
+    return json.loads(entry) if entry is not None else None
+
+  def _store(self, key, url, data, response, body):
+    digest = hashlib.sha1(body).hexdigest()
+    path = os.path.join(self.root, 'bodies', digest[:2], digest)
+    if not os.path.exists(path):
+      self._write(path, zlib.compress(body))
+    headers = response.info()
+    entry = {
+      'url': url,
+      'method': 'GET' if data is None else 'POST',
+      'final_url': response.geturl(),
+      'status': response.code,
+      'reason': response.msg,
+      # the body on disk is already decoded
+      'headers': ''.join(h for h in headers.headers if h.split(':', 1)[0].lower() not in ('content-encoding', 'content-length', 'transfer-encoding')),
+      'etag': headers.get('ETag'),
+      'last_modified': headers.get('Last-Modified'),
+      'body': digest,
+      'stored': time.time(),
+    }
+    self._write(os.path.join(self.root, 'entries', key[:2], key), json.dumps(entry))
+
+  def _read(self, path):
+    try:
+      f = open(path, 'rb')
+    except IOError:
+      return None
+    try:
+      return f.read()
+    finally:
+      f.close()
+
+  ##
+  # Write to a temporary file and rename it into place, so a reader (or another
+  # thread storing the same page) never sees half a file.
+  def _write(self, path, content):
+    directory = os.path.dirname(path)
+    if not os.path.isdir(directory):
+      try:
+        os.makedirs(directory)
+      except OSError:
+        pass
+    fd, temporary = tempfile.mkstemp(dir=directory)
+    f = os.fdopen(fd, 'wb')
+    try:
+      f.write(content)
+    finally:
+      f.close()
+    os.rename(temporary, path)
@@ -22,12 +22,19 @@ class NYUScraper(PeopleSoftScraper):
       end = self.end_index
     else:
       end = len(self.sections)
+    # a resumed run picks up at the first listing it hadn't finished; after a
+    # restart the listings are read again on a new PeopleSoft conversation
+    finished = self.checkpoint.subjects if self.checkpoint else set()
     while True:
       for i in range(self.start_index, end):
+        if self.sections[i][0] in finished:
+          continue
         print "Section %s." % i
         self.process_section(i)
+        self.subject_done(self.sections[i][0])
       if not forever:
         return
+      finished = set()
   
   def _make_connection(self):
     self.access_home()
@@ -7,6 +7,8 @@ from pprint import pprint
 import time
 
 class OSUScraper(PeopleSoftScraperV2):
+  section_fields = PeopleSoftScraperV2.section_fields + ('PSXLATITEM_XLATLONGNAME$56$',)
+  
   def __init__(self, *args, **kwargs):
     super(OSUScraper, self).__init__(*args, **kwargs)
     
@@ -67,9 +69,9 @@ class OSUScraper(PeopleSoftScraperV2):
     super(OSUScraper, self).process_subject()
   
   # Do any processing of the section data on top of the standard PeopleSoft parser
-  def parse_section(self, soup):
-    section_data = super(OSUScraper, self).parse_section(soup)
-    section_data['level'] = "%s" % soup.find('span', id='PSXLATITEM_XLATLONGNAME$56$').renderContents()
+  def parse_fields(self, fields):
+    section_data = super(OSUScraper, self).parse_fields(fields)
+    section_data['level'] = "%s" % fields['PSXLATITEM_XLATLONGNAME$56$']
     return section_data
 
 class OSUScraperOld(PeopleSoftScraper):
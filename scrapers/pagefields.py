@@ -0,0 +1,263 @@
+import hashlib, json, re, time
+from BeautifulSoup import BeautifulSoup, UnicodeDammit
+
+##
+# Targeted extraction for detail pages whose values all sit in elements with
+# known ids (PeopleSoft's class detail page in particular).
+#
+# Rather than building a whole BeautifulSoup tree and searching it once per field,
+# PageFields finds every wanted element in a single regex scan of the raw page and
+# cuts out its contents. Contents are rendered the way BeautifulSoup 3's
+# renderContents() would render them (tags lowercased with quoted attributes, <br>
+# as <br />, bare & < > escaped, utf-8), so code written against the soup gets the
+# same strings. compare() and benchmark() check a reader built on it against the
+# soup-based one it replaced.
+
+VOID_TAGS = set(['br', 'hr', 'input', 'img', 'meta', 'spacer', 'link', 'frame', 'base', 'col'])
+# markup render() reproduces; for contents with any other tag (a <p>, a table, a
+# comment) the page is parsed after all, since BeautifulSoup's nesting rules may
+# close or move things around
+SIMPLE_TAGS = set(['br', 'img', 'a', 'b', 'i', 'u', 'em', 'strong', 'span', 'font', 'sub', 'sup', 'div'])
+MARKUP = re.compile(r'(<!--.*?-->|<[^>]*>)', re.S)
+TAG = re.compile(r'<(/?)([a-zA-Z][\w:-]*)(.*?)/?>$', re.S)
+ATTRIBUTE = re.compile(r'''([\w:-]+)(?:\s*=\s*(?:"([^"]*)"|'([^']*)'|([^\s>]+)))?''')
+REFERENCE = re.compile(r'&([a-zA-Z][-.a-zA-Z0-9]*(?:;|(?=[^a-zA-Z0-9])|$)|#[0-9]+(?:;|(?=[^0-9])|$))')
+BARE = re.compile(r'[<>]|&(?!#\d+;|#x[0-9a-fA-F]+;|\w+;)')
+ESCAPES = {'<': '&lt;', '>': '&gt;', '&': '&amp;'}
+INPUT = re.compile(r'''<input(\s(?:[^>"']|"[^"]*"|'[^']*')*)>''', re.I)
+HIDDEN_INPUT = re.compile(r'''<input\s(?:[^>"']|"[^"]*"|'[^']*')*?\btype\s*=\s*["']?hidden\b["']?(?:[^>"']|"[^"]*"|'[^']*')*>''', re.I)
+ATTRIBUTE_REFERENCE = re.compile(r'&(?:(lt|gt|amp|quot|apos)|#([0-9]+));')
+ATTRIBUTE_ENTITIES = {'lt': '<', 'gt': '>', 'amp': '&', 'quot': '"', 'apos': "'"}
+_openers = {}
+_closers = {}
+
+##
+# Opening tags carrying one of @ids. Attribute names are case-insensitive, as
+# BeautifulSoup lowercases them; the ids themselves are matched exactly.
+def _opener(ids):
+  key = tuple(sorted(ids))
+  if key not in _openers:
+    names = "|".join([re.escape(i) for i in key])
+    _openers[key] = re.compile(r'''<([a-zA-Z][\w:-]*)\s(?:[^>]*?\s)?[iI][dD]\s*=\s*(?:"(%s)"|'(%s)'|(%s)(?=[\s/>]))[^>]*>''' % (names, names, names))
+  return _openers[key]
+
+def _closer(tag):
+  tag = tag.lower()
+  if tag not in _closers:
+    _closers[tag] = re.compile(r'<(/?)%s(?=[\s/>])[^>]*>' % re.escape(tag), re.I)
+  return _closers[tag]
+
+def _reference(match):
+  return '&%s;' % match.group(1).rstrip(';')
+
+def _bare(match):
+  return ESCAPES[match.group(0)]
+
+##
+# Text as BeautifulSoup renders it: references get their ; (so "R&D Methods" comes
+# out as "R&D; Methods"), and whatever & < > remain are escaped.
+def _escape(text):
+  if '&' in text:
+    text = REFERENCE.sub(_reference, text)
+  return BARE.sub(_bare, text)
+
+def _render_tag(markup):
+  tag = TAG.match(markup)
+  if not tag:
+    return _escape(markup)
+  closing, name, rest = tag.groups()
+  name = name.lower()
+  if closing:
+    return '' if name in VOID_TAGS else '</%s>' % name
+  attrs = ''
+  for attr in ATTRIBUTE.finditer(rest):
+    key, values = attr.group(1).lower(), attr.groups()[1:]
+    value = [v for v in values if v is not None]
+    value = value[0] if value else key
+    if '"' in value:
+      attrs += " %s='%s'" % (key, _escape(value.replace("'", "&squot;")))
+    else:
+      attrs += ' %s="%s"' % (key, _escape(value))
+  if name in VOID_TAGS:
+    return '<%s%s />' % (name, attrs)
+  return '<%s%s>' % (name, attrs)
+
+##
+# @markup, the raw contents of one element, as renderContents() would return them;
+# None if they hold markup only BeautifulSoup itself gets right.
+def render(markup):
+  if '<' not in markup and '>' not in markup and '&' not in markup:
+    return markup
+  parts = MARKUP.split(markup)
+  for i, part in enumerate(parts):
+    if i % 2:
+      tag = TAG.match(part)
+      if not tag or tag.group(2).lower() not in SIMPLE_TAGS:
+        return None
+      parts[i] = _render_tag(part)
+    elif part:
+      parts[i] = _escape(part)
+  return ''.join(parts)
+
+class PageFields(dict):
+  """
+  Maps each of @ids found in @page to the contents of the first element carrying
+  it. Missing ids are simply absent, so fields['X'] raises where soup.find('X')
+  would have returned None, and fields.get('X') is the optional lookup.
+  """
+  def __init__(self, page=None, ids=()):
+    super(PageFields, self).__init__()
+    self.positions = {}
+    if page is None:
+      return
+    if type(page) is str:
+      try:
+        page.decode('utf-8')
+        encoding = None
+      except UnicodeDecodeError:
+        page = UnicodeDammit(page, isHTML=True).unicode
+        encoding = 'utf-8'
+    else:
+      encoding = 'utf-8'
+    wanted = set(ids)
+    soup = None
+    for match in _opener(wanted).finditer(page):
+      id = match.group(2) or match.group(3) or match.group(4)
+      if id in self.positions:
+        continue
+      self.positions[id] = match.start()
+      rendered = render(self._contents(page, match.group(1), match.end()))
+      if rendered is None:
+        if soup is None:
+          soup = BeautifulSoup(page)
+        self[id] = soup.find(attrs={'id': id}).renderContents()
+      else:
+        self[id] = rendered.encode(encoding) if encoding else rendered
+      if len(self.positions) == len(wanted):
+        break
+
+  ##
+  # Everything between the opening tag ending at @start and its matching close
+  # (nested elements of the same tag included); the rest of the page if unclosed.
+  def _contents(self, page, tag, start):
+    if tag.lower() in VOID_TAGS:
+      return ''
+    depth = 1
+    for match in _closer(tag).finditer(page, start):
+      if match.group(1):
+        depth -= 1
+        if not depth:
+          return page[start:match.start()]
+      elif not match.group(0).endswith('/>'):
+        depth += 1
+    return page[start:]
+
+  ##
+  # Contents of whichever of @ids comes first in the page, or None.
+  def first(self, *ids):
+    found = [(self.positions[id], id) for id in ids if id in self]
+    if not found:
+      return None
+    return self[min(found)[1]]
+
+##
+# name: value of every <input type="hidden"> in @page, e.g. PeopleSoft's ICSID and
+# ICStateNum, read straight from the markup. Values are decoded the way BeautifulSoup
+# decodes attributes (&amp; &lt; &gt; &quot; &apos; and numeric references only);
+# a later input with the same name wins, as it would in a browser's form data.
+def hidden_inputs(page):
+  inputs = {}
+  for match in INPUT.finditer(page):
+    attrs = {}
+    for attr in ATTRIBUTE.finditer(match.group(1)):
+      value = [v for v in attr.groups()[1:] if v is not None]
+      attrs[attr.group(1).lower()] = value[0] if value else attr.group(1)
+    if attrs.get('type') == 'hidden' and 'name' in attrs:
+      value = attrs.get('value', '')
+      if '&' in value:
+        value = ATTRIBUTE_REFERENCE.sub(_attribute_reference, value)
+      inputs[attrs['name']] = value
+  return inputs
+
+def _attribute_reference(match):
+  name, number = match.groups()
+  if number:
+    return unichr(int(number)).encode('utf-8')
+  return ATTRIBUTE_ENTITIES[name]
+
+##
+# sha1 of @page without its hidden inputs (session ids, PeopleSoft's ICStateNum,
+# ASP.NET's view state), which change on every visit even when nothing else does.
+# Anything in @extra (e.g. values taken from a listing page) is hashed along.
+def page_digest(page, *extra):
+  digest = hashlib.sha1(HIDDEN_INPUT.sub('', page))
+  for value in extra:
+    digest.update(json.dumps(value, sort_keys=True, default=unicode))
+  return digest.hexdigest()
+
+##
+# Call fn(*args), or return None if it raises; for fields a page may not have.
+def optional(fn, *args):
+  try:
+    return fn(*args)
+  except Exception:
+    return None
+
+def _outcome(reader, page):
+  try:
+    return reader(page)
+  except Exception, e:
+    return Failed(e)
+
+class Failed(object):
+  """
+  A reader that raised. Any two are equal: a page missing a required element
+  fails the soup reading with an AttributeError (None.renderContents) and the
+  PageFields one with a KeyError, and either way it is rejected.
+  """
+  def __init__(self, error):
+    self.error = error
+
+  def __eq__(self, other):
+    return isinstance(other, Failed)
+
+  def __ne__(self, other):
+    return not self == other
+
+  def __repr__(self):
+    return 'Failed(%r)' % self.error
+
+##
+# Read each of @pages, (name, page) pairs, with reference(page), the parser being
+# replaced, and reader(page). Any result that differs (one reader raising where
+# the other returns counts) is a mismatch, and there should be none.
+def compare(pages, reference, reader):
+  result = {'pages': 0, 'same': 0, 'failed': 0, 'mismatches': []}
+  for name, page in pages:
+    result['pages'] += 1
+    old = _outcome(reference, page)
+    new = _outcome(reader, page)
+    if old != new:
+      result['mismatches'].append((name, old, new))
+    elif type(old) is dict:
+      result['same'] += 1
+    else:
+      result['failed'] += 1
+  return result
+
+##
+# Best of @repeat timings of each of @readers, (name, reader) pairs, over @pages.
+def benchmark(pages, readers, repeat=3):
+  pages = [page for name, page in pages]
+  timings = {}
+  for name, reader in readers:
+    best = None
+    for i in range(repeat):
+      start = time.time()
+      for page in pages:
+        _outcome(reader, page)
+      elapsed = time.time() - start
+      if best is None or elapsed < best:
+        best = elapsed
+    timings[name] = best
+  return timings
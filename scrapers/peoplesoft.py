@@ -1,11 +1,25 @@
-import cookielib, urllib2, urllib, re, time
+import cookielib, urllib2, urllib, re, time, copy, threading, Queue, itertools, os
 from BeautifulSoup import BeautifulSoup, SoupStrainer
 from scrapers.general import Scraper
+from scrapers.pagefields import PageFields, hidden_inputs, optional, page_digest
 from courses.helpers import *
 from courses.models import *
 from pprint import pprint
 import time, json, datetime
 
+# ids of the class detail page elements read_section() looks at
+SECTION_FIELDS = (
+  'DERIVED_CLSRCH_DESCR200', 'win0divSSR_CLS_DTL_WRK_SSR_STATUS_LONG', 'DERIVED_CLSRCH_SSS_PAGE_KEYDESCR',
+  'GRADE_BASIS_TBL_DESCRFORMAL', 'SSR_CLS_DTL_WRK_UNITS_RANGE', 'DERIVED_CLSRCH_DESCRLONG',
+  'DERIVED_CLSRCH_SSR_CLASSNOTE_LONG', 'MTG_INSTR$0', 'SSR_CLS_DTL_WRK_SSR_REQUISITE_LONG', 'MTG_LOC$0',
+  'MTG_SCHED$0', 'INSTRUCT_MODE_DESCR', 'PSXLATITEM_XLATLONGNAME', 'SSR_CLS_DTL_WRK_ENRL_CAP',
+  'SSR_CLS_DTL_WRK_ENRL_TOT', 'SSR_CLS_DTL_WRK_AVAILABLE_SEATS', 'SSR_CLS_DTL_WRK_WAIT_CAP',
+  'SSR_CLS_DTL_WRK_WAIT_TOT', 'SSR_CLS_DTL_WRK_CLASS_NBR',
+)
+# progress messages _click prints from every page
+MESSAGE_FIELDS = ('DERIVED_CLSRCH_SSR_CLASS_LBL_LBL', 'DERIVED_SSE_DSP_SSR_MSG_TEXT', 'DERIVED_CLSRCH_DESCR200')
+STATUS_IMAGE = re.compile(r'<img\s[^>]*?\balt="([^"]*)"')
+
 
 class PeopleSoftScraper(Scraper):
   def __init__(self, *args, **kwargs):
@@ -41,10 +55,21 @@ class PeopleSoftScraper(Scraper):
     self.last_section = ''
     self.longs = []
     
-    self.cj = cookielib.CookieJar()
-    self.opener = urllib2.build_opener(urllib2.HTTPCookieProcessor(self.cj))
+    self.cj = self.transport.cj
+    self.opener = self.transport.opener
+    if self.transport.cache:
+      # a new ICSID every session; without it a cached run can be replayed offline
+      self.transport.cache.volatile.add('ICSID')
     self.timers = {}
+    self._initial_params = None
     
+  ##
+  # start= / end= limit a run to part of the listings.
+  def partial(self):
+    if self.start_index or self.end_index:
+      return "the run only covered listings %s to %s" % (self.start_index, self.end_index or 'the end')
+    return super(PeopleSoftScraper, self).partial()
+  
   def _time(self, key):
     self.timers[key] = self.timers.get(key, {'total': datetime.timedelta(0)})
     self.timers[key]['last'] = datetime.datetime.now()
@@ -58,45 +83,212 @@ class PeopleSoftScraper(Scraper):
     if not url:
       url = self.scrape_url
     
+    if self._initial_params is None:
+      # what a new conversation starts from; see PeopleSoftScraperV2._browser
+      self._initial_params = dict(self.params)
     data = urllib.urlencode(params)
     self._elapsed('other')
     self._time('open')
-    r = self.opener.open(url, data)
+    r = self.transport.open(url, data)
     page = r.read()
     self._page = page
     self._elapsed('open')
+    # the page's own hidden fields (ICSID, ICStateNum, ...) are what the next click
+    # posts back; only callers that want to search the page ask for a soup
     if soupify:
       self._time('soup')
-      self._soup = BeautifulSoup(page)
+      self._soup = self.timed('parse', BeautifulSoup, page)
       self._elapsed('soup')
     self._time('other')
     
     try:
-      if soupify:
-        self.params = {}
-        for hidden in self._soup.findAll('input', {'type': 'hidden'}):
-          self.params[hidden['name']] = hidden['value']
+      hidden = hidden_inputs(page)
+      if 'ICStateNum' in hidden:
+        self.params = hidden
       else:
+        # not a PeopleSoft form; assume the conversation moved on by one state
         state_num = int(self.params['ICStateNum'])
         self.params['ICStateNum'] = state_num + 1
     except:
       print "error."
     
-    if soupify:
-      for tag, id in [['label', 'DERIVED_CLSRCH_SSR_CLASS_LBL_LBL'], ['span', 'DERIVED_SSE_DSP_SSR_MSG_TEXT'], ['span', 'DERIVED_CLSRCH_DESCR200']]:
-        try:
-          print "%s" % self._soup.find(tag, {'id': id}).renderContents()
-        except: pass
-    else:
+    messages = PageFields(page, MESSAGE_FIELDS)
+    for id in MESSAGE_FIELDS:
+      if id in messages:
+        print "%s" % messages[id]
+    if not messages:
       print '---'
     
     return page
 
 
 class PeopleSoftScraperV2(PeopleSoftScraper):
+  section_fields = SECTION_FIELDS
+  plannable = True
+  
+  def __init__(self, *args, **kwargs):
+    super(PeopleSoftScraperV2, self).__init__(*args, **kwargs)
+    # shards=N splits the subject list between N independent PeopleSoft sessions
+    # (own cookie jar, connections, ICSID and ICStateNum each) running on threads
+    self.shards = kwargs.get('shards') or 1
+    self.only_subjects = None
+    self.subject = None # the one being scraped
+    self.discovering = False # see work_units
+    self.finished_subjects = []
+    self.missed_subjects = []
+    self.progress = None
+    
+    # save_pages=DIR also writes every class detail page to DIR (a corpus for
+    # manage.py parse_bench)
+    self.save_pages = kwargs.get('save_pages')
+    self._pages_saved = itertools.count(1)
+  
+  ##
+  # One task per subject. Lists them by running up to process_subjects().
+  def work_units(self):
+    self.discovering = True
+    try:
+      self.run()
+    finally:
+      self.discovering = False
+    return [{'subjects': [code]} for code in sorted(self.subjects.keys())]
+  
   def process_subjects(self):
-    for subject_code in sorted(self.subjects.keys()):
-      self.process_subject(subject_code)
+    if self.discovering:
+      return
+    if self.shards > 1:
+      return self._process_sharded()
+    for subject_code in self.planned(sorted(self.subjects.keys())):
+      if self.only_subjects is None or subject_code in self.only_subjects:
+        self.subject = subject_code
+        self.process_subject(subject_code)
+        self.finished_subjects.append(subject_code)
+        self.subject_done(subject_code)
+        if self.progress:
+          self.progress.put(('subject', subject_code))
+  
+  ##
+  # Deal the subjects out round-robin, so each is scraped by exactly one shard.
+  # Every shard replays this scraper's run() on a fresh PeopleSoft session, limited
+  # to its own subjects; its sections come back over a queue and are written from
+  # this thread. A shard that dies is restarted once, on a new session, for the
+  # subjects it hadn't finished.
+  def _process_sharded(self):
+    codes = self.planned(sorted(self.subjects.keys()))
+    results = Queue.Queue()
+    # what the shards may skip; this thread goes on writing the checkpoint itself
+    done = self.checkpoint.snapshot() if self.checkpoint else None
+    shards = [codes[i::self.shards] for i in range(self.shards) if codes[i::self.shards]]
+    for subjects in shards:
+      thread = threading.Thread(target=self._run_shard, args=(subjects, results, done))
+      thread.daemon = True
+      thread.start()
+    
+    running = len(shards)
+    while running:
+      kind, value = results.get()
+      if kind == 'section':
+        self.create_section(*value)
+      elif kind == 'unchanged':
+        self.skip_page(*value)
+      elif kind == 'resumed':
+        self.already_done(value)
+      elif kind == 'subject':
+        self.finished_subjects.append(value)
+        self.subject_done(value)
+      elif kind == 'error':
+        self._log_error(value)
+      elif kind == 'transport':
+        self.transport.merge(value)
+      else:
+        self.missed_subjects.extend(value)
+        running -= 1
+    print "%s of %s subjects scraped by %s sessions" % (len(self.finished_subjects), len(codes), len(shards))
+  
+  def _run_shard(self, subjects, results, done=None):
+    remaining = list(subjects)
+    try:
+      for attempt in range(2):
+        browser = self._browser(remaining, results, done)
+        try:
+          browser.run()
+        except Exception, e:
+          results.put(('error', "Shard for %s failed: %s\n\n" % (", ".join(remaining), e)))
+        browser.transport.close()
+        results.put(('transport', browser.transport.stats))
+        remaining = [code for code in remaining if code not in browser.finished_subjects]
+        if not remaining:
+          break
+    finally:
+      results.put(('done', remaining))
+  
+  def _already_done_in(self, results, reference_code):
+    if self.checkpoint and '%s' % reference_code in self.checkpoint.sections:
+      results.put(('resumed', reference_code))
+      return True
+    return False
+  
+  ##
+  # A sharded run whose shard gave up on some subjects never saw their sections.
+  def partial(self):
+    if self.missed_subjects:
+      return "%s subjects were not scraped" % len(self.missed_subjects)
+    return super(PeopleSoftScraperV2, self).partial()
+  
+  def summary(self):
+    stats = super(PeopleSoftScraperV2, self).summary()
+    if self.shards > 1:
+      stats.update({'shards': self.shards, 'subjects': len(self.finished_subjects),
+          'subjects_missed': len(self.missed_subjects)})
+    return stats
+  
+  ##
+  # A copy of this scraper with its own PeopleSoft conversation that hands sections
+  # to @results instead of writing them. Everything a run changes as it goes is the
+  # browser's own, so nothing is written from two threads: what it finds reaches
+  # this scraper only through @results. It shares only what is read-only or safe
+  # across threads (metrics, the fingerprints' page lookups, the save_pages counter)
+  # and checks @done, a snapshot of the checkpoint, for sections to skip.
+  def _browser(self, subjects, results, done=None):
+    browser = copy.copy(self)
+    browser.params = dict(self._initial_params)
+    browser.transport = self.transport.fresh()
+    browser.cj = browser.transport.cj
+    browser.opener = browser.transport.opener
+    browser.timers = {}
+    browser.shards = 1
+    browser.only_subjects = set(subjects)
+    browser.subject = None
+    browser.subjects = {}
+    browser.sections = None
+    browser.section_data = {}
+    browser.classes = {}
+    browser.hold = None
+    browser.last_section = ''
+    browser.longs = []
+    browser.finished_subjects = []
+    browser.missed_subjects = []
+    browser.progress = results
+    browser.processed = browser.skipped = browser.pages_skipped = browser.resumed = browser.errors = 0
+    browser.seen = set()
+    browser.tally = {}
+    browser._course_key = None
+    browser._course_sections = []
+    browser._unrecorded = []
+    browser._seat_rows = []
+    # this scraper writes, records and checkpoints what the browser sends back
+    browser.dimensions = browser.ingest = browser.indexer = browser.recorder = None
+    browser.checkpoint = done
+    if self.recorder:
+      # a recorded run parses every page
+      browser.page_unchanged = lambda digest, reference_code=None: None
+    # errors are counted (see Scraper.sweep) and logged by this scraper
+    browser._log_error = lambda e: results.put(('error', e))
+    browser.create_section = lambda section_data, page_digest=None: results.put(('section', (section_data, page_digest)))
+    browser.skip_page = lambda reference_code, subject=None: results.put(('unchanged', (reference_code, subject)))
+    browser.already_done = lambda reference_code: browser._already_done_in(results, reference_code)
+    browser.subject_done = lambda subject: None
+    return browser
   
   """
   def process_subject(self):
@@ -169,74 +361,164 @@ class PeopleSoftScraperV2(PeopleSoftScraper):
     self.params.update({
       'ICAction': 'DERIVED_CLSRCH_SSR_CLASSNAME_LONG$%s' % index
     })
-    page = self._click(self.scrape_url, self.params)
-    section_data = self.parse_section(self._soup)
-    self.create_section(section_data)
-  
-  def parse_section(self, soup):
-    section_data = {}
-    header_bits = soup.find('span', {'id': 'DERIVED_CLSRCH_DESCR200'}).renderContents().replace('&nbsp;', ' ')
-    classification, number, section_num, course_name = re.search('(\w+)\s+([\.\w]+) - (\d+) (.+)', header_bits).groups()
-    section_data['classification'] = classification
+    page = self._click(self.scrape_url, self.params, soupify=False)
+    if self.save_pages:
+      f = open(os.path.join(self.save_pages, '%s_%06d.html' % (self.session.slug, self._pages_saved.next())), 'w')
+      f.write(page)
+      f.close()
+    if self.checkpoint and self.already_done(PageFields(page, ('SSR_CLS_DTL_WRK_CLASS_NBR',)).get('SSR_CLS_DTL_WRK_CLASS_NBR')):
+      return
+    digest = page_digest(page) if self.fingerprints else None
+    unchanged = self.page_unchanged(digest)
+    if unchanged:
+      self.skip_page(unchanged, self.subject)
+      return
+    section_data = self.timed('parse', self.parse_section, page)
+    self.create_section(section_data, digest)
+  
+  def parse_section(self, page):
+    return self.parse_fields(PageFields(page, self.section_fields))
+  
+  ##
+  # section_data from the detail page's fields; subclasses that need more of the
+  # page add its ids to section_fields.
+  def parse_fields(self, fields):
+    section_data = read_section(fields)
+    classification = section_data['classification']
     section_data['classification_name'] = self.subjects[classification]['name']
     section_data['college'] = self.subjects[classification]['college']
     section_data['institution'] = self.institution.slug
-    section_data['number'] = number
-    section_data['section'] = section_num
-    section_data['course_name'] = course_name
     section_data['session'] = self.session.id
-    
-    section_data['status'] = soup.find('div', {'id': 'win0divSSR_CLS_DTL_WRK_SSR_STATUS_LONG'}).find('img')['alt'].__str__()
-    section_data['component'] = soup.find('span', {'id': 'DERIVED_CLSRCH_SSS_PAGE_KEYDESCR'}).renderContents().split('|')[2]
-    section_data['grading'] = soup.find('span', {'id': 'GRADE_BASIS_TBL_DESCRFORMAL'}).renderContents()
-    section_data['units'] = soup.find('span', {'id': 'SSR_CLS_DTL_WRK_UNITS_RANGE'}).renderContents().replace(' units', '')
-    
-    section_data['description'] = self._optional(lambda: soup.find('span', {'id': re.compile('^(DERIVED_CLSRCH_DESCRLONG)|(DERIVED_CLSRCH_SSR_CLASSNOTE_LONG)$')}).renderContents().replace('<br />', ''))
-    
-    section_data['prof'] = soup.find('span', {'id': 'MTG_INSTR$0'}).renderContents()
-    try:
-      section_data['notes'] = soup.find('span', {'id': 'SSR_CLS_DTL_WRK_SSR_REQUISITE_LONG'}).renderContents()
-    except: pass
-    
-    location_bits = soup.find('span', {'id': 'MTG_LOC$0'}).renderContents()
-    if location_bits == "TBA":
-      location, room = "TBA", ''
-    else:
-      try:
-        location, room = re.search('([\w\s]+) (\w+)', location_bits).groups()
-      except:
-        location, room = location_bits, ''
-    
-    datetime_bits = soup.find('span', {'id': 'MTG_SCHED$0'}).renderContents()
-    if datetime_bits == "TBA":
-      pass
-    else:
-      days = []
-      day_codes = {'Mo': 'Mon', 'Tu': 'Tue', 'We': 'Wed', 'Th': 'Thu', 'Fr': 'Fri', 'Sa': 'Sat', 'Su': 'Sun'}
-      for code in day_codes.keys():
-        if datetime_bits.find(code) >= 0:
-          days.append(day_codes[code])
-      start, end = re.search('(\d{1,2}:\d{2}\w{2}) - (\d{1,2}:\d{2}\w{2})', datetime_bits).groups()
-      start_time = time.strftime('%H:%M', time.strptime(start, '%I:%M%p'))
-      end_time = time.strftime('%H:%M', time.strptime(end, '%I:%M%p'))
-      section_data['meetings'] = [{
-          'day': day, 'start': start_time, 'end': end_time,
-          'location': location, 'room': room
-        } for day in days]
-    
-    
-    section_data['mode'] = self._optional(lambda: soup.find('span', {'id': 'INSTRUCT_MODE_DESCR'}).renderContents())# in person / computer / ...
-    
-    # seat availability
-    section_data['level'] = "%s" % self._optional(lambda: soup.find('span', id=re.compile('^PSXLATITEM_XLATLONGNAME$')).renderContents())
-    section_data['seats_capacity'] = self._optional(lambda:soup.find('span', {'id': 'SSR_CLS_DTL_WRK_ENRL_CAP'}).renderContents())
-    section_data['seats_taken'] = self._optional(lambda:soup.find('span', {'id': 'SSR_CLS_DTL_WRK_ENRL_TOT'}).renderContents())
-    section_data['seats_available'] = self._optional(lambda:soup.find('span', {'id': 'SSR_CLS_DTL_WRK_AVAILABLE_SEATS'}).renderContents())
-    section_data['waitlist_capacity'] = self._optional(lambda:soup.find('span', {'id': 'SSR_CLS_DTL_WRK_WAIT_CAP'}).renderContents())
-    section_data['waitlist_taken'] = self._optional(lambda:soup.find('span', {'id': 'SSR_CLS_DTL_WRK_WAIT_TOT'}).renderContents())
-    section_data['waitlist_available'] = self._optional(lambda:int(section_data['waitlist_capacity']) - int(section_data['waitlist_taken']))
-    
-    class_num = soup.find('span', {'id': 'SSR_CLS_DTL_WRK_CLASS_NBR'}).renderContents()
-    section_data['reference_code'] = class_num
-    
     return section_data
+
+
+##
+# Everything section_data takes from a class detail page, given its PageFields.
+def read_section(fields):
+  section_data = {}
+  header_bits = fields['DERIVED_CLSRCH_DESCR200'].replace('&nbsp;', ' ')
+  classification, number, section_num, course_name = re.search('(\w+)\s+([\.\w]+) - (\d+) (.+)', header_bits).groups()
+  section_data['classification'] = classification
+  section_data['number'] = number
+  section_data['section'] = section_num
+  section_data['course_name'] = course_name
+  
+  section_data['status'] = STATUS_IMAGE.search(fields['win0divSSR_CLS_DTL_WRK_SSR_STATUS_LONG']).group(1)
+  section_data['component'] = fields['DERIVED_CLSRCH_SSS_PAGE_KEYDESCR'].split('|')[2]
+  section_data['grading'] = fields['GRADE_BASIS_TBL_DESCRFORMAL']
+  section_data['units'] = fields['SSR_CLS_DTL_WRK_UNITS_RANGE'].replace(' units', '')
+  
+  section_data['description'] = optional(lambda: fields.first('DERIVED_CLSRCH_DESCRLONG', 'DERIVED_CLSRCH_SSR_CLASSNOTE_LONG').replace('<br />', ''))
+  
+  section_data['prof'] = fields['MTG_INSTR$0']
+  if 'SSR_CLS_DTL_WRK_SSR_REQUISITE_LONG' in fields:
+    section_data['notes'] = fields['SSR_CLS_DTL_WRK_SSR_REQUISITE_LONG']
+  
+  location_bits = fields['MTG_LOC$0']
+  if location_bits == "TBA":
+    location, room = "TBA", ''
+  else:
+    try:
+      location, room = re.search('([\w\s]+) (\w+)', location_bits).groups()
+    except:
+      location, room = location_bits, ''
+  
+  datetime_bits = fields['MTG_SCHED$0']
+  if datetime_bits == "TBA":
+    section_data['meetings'] = [] # clears any meetings from an earlier schedule
+  else:
+    days = []
+    day_codes = {'Mo': 'Mon', 'Tu': 'Tue', 'We': 'Wed', 'Th': 'Thu', 'Fr': 'Fri', 'Sa': 'Sat', 'Su': 'Sun'}
+    for code in day_codes.keys():
+      if datetime_bits.find(code) >= 0:
+        days.append(day_codes[code])
+    start, end = re.search('(\d{1,2}:\d{2}\w{2}) - (\d{1,2}:\d{2}\w{2})', datetime_bits).groups()
+    start_time = time.strftime('%H:%M', time.strptime(start, '%I:%M%p'))
+    end_time = time.strftime('%H:%M', time.strptime(end, '%I:%M%p'))
+    section_data['meetings'] = [{
+        'day': day, 'start': start_time, 'end': end_time,
+        'location': location, 'room': room
+      } for day in days]
+  
+  
+  section_data['mode'] = fields.get('INSTRUCT_MODE_DESCR') # in person / computer / ...
+  
+  # seat availability
+  section_data['level'] = "%s" % fields.get('PSXLATITEM_XLATLONGNAME')
+  section_data['seats_capacity'] = fields.get('SSR_CLS_DTL_WRK_ENRL_CAP')
+  section_data['seats_taken'] = fields.get('SSR_CLS_DTL_WRK_ENRL_TOT')
+  section_data['seats_available'] = fields.get('SSR_CLS_DTL_WRK_AVAILABLE_SEATS')
+  section_data['waitlist_capacity'] = fields.get('SSR_CLS_DTL_WRK_WAIT_CAP')
+  section_data['waitlist_taken'] = fields.get('SSR_CLS_DTL_WRK_WAIT_TOT')
+  section_data['waitlist_available'] = optional(lambda: int(section_data['waitlist_capacity']) - int(section_data['waitlist_taken']))
+  
+  section_data['reference_code'] = fields['SSR_CLS_DTL_WRK_CLASS_NBR']
+  
+  return section_data
+
+##
+# The BeautifulSoup parse_section read_section() replaced, unchanged but for the
+# fields parse_fields() adds: the reference parse_bench and the tests hold it to.
+def legacy_read_section(soup):
+  section_data = {}
+  header_bits = soup.find('span', {'id': 'DERIVED_CLSRCH_DESCR200'}).renderContents().replace('&nbsp;', ' ')
+  classification, number, section_num, course_name = re.search('(\w+)\s+([\.\w]+) - (\d+) (.+)', header_bits).groups()
+  section_data['classification'] = classification
+  section_data['number'] = number
+  section_data['section'] = section_num
+  section_data['course_name'] = course_name
+  
+  section_data['status'] = soup.find('div', {'id': 'win0divSSR_CLS_DTL_WRK_SSR_STATUS_LONG'}).find('img')['alt'].__str__()
+  section_data['component'] = soup.find('span', {'id': 'DERIVED_CLSRCH_SSS_PAGE_KEYDESCR'}).renderContents().split('|')[2]
+  section_data['grading'] = soup.find('span', {'id': 'GRADE_BASIS_TBL_DESCRFORMAL'}).renderContents()
+  section_data['units'] = soup.find('span', {'id': 'SSR_CLS_DTL_WRK_UNITS_RANGE'}).renderContents().replace(' units', '')
+  
+  section_data['description'] = optional(lambda: soup.find('span', {'id': re.compile('^(DERIVED_CLSRCH_DESCRLONG)|(DERIVED_CLSRCH_SSR_CLASSNOTE_LONG)$')}).renderContents().replace('<br />', ''))
+  
+  section_data['prof'] = soup.find('span', {'id': 'MTG_INSTR$0'}).renderContents()
+  try:
+    section_data['notes'] = soup.find('span', {'id': 'SSR_CLS_DTL_WRK_SSR_REQUISITE_LONG'}).renderContents()
+  except: pass
+  
+  location_bits = soup.find('span', {'id': 'MTG_LOC$0'}).renderContents()
+  if location_bits == "TBA":
+    location, room = "TBA", ''
+  else:
+    try:
+      location, room = re.search('([\w\s]+) (\w+)', location_bits).groups()
+    except:
+      location, room = location_bits, ''
+  
+  datetime_bits = soup.find('span', {'id': 'MTG_SCHED$0'}).renderContents()
+  if datetime_bits == "TBA":
+    section_data['meetings'] = [] # clears any meetings from an earlier schedule
+  else:
+    days = []
+    day_codes = {'Mo': 'Mon', 'Tu': 'Tue', 'We': 'Wed', 'Th': 'Thu', 'Fr': 'Fri', 'Sa': 'Sat', 'Su': 'Sun'}
+    for code in day_codes.keys():
+      if datetime_bits.find(code) >= 0:
+        days.append(day_codes[code])
+    start, end = re.search('(\d{1,2}:\d{2}\w{2}) - (\d{1,2}:\d{2}\w{2})', datetime_bits).groups()
+    start_time = time.strftime('%H:%M', time.strptime(start, '%I:%M%p'))
+    end_time = time.strftime('%H:%M', time.strptime(end, '%I:%M%p'))
+    section_data['meetings'] = [{
+        'day': day, 'start': start_time, 'end': end_time,
+        'location': location, 'room': room
+      } for day in days]
+  
+  
+  section_data['mode'] = optional(lambda: soup.find('span', {'id': 'INSTRUCT_MODE_DESCR'}).renderContents())# in person / computer / ...
+  
+  # seat availability
+  section_data['level'] = "%s" % optional(lambda: soup.find('span', id=re.compile('^PSXLATITEM_XLATLONGNAME$')).renderContents())
+  section_data['seats_capacity'] = optional(lambda:soup.find('span', {'id': 'SSR_CLS_DTL_WRK_ENRL_CAP'}).renderContents())
+  section_data['seats_taken'] = optional(lambda:soup.find('span', {'id': 'SSR_CLS_DTL_WRK_ENRL_TOT'}).renderContents())
+  section_data['seats_available'] = optional(lambda:soup.find('span', {'id': 'SSR_CLS_DTL_WRK_AVAILABLE_SEATS'}).renderContents())
+  section_data['waitlist_capacity'] = optional(lambda:soup.find('span', {'id': 'SSR_CLS_DTL_WRK_WAIT_CAP'}).renderContents())
+  section_data['waitlist_taken'] = optional(lambda:soup.find('span', {'id': 'SSR_CLS_DTL_WRK_WAIT_TOT'}).renderContents())
+  section_data['waitlist_available'] = optional(lambda:int(section_data['waitlist_capacity']) - int(section_data['waitlist_taken']))
+  
+  class_num = soup.find('span', {'id': 'SSR_CLS_DTL_WRK_CLASS_NBR'}).renderContents()
+  section_data['reference_code'] = class_num
+  
+  return section_data
@@ -0,0 +1,56 @@
+from django.db import connection
+from scrapers.general import Scraper
+from api.recording import read_recording, recording_path
+import time
+
+class ReplayScraper(Scraper):
+  """
+  Feeds a recording made with Scraper(record=...) back through create_section,
+  so the ingest path can be load-tested (or a session rebuilt) without any
+  network access. Every payload is re-pointed at this scraper's network and
+  session, which need not be the ones it was recorded from.
+
+  All the usual Scraper options (batch_size, coalesce, commit_every, ...) apply.
+  After run() + finish(), timing() reports sections per second and queries per
+  section for the replay.
+  """
+  def __init__(self, *args, **kwargs):
+    kwargs['govern'] = False # nothing goes out to pace
+    super(ReplayScraper, self).__init__(*args, **kwargs)
+    self.path = kwargs.get('path') or recording_path(self.network.slug, self.session.slug)
+    self.queries = 0
+    self.elapsed = 0.0
+
+  def run(self):
+    self._start = time.time()
+    connection.use_debug_cursor = True
+    del connection.queries[:]
+    try:
+      for section_data in read_recording(self.path):
+        self.create_section(section_data)
+        self._count_queries()
+    finally:
+      self._count_queries()
+
+  def finish(self):
+    try:
+      super(ReplayScraper, self).finish()
+    finally:
+      self._count_queries()
+      connection.use_debug_cursor = None
+      self.elapsed = time.time() - self._start
+
+  def _count_queries(self):
+    # tally and drop as we go, a long replay would otherwise keep every query in memory
+    self.queries += len(connection.queries)
+    del connection.queries[:]
+
+  def timing(self):
+    processed = max(self.processed, 1)
+    return {
+      'sections': self.processed,
+      'seconds': round(self.elapsed, 3),
+      'sections_per_second': round(self.processed / max(self.elapsed, 1e-6), 1),
+      'queries': self.queries,
+      'queries_per_section': round(self.queries / float(processed), 2),
+    }
@@ -0,0 +1,282 @@
+import cookielib, httplib, select, socket, StringIO, threading, time, urllib, urllib2, urlparse, zlib
+
+from scrapers.governor import THROTTLE_CODES, response_class
+
+class Transport(object):
+  """
+  The urllib2 opener scrapers fetch pages through.
+
+  Cookies are handled by the usual HTTPCookieProcessor (self.cj is the jar). On
+  top of it, keep_alive holds one pool of persistent connections per host instead
+  of opening (and TLS-handshaking) a new one for every request, and compress asks
+  for gzip / deflate and decodes it transparently. @timeout (seconds) applies to
+  every request.
+
+  self.stats counts requests, connections opened and reused, bytes read off the
+  wire and bytes after decompression.
+
+  With a @cache (scrapers.httpcache.HTTPCache) pages go through it instead, and
+  self.stats also counts cache hits and misses and the bytes served from disk.
+  
+  With a @governor (scrapers.governor.HostGovernor) every request that goes out
+  waits for its host's allowance, and reports back how it went; without one, a
+  @budget (scrapers.concurrency.RequestBudget) paces them instead. Either way
+  only requests that reach the network are paced, not pages the cache serves.
+
+  With @metrics (api.metrics.RunMetrics) the time open() takes, cache and
+  governor included, is recorded as the fetch phase, and each page counted.
+  """
+  def __init__(self, keep_alive=True, compress=True, timeout=None, cookiejar=None, cache=None, governor=None, budget=None, metrics=None):
+    self.keep_alive = keep_alive
+    self.compress = compress
+    self.timeout = timeout
+    self.cache = cache
+    self.governor = governor
+    self.budget = budget
+    self.metrics = metrics
+    self.hosts = set() # those fetched from, for the governor's report
+    self.cj = cookiejar if cookiejar is not None else cookielib.CookieJar()
+    self.stats = {'requests': 0, 'connections': 0, 'reused': 0, 'bytes': 0, 'bytes_decoded': 0}
+    if cache is not None:
+      self.stats.update({'cache_hits': 0, 'cache_misses': 0, 'cache_bytes_saved': 0})
+    self._idle = {}
+    self._lock = threading.Lock()
+    handlers = [urllib2.HTTPCookieProcessor(self.cj)]
+    if keep_alive:
+      handlers.append(KeepAliveHandler(self))
+    handlers.append(WireHandler(self))
+    self.opener = urllib2.build_opener(*handlers)
+
+  ##
+  # Same settings, new cookie jar and connections: a separate browser session.
+  def fresh(self):
+    return Transport(self.keep_alive, self.compress, self.timeout, cache=self.cache, governor=self.governor, budget=self.budget, metrics=self.metrics)
+
+  def open(self, url, data=None):
+    if self.metrics is None:
+      return self._open(url, data)
+    start = time.time()
+    try:
+      return self._open(url, data)
+    finally:
+      self.metrics.record('fetch', time.time() - start)
+      self.metrics.count('pages')
+
+  def _open(self, url, data=None):
+    if self.cache is not None:
+      return self.cache.open(self, url, data)
+    return self.fetch(url, data)
+
+  ##
+  # Straight to the network, past any cache; @request is a URL or urllib2.Request.
+  def fetch(self, request, data=None):
+    if self.governor is None:
+      if self.budget is not None:
+        self.budget.wait()
+      return self._fetch(request, data)
+    host = urlparse.urlsplit(request if isinstance(request, basestring) else request.get_full_url())[1]
+    self.hosts.add(host)
+    token = self.governor.acquire(host)
+    start = time.time()
+    error = False
+    kind = ''
+    try:
+      response = self._fetch(request, data)
+      kind = response_class(response.code, getattr(response, 'size', 0))
+      return response
+    except urllib2.HTTPError, e:
+      error = e.code in THROTTLE_CODES
+      kind = response_class(e.code)
+      raise
+    except (urllib2.URLError, socket.error, httplib.HTTPException):
+      error = True
+      raise
+    finally:
+      self.governor.release(host, token, time.time() - start, error, kind)
+  
+  def _fetch(self, request, data=None):
+    if self.timeout is not None:
+      return self.opener.open(request, data, self.timeout)
+    return self.opener.open(request, data)
+
+  def close(self):
+    self._lock.acquire()
+    try:
+      idle, self._idle = self._idle, {}
+    finally:
+      self._lock.release()
+    for connections in idle.values():
+      for connection in connections:
+        connection.close()
+
+  def merge(self, stats):
+    self._lock.acquire()
+    try:
+      for key, value in stats.items():
+        self.stats[key] = self.stats.get(key, 0) + value
+    finally:
+      self._lock.release()
+
+  def _count(self, key):
+    self.merge({key: 1})
+
+  def _checkout(self, key):
+    self._lock.acquire()
+    try:
+      connections = self._idle.get(key)
+      return connections.pop() if connections else None
+    finally:
+      self._lock.release()
+
+  def _checkin(self, key, connection):
+    self._lock.acquire()
+    try:
+      self._idle.setdefault(key, []).append(connection)
+    finally:
+      self._lock.release()
+
+# methods safe to send again when a pooled connection turns out to be dead
+IDEMPOTENT = set(['GET', 'HEAD', 'OPTIONS'])
+# BadStatusLine.line when the connection closed before a byte of response came
+# back, as the httplib of each Python 2.7 release words it
+CLOSED = set(['', repr(''), 'No status line received - the server has closed the connection'])
+
+class KeepAliveHandler(urllib2.HTTPHandler, urllib2.HTTPSHandler):
+  """
+  urllib2's own handlers send "Connection: close" and open a new connection per
+  request. This one reads each response in full and puts the connection back in
+  the transport's pool for the next request to the same host.
+  """
+  def __init__(self, transport):
+    urllib2.HTTPHandler.__init__(self)
+    self.transport = transport
+
+  def http_open(self, req):
+    return self._open(httplib.HTTPConnection, req)
+
+  def https_open(self, req):
+    return self._open(httplib.HTTPSConnection, req)
+
+  def _open(self, http_class, req):
+    host = req.get_host()
+    if not host:
+      raise urllib2.URLError('no host given')
+    key = (http_class, host)
+    headers = dict(req.unredirected_hdrs)
+    headers.update(dict((k, v) for k, v in req.headers.items() if k not in headers))
+    headers['Connection'] = 'keep-alive'
+    headers = dict((name.title(), value) for name, value in headers.items())
+
+    connection = self.transport._checkout(key)
+    if connection is not None and dropped(connection):
+      connection.close()
+      connection = None
+    if connection is not None:
+      try:
+        response = self._request(connection, req, headers, req.get_method() in IDEMPOTENT)
+        self.transport._count('reused')
+      except Stale:
+        # the server had dropped the idle connection; start a new one
+        connection.close()
+        connection = None
+      except (socket.error, httplib.HTTPException), e:
+        connection.close()
+        raise urllib2.URLError(e)
+    if connection is None:
+      connection = http_class(host, timeout=req.timeout)
+      self.transport._count('connections')
+      try:
+        response = self._request(connection, req, headers)
+      except (socket.error, httplib.HTTPException), e:
+        connection.close()
+        raise urllib2.URLError(e)
+
+    body = response.read()
+    if response.will_close:
+      connection.close()
+    else:
+      self.transport._checkin(key, connection)
+
+    result = urllib.addinfourl(StringIO.StringIO(body), response.msg, req.get_full_url())
+    result.code = response.status
+    result.msg = response.reason
+    return result
+
+  ##
+  # With @resend, a failure that shows the server dropped the connection before
+  # it saw the request (sending fails, or it closes without a byte of response)
+  # raises Stale so the caller can send it again. Only for idempotent methods:
+  # a POST (a PeopleSoft postback) the server may have acted on is never replayed,
+  # and a timeout is the server being slow, not the connection being gone.
+  def _request(self, connection, req, headers, resend=False):
+    try:
+      connection.request(req.get_method(), req.get_selector(), req.data, headers)
+    except socket.timeout:
+      raise
+    except (socket.error, httplib.HTTPException), e:
+      if resend:
+        raise Stale(e)
+      raise
+    try:
+      return connection.getresponse()
+    except httplib.BadStatusLine, e:
+      if resend and e.line in CLOSED:
+        raise Stale(e)
+      raise
+
+##
+# True if the server has closed idle @connection: a socket with nothing asked of
+# it only turns readable at EOF. Catches most dead connections before a request
+# is sent down one, which matters for the POSTs that can't be sent twice.
+def dropped(connection):
+  if connection.sock is None:
+    return True
+  try:
+    return bool(select.select([connection.sock], [], [], 0)[0])
+  except (select.error, socket.error, ValueError):
+    return True
+
+class Stale(Exception):
+  """A pooled connection the server had closed; the request never reached it."""
+
+class WireHandler(urllib2.BaseHandler):
+  """
+  Counts every response's size as it came off the wire and, when the transport
+  compresses, asks for gzip / deflate and hands back the decoded body.
+  """
+  # runs before the cookie (500) and error (1000) processors look at the response
+  handler_order = 400
+
+  def __init__(self, transport):
+    self.transport = transport
+
+  def http_request(self, req):
+    if self.transport.compress:
+      req.add_unredirected_header('Accept-Encoding', 'gzip, deflate')
+    return req
+
+  def http_response(self, req, response):
+    raw = response.read()
+    encoding = response.info().get('Content-Encoding', '').lower()
+    if encoding == 'gzip':
+      body = zlib.decompress(raw, 16 + zlib.MAX_WBITS)
+    elif encoding == 'deflate':
+      try:
+        body = zlib.decompress(raw)
+      except zlib.error:
+        body = zlib.decompress(raw, -zlib.MAX_WBITS)
+    else:
+      body = raw
+    stats = {'requests': 1, 'bytes': len(raw), 'bytes_decoded': len(body)}
+    if not self.transport.keep_alive:
+      stats['connections'] = 1
+    self.transport.merge(stats)
+
+    decoded = urllib.addinfourl(StringIO.StringIO(body), response.info(), response.geturl())
+    decoded.code = response.code
+    decoded.msg = response.msg
+    decoded.size = len(body)
+    return decoded
+
+  https_request = http_request
+  https_response = http_response
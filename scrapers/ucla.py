@@ -4,43 +4,109 @@ from BeautifulSoup import BeautifulSoup
 from django.template.defaultfilters import slugify
 
 from scrapers.general import Scraper
+from scrapers.concurrency import ordered_map, thread_pool
+from scrapers.pagefields import page_digest
 
 class UCLAScraper(Scraper):
+  plannable = True
+  
   def __init__(self, *args, **kwargs):
     super(UCLAScraper, self).__init__(*args, **kwargs)
     
     self.term = self.session.system_code
     self.urls = []
+    
+    # workers=N fetches course lists, section lists and detail pages on N threads;
+    # the transport paces them either way (max_rps)
+    self.workers = kwargs.get('workers') or 1
   
   def run(self):
-    subjects = self._get_subjects()
+    if self.workers > 1:
+      return self._run_concurrently()
+    subjects = self.planned(self._get_subjects(), self._classification)
     print "%s subjects" % len(subjects)
     for subject in subjects:
       courses = self._get_courses(self.term, subject)
       print "  %s courses in %s" % (len(courses), subject['name'])
+      failed = 0
       for course in courses:
         sections = self._get_sections(self.term, subject, course)
         print "    %s sections in %s" % (len(sections), course['name'])
         for section in sections:
+          if self.already_done(section['reference_code']):
+            continue
           try:
-            data = self._get_section_detail(self.term, section['reference_code'], section)
+            data, digest = self._get_section_detail(self.term, section['reference_code'], section)
           except Exception, e:
             self._log_error(e)
+            failed += 1
+            continue
+          if data is None:
+            self.skip_page(section['reference_code'], section['classification'])
+            continue
           print data
-          self.create_section(data)
+          self.create_section(data, digest)
+      # a resumed run walks a subject with failed pages again
+      if not failed:
+        self.subject_done(self._classification(subject))
   
-  @classmethod
-  def _get_subjects(cls):
+  ##
+  # Same walk as run(), with the page fetches spread over a thread pool. Results
+  # are consumed in order on this thread, so create_section sees sections in the
+  # same order as a serial run. All of a subject's detail pages are fetched
+  # together, so small courses don't leave workers idle.
+  def _run_concurrently(self):
+    pool = thread_pool(self.workers)
+    try:
+      subjects = self.planned(self._get_subjects(), self._classification)
+      print "%s subjects" % len(subjects)
+      get_courses = lambda subject: self._get_courses(self.term, subject)
+      for subject, courses, error in ordered_map(pool, get_courses, subjects):
+        if error:
+          raise error
+        print "  %s courses in %s" % (len(courses), subject['name'])
+        get_sections = lambda course, subject=subject: self._get_sections(self.term, subject, course)
+        sections = []
+        for course, listed, error in ordered_map(pool, get_sections, courses):
+          if error:
+            raise error
+          print "    %s sections in %s" % (len(listed), course['name'])
+          sections.extend(section for section in listed if not self.already_done(section['reference_code']))
+        get_detail = lambda section: self._get_section_detail(self.term, section['reference_code'], section)
+        failed = 0
+        for section, result, error in ordered_map(pool, get_detail, sections):
+          if error:
+            self._log_error(error)
+            failed += 1
+            continue
+          data, digest = result
+          if data is None:
+            self.skip_page(section['reference_code'], section['classification'])
+            continue
+          print data
+          self.create_section(data, digest)
+        if not failed:
+          self.subject_done(self._classification(subject))
+    finally:
+      pool.terminate()
+      pool.join()
+  
+  def work_units(self):
+    return [{'subjects': [self._classification(subject)]} for subject in self._get_subjects()]
+  
+  def _classification(self, subject):
+    return slugify(subject['code']).upper()
+  
+  def _get_subjects(self):
     url = 'http://www.registrar.ucla.edu/schedule/schedulehome.aspx'
-    soup = BeautifulSoup(urllib2.urlopen(url))
+    soup = self.timed('parse', BeautifulSoup, self.transport.open(url))
     options = soup.find('select', id='ctl00_BodyContentPlaceHolder_SOCmain_lstSubjectArea').findAll('option')
     subjects = [{'code': option['value'], 'name': option.renderContents().strip() } for option in options]
     return subjects
   
-  @classmethod
-  def _get_courses(cls, term, subject):
+  def _get_courses(self, term, subject):
     url = 'http://www.registrar.ucla.edu/schedule/crsredir.aspx?termsel=%s&subareasel=%s' % (term, urllib.quote_plus(subject['code']))
-    soup = BeautifulSoup(urllib2.urlopen(url))
+    soup = self.timed('parse', BeautifulSoup, self.transport.open(url))
     select = soup.find('select', id='ctl00_BodyContentPlaceHolder_crsredir1_lstCourseNormal')
     if not select:
       return []
@@ -48,26 +114,25 @@ class UCLAScraper(Scraper):
     courses = [{'code': option['value'], 'name': option.renderContents().split('-')[1].strip() } for option in options]
     return courses
   
-  @classmethod
-  def _get_sections(cls, term, subject, course):
+  def _get_sections(self, term, subject, course):
     url = 'http://www.registrar.ucla.edu/schedule/detselect.aspx?termsel=%s&subareasel=%s&idxcrs=%s' % (term, urllib.quote_plus(subject['code']), urllib.quote_plus(course['code']))
-    soup = BeautifulSoup(urllib2.urlopen(url))
+    soup = self.timed('parse', BeautifulSoup, self.transport.open(url))
     tables = soup.findAll('tr', {'class':'dgdClassDataHeader'})
     sections = [s for s in itertools.chain(*[table.parent.findAll('tr')[1:] for table in tables])]
     data = []
     for section in sections:
       ref_code_link = section.find('td', {'class': 'dgdClassDataColumnIDNumber'}).find('a')
-      days = cls._get_cell_value(section, 'dgdClassDataDays')
+      days = self._get_cell_value(section, 'dgdClassDataDays')
       if days == "TBA":
         days = ["TBA"]
       if days == "UNSCHED":
         days = []
       if days == "VAR":
         days = ['']
-      start = cls._get_cell_value(section, 'dgdClassDataTimeStart')
-      end = cls._get_cell_value(section, 'dgdClassDataTimeEnd')
-      location = cls._get_cell_value(section, 'dgdClassDataBuilding')
-      room = cls._get_cell_value(section, 'dgdClassDataRoom')
+      start = self._get_cell_value(section, 'dgdClassDataTimeStart')
+      end = self._get_cell_value(section, 'dgdClassDataTimeEnd')
+      location = self._get_cell_value(section, 'dgdClassDataBuilding')
+      room = self._get_cell_value(section, 'dgdClassDataRoom')
       meetings = []
       for day in days:
         meeting = {'day': day, 'location': location, 'room': room}
@@ -81,16 +146,16 @@ class UCLAScraper(Scraper):
         # then it's a complete section record; 
         ref_code_link = ref_code_link['href']
         section_data = {
-          'classification': slugify(subject['code']).upper(),
+          'classification': self._classification(subject),
           'classification_name': subject['name'],
           'reference_code': re.search('srs=(\d+)&term', ref_code_link).groups()[0],
-          'component': cls._get_cell_value(section, 'dgdClassDataActType'),
-          'section': cls._get_cell_value(section, 'dgdClassDataSectionNumber'),
-          'seats_taken': cls._get_cell_value(section, 'dgdClassDataEnrollTotal', int),
-          'seats_capacity': cls._get_cell_value(section, 'dgdClassDataEnrollCap', int),
-          'waitlist_taken': cls._get_cell_value(section, 'dgdClassDataWaitListTotal', int),
-          'waitlist_capacity': cls._get_cell_value(section, 'dgdClassDataWaitListCap', int),
-          'status': cls._get_cell_value(section, 'dgdClassDataStatus'),
+          'component': self._get_cell_value(section, 'dgdClassDataActType'),
+          'section': self._get_cell_value(section, 'dgdClassDataSectionNumber'),
+          'seats_taken': self._get_cell_value(section, 'dgdClassDataEnrollTotal', int),
+          'seats_capacity': self._get_cell_value(section, 'dgdClassDataEnrollCap', int),
+          'waitlist_taken': self._get_cell_value(section, 'dgdClassDataWaitListTotal', int),
+          'waitlist_capacity': self._get_cell_value(section, 'dgdClassDataWaitListCap', int),
+          'status': self._get_cell_value(section, 'dgdClassDataStatus'),
           'course_name': course['name'],
           'meetings': meetings
         }
@@ -100,10 +165,16 @@ class UCLAScraper(Scraper):
         data[-1]['meetings'].extend(meetings)
     return data
   
-  @classmethod
-  def _get_section_detail(cls, term, code, section_data):
+  ##
+  # (section_data completed from the detail page, page digest); section_data is None
+  # when neither the page nor the listing's values changed since the last run.
+  def _get_section_detail(self, term, code, section_data):
     url = 'http://www.registrar.ucla.edu/schedule/subdet.aspx?srs=%s&term=%s' % (code, term)
-    soup = BeautifulSoup(urllib2.urlopen(url))
+    page = self.transport.open(url).read()
+    digest = page_digest(page, section_data) if self.fingerprints else None
+    if self.page_unchanged(digest, code):
+      return None, digest
+    soup = self.timed('parse', BeautifulSoup, page)
     
     try:
       prof = soup.find('span', id='ctl00_BodyContentPlaceHolder_subdet_lblInstructor').renderContents()
@@ -124,7 +195,7 @@ class UCLAScraper(Scraper):
       'number': re.search('(\w+)\.', soup.find('span', id='ctl00_BodyContentPlaceHolder_subdet_lblCourseHeader').renderContents()).groups()[0],
       'notes': soup.find('span', id='ctl00_BodyContentPlaceHolder_subdet_lblNotes').renderContents().strip(),
     })
-    return section_data
+    return section_data, digest
   
   @classmethod
   def _get_cell_value(cls, section, klass, target_klass=None):